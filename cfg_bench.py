@@ -0,0 +1,393 @@
+"""
+Воспроизводимые замеры производительности по всем файлам правил.
+
+Для каждого файла каталога правил измеряются:
+
+- время загрузки: разбор файла без кэша и загрузка из кэша скомпилированных
+  грамматик (cfg_cache), пиковая память при разборе (tracemalloc);
+- пропускная способность генерации: generate, generate_many в одном процессе
+  и generate_batch (если установлен NumPy), пиковая память генерации;
+- задержка проверки строк в зависимости от длины: строки ровно из ``L``
+  токенов (или ближайшей длины, которая есть в языке) выбираются
+  равновероятно (generate с length) с фиксированным начальным значением,
+  поэтому при каждом запуске проверяются одни и те же строки.
+
+Каждый замер делает ``warmup`` прогревочных прогонов и ``repeats`` измеряемых
+(сборщик мусора на время замера отключается, как в timeit); в отчет попадают
+минимум, медиана, среднее и стандартное отклонение. Результат - JSON, который
+можно сравнить с предыдущим (``--baseline``): замеры, минимум которых вырос
+больше чем на ``threshold``, считаются регрессиями (минимум меньше всего
+зависит от фоновой нагрузки машины).
+
+Файлы без секции Pn (грамматики уровня символов) замеряются классом из
+cfg_without_Pt: только генерация и проверка строк.
+
+Использование
+----------
+    python cfg_bench.py --output bench.json
+    python cfg_bench.py --quick --baseline bench.json
+"""
+
+import argparse
+import gc
+import glob
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from cfg_full import CFG
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - зависит от окружения
+    np = None
+
+DEFAULT_LENGTHS = (1, 2, 4, 8, 16, 32, 64)
+
+
+def _stats(times):
+    """
+    Возвращает статистику серии замеров (в секундах).
+    """
+    return {
+        'min': min(times),
+        'median': statistics.median(times),
+        'mean': statistics.fmean(times),
+        'stdev': statistics.stdev(times) if len(times) > 1 else 0.0,
+        'repeats': len(times),
+    }
+
+
+def measure(func, repeats=5, warmup=1):
+    """
+    Замеряет время вызова функции.
+
+    Параметры
+    ----------
+        func (callable): Замеряемая функция без аргументов.
+        repeats (int): Количество измеряемых прогонов (по умолчанию 5).
+        warmup (int): Количество прогревочных прогонов (по умолчанию 1).
+
+    Возвращает
+    ----------
+        dict: Статистика времени одного вызова: min, median, mean, stdev, repeats.
+    """
+    for _ in range(warmup):
+        func()
+    times = []
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeats):
+            start_time = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - start_time)
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return _stats(times)
+
+
+def peak_memory(func):
+    """
+    Возвращает пиковый объем памяти (в байтах), выделенный при вызове функции.
+    """
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def _seeded(seed, func):
+    """
+    Оборачивает функцию так, чтобы каждый вызов начинался с одного состояния random.
+    """
+    def run():
+        random.seed(seed)
+        return func()
+    return run
+
+
+def _is_full_grammar(path):
+    """
+    Проверяет, описан ли файл в формате cfg_full (с секцией Pn).
+    """
+    with open(path, encoding='utf-8') as f:
+        return any(line.strip().startswith('Pn') for line in f)
+
+
+def bench_full(path, seed, repeats, warmup, n, lengths, per_length):
+    """
+    Замеряет грамматику в формате cfg_full.
+
+    Параметры
+    ----------
+        path (str): Путь к файлу правил.
+        seed (int): Начальное значение генераторов.
+        repeats (int): Количество измеряемых прогонов.
+        warmup (int): Количество прогревочных прогонов.
+        n (int): Количество строк в замере генерации.
+        lengths (tuple): Длины (в токенах) проверяемых строк.
+        per_length (int): Количество строк каждой длины.
+
+    Возвращает
+    ----------
+        dict: Результаты замеров.
+    """
+    result = {'implementation': 'cfg_full'}
+    with tempfile.TemporaryDirectory() as cache_dir:
+        result['load'] = {
+            'parse': measure(lambda: CFG(path, cache=False), repeats, warmup),
+            'cached': measure(lambda: CFG(path, cache_dir=cache_dir), repeats, max(warmup, 1)),
+            'parse_peak_memory': peak_memory(lambda: CFG(path, cache=False)),
+        }
+    cfg = CFG(path, cache=False)
+    grammar = cfg.grammar
+    result['grammar'] = {
+        'symbols': len(grammar.symbols),
+        'productions': len(grammar.productions),
+    }
+
+    generation = {}
+    runs = {
+        'generate': lambda: [cfg.generate() for _ in range(n)],
+        'generate_many': lambda: list(cfg.generate_many(n, seed=seed)),
+    }
+    if np is not None:
+        runs['generate_batch'] = lambda: cfg.generate_batch(n, seed=seed)
+    for name, run in runs.items():
+        timing = measure(_seeded(seed, run), repeats, warmup)
+        generation[name] = {'strings': n, 'time': timing, 'strings_per_second': n / timing['median']}
+    generation['peak_memory'] = peak_memory(_seeded(seed, runs['generate']))
+    result['generation'] = generation
+
+    validation = []
+    rng = random.Random(seed)
+    for length in _sentence_lengths(cfg, lengths):
+        strings = []
+        for _ in range(per_length):
+            random.seed(rng.getrandbits(64))
+            strings.append(cfg.generate(length=length)[0])
+        timing = measure(lambda: [cfg.is_valid_string(string) for string in strings], repeats, warmup)
+        validation.append({
+            'tokens': length,
+            'strings': len(strings),
+            'seconds_per_string': {key: value / len(strings) if key != 'repeats' else value
+                                   for key, value in timing.items()},
+            'items_per_string': _validation_items(cfg, strings),
+        })
+    result['validation'] = validation
+    return result
+
+
+def _sentence_lengths(cfg, lengths):
+    """
+    Заменяет каждую длину ближайшей, для которой в языке есть строки
+    (у math_cfg, например, все предложения нечетной длины).
+    """
+    available = []
+    for length in range(1, max(lengths, default=0) + 1):
+        try:
+            cfg.generate(length=length)
+        except ValueError:
+            continue
+        available.append(length)
+    if not available:
+        return []
+    return sorted({min(available, key=lambda a: (abs(a - length), a)) for length in lengths})
+
+
+def _validation_items(cfg, strings):
+    """
+    Возвращает среднее количество ситуаций Эрли на одну проверку.
+    """
+    total = 0
+    for string in strings:
+        cfg.is_valid_string(string)
+        total += cfg.validation_steps
+    return total / len(strings)
+
+
+def bench_without_pt(path, seed, repeats, warmup, n, per_length):
+    """
+    Замеряет грамматику уровня символов (cfg_without_Pt).
+
+    Строки для проверки берутся из сгенерированных с фиксированным начальным
+    значением и группируются по длине в токенах.
+    """
+    from cfg_without_Pt import CFG as CharCFG
+
+    result = {'implementation': 'cfg_without_Pt'}
+    result['load'] = {'parse': measure(lambda: CharCFG(path), repeats, warmup)}
+    cfg = CharCFG(path)
+    timing = measure(_seeded(seed, lambda: [cfg.generate() for _ in range(n)]), repeats, warmup)
+    result['generation'] = {
+        'generate': {'strings': n, 'time': timing, 'strings_per_second': n / timing['median']},
+        'peak_memory': peak_memory(_seeded(seed, lambda: [cfg.generate() for _ in range(n)])),
+    }
+
+    random.seed(seed)
+    by_length = {}
+    for _ in range(n):
+        string = cfg.generate()[0]
+        bucket = by_length.setdefault(len(cfg.lexer.split(string)), [])
+        if len(bucket) < per_length and string not in bucket:
+            bucket.append(string)
+    validation = []
+    for length, strings in sorted(by_length.items()):
+        timing = measure(lambda: [cfg.is_valid_string(string) for string in strings], repeats, warmup)
+        validation.append({
+            'tokens': length,
+            'strings': len(strings),
+            'seconds_per_string': {key: value / len(strings) if key != 'repeats' else value
+                                   for key, value in timing.items()},
+        })
+    result['validation'] = validation
+    return result
+
+
+def run(rules='rules', seed=0, repeats=5, warmup=1, n=1000, lengths=DEFAULT_LENGTHS, per_length=5, names=None):
+    """
+    Замеряет все файлы правил каталога.
+
+    Параметры
+    ----------
+        rules (str): Каталог с файлами правил (по умолчанию 'rules').
+        seed (int): Начальное значение генераторов (по умолчанию 0).
+        repeats (int): Количество измеряемых прогонов (по умолчанию 5).
+        warmup (int): Количество прогревочных прогонов (по умолчанию 1).
+        n (int): Количество строк в замере генерации (по умолчанию 1000).
+        lengths (tuple): Длины проверяемых строк в токенах (по умолчанию 1, 2, 4, ..., 64).
+        per_length (int): Количество строк каждой длины (по умолчанию 5).
+        names (list): Имена файлов (без расширения) для замера; None - все (по умолчанию None).
+
+    Возвращает
+    ----------
+        dict: Отчет ``{'meta': {...}, 'grammars': {имя: результаты}}``.
+    """
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'numpy': np.__version__ if np is not None else None,
+            'seed': seed,
+            'repeats': repeats,
+            'warmup': warmup,
+            'n': n,
+            'lengths': list(lengths),
+            'per_length': per_length,
+        },
+        'grammars': {},
+    }
+    for path in sorted(glob.glob(os.path.join(rules, '*.txt'))):
+        name = os.path.splitext(os.path.basename(path))[0]
+        if names and name not in names:
+            continue
+        print(f'benchmarking {name}', file=sys.stderr)
+        try:
+            if _is_full_grammar(path):
+                result = bench_full(path, seed, repeats, warmup, n, lengths, per_length)
+            else:
+                result = bench_without_pt(path, seed, repeats, warmup, n, per_length)
+        except (OSError, ValueError) as exc:
+            result = {'error': str(exc)}
+        report['grammars'][name] = result
+    return report
+
+
+def _timings(node, path=()):
+    """
+    Перечисляет пары (путь, минимальное время) всех замеров отчета.
+    """
+    if isinstance(node, dict):
+        if 'min' in node and 'repeats' in node:
+            yield path, node['min']
+            return
+        for key, value in node.items():
+            yield from _timings(value, path + (key,))
+    elif isinstance(node, list):
+        for item in node:
+            if isinstance(item, dict) and 'tokens' in item:
+                yield from _timings(item, path + (f"tokens={item['tokens']}",))
+
+
+def compare(baseline, current, threshold=0.2):
+    """
+    Сравнивает минимальное время замеров двух отчетов.
+
+    Параметры
+    ----------
+        baseline (dict): Предыдущий отчет.
+        current (dict): Новый отчет.
+        threshold (float): Допустимый относительный рост времени (по умолчанию 0.2).
+
+    Возвращает
+    ----------
+        list: Регрессии ``(путь, старое время, новое время, отношение)``,
+            отсортированные по убыванию отношения.
+    """
+    old = dict(_timings(baseline.get('grammars', {})))
+    regressions = []
+    for path, after in _timings(current.get('grammars', {})):
+        before = old.get(path)
+        if before and after > before * (1 + threshold):
+            regressions.append(('/'.join(path), before, after, after / before))
+    regressions.sort(key=lambda item: item[3], reverse=True)
+    return regressions
+
+
+def main(argv=None):
+    """
+    Точка входа командной строки.
+    """
+    parser = argparse.ArgumentParser(description='Benchmark every rules file.')
+    parser.add_argument('--rules', default='rules', help='directory with rules files')
+    parser.add_argument('--grammar', action='append', help='benchmark only this grammar (repeatable)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('-n', type=int, default=1000, help='strings per generation run')
+    parser.add_argument('--lengths', default=','.join(map(str, DEFAULT_LENGTHS)),
+                        help='comma-separated sentence lengths for validation')
+    parser.add_argument('--per-length', type=int, default=5, help='strings per validation length')
+    parser.add_argument('--quick', action='store_true', help='fewer repeats and strings')
+    parser.add_argument('--output', help='write JSON report to this file (default: stdout)')
+    parser.add_argument('--baseline', help='compare against a previous JSON report')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed relative slowdown')
+    args = parser.parse_args(argv)
+
+    if args.quick:
+        args.repeats, args.warmup, args.n, args.per_length = 3, 1, 200, 2
+    lengths = tuple(int(length) for length in args.lengths.split(',') if length)
+    report = run(args.rules, seed=args.seed, repeats=args.repeats, warmup=args.warmup, n=args.n,
+                 lengths=lengths, per_length=args.per_length, names=args.grammar)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, report, args.threshold)
+        for path, before, after, ratio in regressions:
+            print(f'REGRESSION {path}: {before:.6f}s -> {after:.6f}s (x{ratio:.2f})', file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+"""
+Кэш скомпилированных грамматик на диске.
+
+Файл кэша содержит заголовок (формат, версия Python, хэш содержимого файла
+правил) и данные в формате marshal: таблицу символов, продукции, готовые
+анализы грамматики и настройки из файла правил. Если хэш совпадает, CFG
+загружается из кэша без разбора файла правил и без пересчета анализов.
+
+По умолчанию кэш хранится рядом с файлом правил в каталоге ``__cfgcache__``.
+Формат marshal зависит от версии Python, поэтому она входит в заголовок;
+кэш с другой версией просто перестраивается. Как и ``__pycache__``, кэш не
+предназначен для файлов из недоверенных источников.
+"""
+
+import hashlib
+import marshal
+import mmap
+import os
+import sys
+import tempfile
+
+from cfg_grammar import Production, restore_grammar
+
+MAGIC = b'CFGC'
+CACHE_VERSION = 2
+CACHE_DIR_NAME = '__cfgcache__'
+
+
+def rules_digest(data):
+    """
+    Вычисляет хэш содержимого файла правил.
+
+    Параметры
+    ----------
+        data (bytes): Содержимое файла.
+
+    Возвращает
+    ----------
+        str: Шестнадцатеричный хэш (BLAKE2b, 128 бит).
+    """
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def cache_path(rules_file, cache_dir=None):
+    """
+    Возвращает путь к файлу кэша для файла правил.
+
+    Параметры
+    ----------
+        rules_file (str): Путь к файлу правил.
+        cache_dir (str): Общий каталог кэша; None - ``__cfgcache__`` рядом
+            с файлом правил (по умолчанию None).
+    """
+    rules_file = os.path.abspath(rules_file)
+    name = os.path.basename(rules_file)
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(rules_file), CACHE_DIR_NAME)
+    else:
+        # В общем каталоге одинаковые имена из разных каталогов не должны совпадать
+        name += '-' + hashlib.blake2b(rules_file.encode('utf-8'), digest_size=4).hexdigest()
+    return os.path.join(cache_dir, name + '.cfgc')
+
+
+def _header(digest):
+    """
+    Возвращает строку заголовка файла кэша.
+    """
+    version = '%d.%d' % sys.version_info[:2]
+    return b'%s %d %s %s\n' % (MAGIC, CACHE_VERSION, version.encode('ascii'), digest.encode('ascii'))
+
+
+def dump_grammar(grammar):
+    """
+    Преобразует грамматику во встроенные типы для marshal.
+
+    Параметры
+    ----------
+        grammar (CompiledGrammar): Скомпилированная грамматика.
+
+    Возвращает
+    ----------
+        tuple: Поля грамматики.
+    """
+    productions = grammar.productions
+    weights = tuple(p.weight for p in productions) if grammar.weighted else None
+    return (grammar.symbols, bytes(grammar.is_terminal), tuple(p.lhs for p in productions),
+            tuple(p.rhs for p in productions), weights, grammar.by_lhs, grammar.start,
+            bytes(grammar.nullable), grammar.min_height, grammar.min_width, grammar.max_width)
+
+
+def load_grammar(fields):
+    """
+    Восстанавливает грамматику из полей, построенных dump_grammar.
+
+    Параметры
+    ----------
+        fields (tuple): Поля грамматики.
+
+    Возвращает
+    ----------
+        CompiledGrammar: Грамматика с готовыми анализами.
+    """
+    symbols, is_terminal, lhs, rhs, weights, by_lhs, start, nullable, min_height, min_width, max_width = fields
+    if weights is None:
+        productions = list(map(Production, range(len(lhs)), lhs, rhs))
+    else:
+        productions = list(map(Production, range(len(lhs)), lhs, rhs, weights))
+    return restore_grammar(symbols, [bool(b) for b in is_terminal], productions, by_lhs, start,
+                           [bool(b) for b in nullable], min_height, min_width, max_width)
+
+
+def load(path, digest):
+    """
+    Читает кэш, если он построен для файла правил с данным хэшем.
+
+    Параметры
+    ----------
+        path (str): Путь к файлу кэша.
+        digest (str): Хэш текущего содержимого файла правил.
+
+    Возвращает
+    ----------
+        object: Сохраненные данные или None, если кэша нет или он устарел.
+    """
+    header = _header(digest)
+    try:
+        with open(path, 'rb') as f:
+            if f.readline() != header:
+                return None
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                with memoryview(data)[len(header):] as view:
+                    return marshal.loads(view)
+    except (OSError, ValueError, EOFError, TypeError):
+        # Нет файла, пустой или поврежденный кэш - строим заново
+        return None
+
+
+def store(path, digest, payload):
+    """
+    Атомарно записывает кэш (через временный файл и os.replace), чтобы
+    одновременно стартующие процессы не прочитали недописанный файл.
+
+    Параметры
+    ----------
+        path (str): Путь к файлу кэша.
+        digest (str): Хэш содержимого файла правил.
+        payload (object): Данные из встроенных типов, поддерживаемых marshal.
+    """
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-', suffix='.cfgc')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(_header(digest))
+            marshal.dump(payload, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
@@ -0,0 +1,269 @@
+"""
+Подсчет выводов грамматики по длине и равновероятная выборка строк заданной длины.
+
+Таблица хранит для каждой длины ``m`` (в токенах) и каждого символа число
+различных выводов строк длины ``m``. Числа - целые Python произвольной
+точности, поэтому переполнения нет даже для длинных строк.
+"""
+
+import math
+import random
+
+
+class DerivationCounts:
+    """
+    Таблица количества выводов по (символ, длина), достраиваемая по требованию.
+
+    Помимо счетчиков символов хранятся счетчики суффиксов продукций:
+    ``suffix[m][pid][i]`` - число выводов строк длины ``m`` из ``rhs[i:]``.
+    Выборка идет сверху вниз по этим таблицам без повторных попыток.
+
+    Если грамматика для одной длины допускает бесконечно много выводов
+    (циклы из цепных или пустых продукций, например ``A -> B``, ``B -> A``),
+    подсчет невозможен и конструктор выбрасывает ValueError.
+
+    Атрибуты
+    ----------
+        grammar (CompiledGrammar): Скомпилированная грамматика.
+        counts (list): ``counts[m][symbol]`` - число выводов длины ``m``.
+        suffix (list): ``suffix[m][pid]`` - кортеж счетчиков суффиксов продукции.
+    """
+
+    def __init__(self, grammar):
+        """
+        Параметры
+        ----------
+            grammar (CompiledGrammar): Скомпилированная грамматика.
+
+        Исключения
+        ----------
+            ValueError: Если число выводов какой-либо длины бесконечно.
+        """
+        self.grammar = grammar
+        self.counts = []
+        self.suffix = []
+        self._order = self._same_length_order()
+
+    @property
+    def max_length(self):
+        """
+        Наибольшая длина, для которой таблица уже построена.
+        """
+        return len(self.counts) - 1
+
+    def _same_length_order(self):
+        """
+        Упорядочивает нетерминалы так, чтобы при вычислении счетчика длины ``m``
+        все счетчики той же длины, от которых он зависит, уже были известны.
+
+        Нетерминал A зависит от B на той же длине, если есть продукция
+        ``A -> α B β`` с обнуляемыми α и β. Непорождающие символы не учитываются:
+        их счетчики всегда равны нулю.
+
+        Возвращает
+        ----------
+            list: Порождающие нетерминалы в порядке вычисления.
+
+        Исключения
+        ----------
+            ValueError: Если зависимости образуют цикл.
+        """
+        grammar = self.grammar
+        nullable = grammar.nullable
+        productive = [width < math.inf for width in grammar.min_width]
+        depends = {}
+        for nt in grammar.nonterminals:
+            if not productive[nt]:
+                continue
+            edges = depends.setdefault(nt, set())
+            for pid in grammar.by_lhs[nt]:
+                rhs = grammar.productions[pid].rhs
+                if not all(productive[sym] for sym in rhs):
+                    continue
+                for i, sym in enumerate(rhs):
+                    if grammar.is_terminal[sym]:
+                        continue
+                    if all(nullable[s] for s in rhs[:i]) and all(nullable[s] for s in rhs[i + 1:]):
+                        edges.add(sym)
+
+        order = []
+        state = {}
+        for root in depends:
+            if root in state:
+                continue
+            state[root] = 1
+            stack = [(root, iter(depends[root]))]
+            while stack:
+                node, children = stack[-1]
+                for child in children:
+                    mark = state.get(child)
+                    if mark is None:
+                        state[child] = 1
+                        stack.append((child, iter(depends[child])))
+                        break
+                    if mark == 1:
+                        raise ValueError(
+                            f'Нетерминал {grammar.symbols[child]!r} участвует в цикле цепных или пустых '
+                            f'продукций: число выводов одной длины бесконечно.')
+                else:
+                    stack.pop()
+                    state[node] = 2
+                    order.append(node)
+        return order
+
+    def extend(self, length):
+        """
+        Достраивает таблицу до указанной длины включительно.
+
+        Параметры
+        ----------
+            length (int): Наибольшая нужная длина (в токенах).
+        """
+        grammar = self.grammar
+        productions = grammar.productions
+        by_lhs = grammar.by_lhs
+        is_terminal = grammar.is_terminal
+        counts = self.counts
+        suffix = self.suffix
+
+        for m in range(len(counts), length + 1):
+            row = [0] * len(grammar.symbols)
+            for sym, terminal in enumerate(is_terminal):
+                if terminal and m == 1:
+                    row[sym] = 1
+            counts.append(row)
+            suffix_row = [None] * len(productions)
+            suffix.append(suffix_row)
+            done = list(is_terminal)
+            stale = []
+
+            for nt in self._order:
+                total = 0
+                for pid in by_lhs[nt]:
+                    rhs = productions[pid].rhs
+                    if not all(done[sym] for sym in rhs):
+                        stale.append(pid)
+                    values = self._suffix_counts(pid, m)
+                    suffix_row[pid] = values
+                    total += values[0]
+                row[nt] = total
+                done[nt] = True
+
+            for pid in stale:
+                suffix_row[pid] = self._suffix_counts(pid, m)
+            for pid, values in enumerate(suffix_row):
+                if values is None:
+                    suffix_row[pid] = self._suffix_counts(pid, m)
+
+    def _suffix_counts(self, pid, m):
+        """
+        Вычисляет счетчики суффиксов продукции для длины ``m``.
+
+        Счетчики меньших длин берутся из таблицы, счетчики длины ``m`` -
+        из строящейся строки таблицы (еще не вычисленные значения равны нулю;
+        это не влияет на результат, если соответствующий префикс не обнуляем).
+
+        Параметры
+        ----------
+            pid (int): Номер продукции.
+            m (int): Длина.
+
+        Возвращает
+        ----------
+            tuple: ``values[i]`` - число выводов длины ``m`` из ``rhs[i:]``.
+        """
+        counts = self.counts
+        suffix = self.suffix
+        rhs = self.grammar.productions[pid].rhs
+        values = [0] * (len(rhs) + 1)
+        values[len(rhs)] = 1 if m == 0 else 0
+        for i in range(len(rhs) - 1, -1, -1):
+            sym = rhs[i]
+            total = counts[0][sym] * values[i + 1]
+            for k in range(1, m + 1):
+                c = counts[k][sym]
+                if c:
+                    total += c * suffix[m - k][pid][i + 1]
+            values[i] = total
+        return tuple(values)
+
+    def count(self, symbol, length):
+        """
+        Возвращает число выводов строк заданной длины из символа.
+
+        Параметры
+        ----------
+            symbol (int): Идентификатор символа.
+            length (int): Длина в токенах.
+        """
+        if length < 0:
+            return 0
+        self.extend(length)
+        return self.counts[length][symbol]
+
+    def sample(self, symbol, length, rng=random):
+        """
+        Выбирает вывод строки заданной длины равновероятно среди всех выводов.
+
+        Для однозначной грамматики это равновероятный выбор среди всех строк
+        языка данной длины.
+
+        Параметры
+        ----------
+            symbol (int): Идентификатор символа.
+            length (int): Длина в токенах.
+            rng: Источник случайных чисел с методом ``randrange`` (по умолчанию модуль random).
+
+        Возвращает
+        ----------
+            tuple: Список идентификаторов терминалов и количество развернутых символов.
+
+        Исключения
+        ----------
+            ValueError: Если из символа не выводится ни одной строки такой длины.
+        """
+        if self.count(symbol, length) == 0:
+            raise ValueError(f'Из символа {self.grammar.symbols[symbol]!r} не выводится '
+                             f'ни одной строки длины {length}.')
+        grammar = self.grammar
+        productions = grammar.productions
+        by_lhs = grammar.by_lhs
+        is_terminal = grammar.is_terminal
+        counts = self.counts
+        suffix = self.suffix
+        randrange = rng.randrange
+
+        out = []
+        steps = 0
+        stack = [(symbol, length)]
+        while stack:
+            symbol, m = stack.pop()
+            steps += 1
+            if is_terminal[symbol]:
+                out.append(symbol)
+                continue
+
+            # Выбор продукции пропорционально числу ее выводов длины m
+            r = randrange(counts[m][symbol])
+            row = suffix[m]
+            for pid in by_lhs[symbol]:
+                weight = row[pid][0]
+                if r < weight:
+                    break
+                r -= weight
+            rhs = productions[pid].rhs
+
+            # Распределение длины m между символами правой части
+            parts = []
+            for i, sym in enumerate(rhs):
+                r = randrange(suffix[m][pid][i])
+                for k in range(m + 1):
+                    weight = counts[k][sym] * suffix[m - k][pid][i + 1]
+                    if r < weight:
+                        break
+                    r -= weight
+                parts.append((sym, k))
+                m -= k
+            stack.extend(reversed(parts))
+
+        return out, steps
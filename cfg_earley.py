@@ -0,0 +1,448 @@
+"""
+Распознаватель Эрли для контекстно-свободных грамматик.
+
+Работает за полиномиальное время по индексам токенов (без нарезки подстрок),
+корректно обрабатывает левую рекурсию и пустые (эпсилон) продукции.
+Наборы ситуаций строятся по одному на токен, поэтому тот же алгоритм
+используется и для пакетной проверки, и для потоковой (IncrementalRecognizer).
+"""
+
+import math
+
+from cfg_lexer import Lexer
+
+
+class EarleyRecognizer:
+    """
+    Табличный (chart) распознаватель Эрли.
+
+    Ситуация (item) хранится как кортеж ``(pid, dot, origin)``: номер продукции,
+    позиция точки в правой части и номер набора, в котором ситуация была предсказана.
+    Все символы - целочисленные идентификаторы скомпилированной грамматики.
+    Продукции с непорождающими символами не предсказываются, поэтому непустой
+    набор означает, что прочитанный префикс можно дополнить до предложения.
+
+    Атрибуты
+    ----------
+        grammar (CompiledGrammar): Скомпилированная грамматика.
+        items (int): Количество ситуаций, построенных при последнем распознавании.
+    """
+
+    def __init__(self, grammar):
+        """
+        Параметры
+        ----------
+            grammar (CompiledGrammar): Скомпилированная грамматика.
+        """
+        self.grammar = grammar
+        self.items = 0
+        min_width = grammar.min_width
+        productive = [all(min_width[sym] != math.inf for sym in p.rhs) for p in grammar.productions]
+        self._predict = tuple(tuple(pid for pid in pids if productive[pid]) for pids in grammar.by_lhs)
+
+    def start_items(self):
+        """
+        Возвращает начальные ситуации нулевого набора.
+        """
+        grammar = self.grammar
+        if grammar.start < 0 or grammar.is_terminal[grammar.start]:
+            return []
+        return [(pid, 0, 0) for pid in self._predict[grammar.start]]
+
+    def close(self, k, current, waiting_sets, hooks=None):
+        """
+        Замыкает набор ``k`` предсказаниями и завершениями.
+
+        Параметры
+        ----------
+            k (int): Номер набора.
+            current (list): Начальные ситуации набора (после сканирования);
+                список дополняется на месте.
+            waiting_sets (list): Ожидающие ситуации предыдущих наборов; набор
+                ``k`` добавляется в конец.
+            hooks: Обработчик событий (профилировщик cfg_profile) или None:
+                ``hooks.item(item)`` - перед обработкой каждой ситуации и
+                ``hooks.item(None)`` в конце набора, ``hooks.predict(symbol, k, item)`` -
+                при первом предсказании нетерминала в наборе (по умолчанию None).
+
+        Возвращает
+        ----------
+            tuple: Множество ситуаций набора и словарь ``{терминал: [ситуации]}``
+                ситуаций, ожидающих терминал.
+        """
+        grammar = self.grammar
+        productions = grammar.productions
+        is_terminal = grammar.is_terminal
+        nullable = grammar.nullable
+        predict = self._predict
+
+        # waiting[symbol] - ситуации набора k, ожидающие нетерминал symbol
+        waiting = {}
+        # scan[terminal] - ситуации набора k, ожидающие терминал terminal
+        scan = {}
+        waiting_sets.append(waiting)
+        seen = set(current)
+        agenda = current
+        predicted = set()
+        i = 0
+        while i < len(agenda):
+            item = agenda[i]
+            i += 1
+            if hooks is not None:
+                hooks.item(item)
+            pid, dot, origin = item
+            production = productions[pid]
+            rhs = production.rhs
+
+            if dot == len(rhs):
+                # Завершение: продвигаем ситуации, ожидавшие lhs в наборе origin
+                for wpid, wdot, worigin in waiting_sets[origin].get(production.lhs, ()):
+                    advanced = (wpid, wdot + 1, worigin)
+                    if advanced not in seen:
+                        seen.add(advanced)
+                        agenda.append(advanced)
+                continue
+
+            symbol = rhs[dot]
+            if not is_terminal[symbol]:
+                waiting.setdefault(symbol, []).append(item)
+                if symbol not in predicted:
+                    # Предсказание
+                    predicted.add(symbol)
+                    if hooks is not None:
+                        hooks.predict(symbol, k, item)
+                    for qid in predict[symbol]:
+                        new_item = (qid, 0, k)
+                        if new_item not in seen:
+                            seen.add(new_item)
+                            agenda.append(new_item)
+                if nullable[symbol]:
+                    # Поправка Эйкока-Хорспула для пустых продукций
+                    advanced = (pid, dot + 1, origin)
+                    if advanced not in seen:
+                        seen.add(advanced)
+                        agenda.append(advanced)
+            else:
+                scan.setdefault(symbol, []).append(item)
+
+        if hooks is not None:
+            hooks.item(None)
+        return seen, scan
+
+    def is_complete(self, seen):
+        """
+        Проверяет, содержит ли набор завершенную стартовую ситуацию из нулевого набора.
+
+        Параметры
+        ----------
+            seen (set): Ситуации набора.
+        """
+        grammar = self.grammar
+        if grammar.start < 0:
+            return False
+        productions = grammar.productions
+        for pid in self._predict[grammar.start]:
+            if (pid, len(productions[pid].rhs), 0) in seen:
+                return True
+        return False
+
+    def recognize(self, tokens, hooks=None):
+        """
+        Проверяет, выводится ли последовательность токенов из стартового символа.
+
+        Параметры
+        ----------
+            tokens (list): Последовательность идентификаторов терминалов
+                (-1 для токенов, отсутствующих в грамматике).
+            hooks: Обработчик событий для close или None (по умолчанию None).
+
+        Возвращает
+        ----------
+            bool: True, если последовательность принадлежит языку грамматики.
+        """
+        grammar = self.grammar
+        n = len(tokens)
+        self.items = 0
+
+        if grammar.start < 0 or grammar.is_terminal[grammar.start]:
+            # Стартовый символ - терминал: язык состоит из одного слова
+            return n == 1 and tokens[0] == grammar.start
+
+        waiting_sets = []
+        current = self.start_items()
+        for k in range(n + 1):
+            seen, scan = self.close(k, current, waiting_sets, hooks)
+            self.items += len(seen)
+            if k == n:
+                return self.is_complete(seen)
+
+            # Сканирование
+            current = [(pid, dot + 1, origin) for pid, dot, origin in scan.get(tokens[k], ())]
+            if not current:
+                return False
+
+        return False
+
+    def _lattice_sets(self, lattice, hooks=None):
+        """
+        Строит наборы ситуаций по решетке токенов и выдает множество ситуаций
+        каждого набора по порядку.
+
+        Терминал, совпадающий с единицами ``[k, end)``, сканируется из набора
+        ``k`` сразу в набор ``end``, поэтому наборы между ними могут быть
+        пустыми. Обход останавливается, когда ни одно совпадение не продолжает
+        прочитанный префикс.
+        """
+        n = len(lattice)
+        waiting_sets = []
+        pending = [[] for _ in range(n + 1)]
+        pending[0] = self.start_items()
+        furthest = 0
+        for k in range(n + 1):
+            # Одна ситуация может прийти в набор по совпадениям разной длины
+            current = list(dict.fromkeys(pending[k]))
+            pending[k] = None
+            seen, scan = self.close(k, current, waiting_sets, hooks)
+            self.items += len(seen)
+            yield seen
+            if k == n:
+                return
+            for sid, end in lattice[k]:
+                waiting = scan.get(sid)
+                if waiting:
+                    pending[end].extend((pid, dot + 1, origin) for pid, dot, origin in waiting)
+                    furthest = max(furthest, end)
+            if furthest <= k:
+                return
+
+    def recognize_lattice(self, lattice, hooks=None):
+        """
+        Проверяет, выводится ли из стартового символа хотя бы одно разбиение
+        входа на терминалы.
+
+        Нужен для грамматик с многословными терминалами, у которых разбиение
+        строки на токены неоднозначно (см. Lexer.lattice).
+
+        Параметры
+        ----------
+            lattice (list): Решетка токенов: для каждой позиции - пары ``(id, конец)``.
+            hooks: Обработчик событий для close или None (по умолчанию None).
+
+        Возвращает
+        ----------
+            bool: True, если строка принадлежит языку грамматики.
+        """
+        grammar = self.grammar
+        n = len(lattice)
+        self.items = 0
+        if grammar.start < 0:
+            return False
+        if grammar.is_terminal[grammar.start]:
+            # Язык из одного слова - стартового терминала
+            return n > 0 and (grammar.start, n) in lattice[0]
+
+        count = 0
+        for seen in self._lattice_sets(lattice, hooks):
+            count += 1
+        return count == n + 1 and self.is_complete(seen)
+
+    def chart(self, lattice):
+        """
+        Строит и сохраняет все наборы ситуаций для решетки токенов.
+
+        Нужен для построения леса разбора: ситуация ``(pid, dot, origin)`` в
+        наборе ``k`` означает, что ``rhs[:dot]`` выводит единицы входа
+        ``[origin, k)``.
+
+        Параметры
+        ----------
+            lattice (list): Решетка токенов: для каждой позиции - пары ``(id, конец)``
+                (для последовательности токенов - ``[[(token, 1)], [(token, 2)], ...]``).
+
+        Возвращает
+        ----------
+            list: Множества ситуаций для позиций 0..n или None, если
+                вход не принадлежит языку.
+        """
+        grammar = self.grammar
+        self.items = 0
+        if grammar.start < 0 or grammar.is_terminal[grammar.start]:
+            return None
+        sets = list(self._lattice_sets(lattice))
+        if len(sets) == len(lattice) + 1 and self.is_complete(sets[-1]):
+            return sets
+        return None
+
+
+class IncrementalRecognizer:
+    """
+    Потоковый распознаватель: принимает слова по одному.
+
+    Наборы ситуаций нумеруются словами, как в recognize_lattice: терминал из
+    слов ``[k, end)`` сканируется из набора ``k`` в набор ``end``. Для каждого
+    набора, с которого начат еще не дочитанный многословный терминал, хранится
+    узел префиксного дерева лексера (пара ``(узел, k)``), поэтому слово, с
+    которого терминал только начинается, не отвергает префикс. После каждого
+    слова строится не больше одного нового набора ситуаций, поэтому стоимость
+    слова не зависит от того, сколько слов уже прочитано (кроме завершений,
+    ссылающихся на ранние наборы). Принимается то же, что и в is_valid_string.
+
+    Атрибуты
+    ----------
+        position (int): Количество принятых слов.
+        viable (bool): Можно ли дополнить прочитанный префикс до предложения.
+        complete (bool): Является ли прочитанный префикс предложением языка.
+        items (int): Общее количество построенных ситуаций.
+
+    Использование
+    ----------
+        r = cfg.recognizer()
+        r.feed('John')
+        r.expected()   # допустимые следующие слова
+    """
+
+    def __init__(self, recognizer, lexer=None):
+        """
+        Параметры
+        ----------
+            recognizer (EarleyRecognizer): Распознаватель скомпилированной грамматики.
+            lexer (Lexer): Лексер терминалов той же грамматики; None - лексер
+                уровня слов (по умолчанию None).
+        """
+        self._recognizer = recognizer
+        self._lexer = lexer if lexer is not None else Lexer.from_grammar(recognizer.grammar)
+        self.reset()
+
+    def reset(self):
+        """
+        Возвращает распознаватель в начальное состояние (пустой префикс).
+        """
+        recognizer = self._recognizer
+        grammar = recognizer.grammar
+        self.position = 0
+        self.items = 0
+        self._waiting_sets = []
+        # Начатые многословные терминалы: пары (узел дерева лексера, номер набора)
+        self._partial = []
+        self._single_terminal = grammar.start >= 0 and grammar.is_terminal[grammar.start]
+        if self._single_terminal:
+            # Язык из одного терминала - стартового символа
+            scan = {grammar.start: [None]}
+            self.complete = False
+        else:
+            seen, scan = recognizer.close(0, recognizer.start_items(), self._waiting_sets)
+            self.items = len(seen)
+            self.complete = recognizer.is_complete(seen)
+        # scans[k] - терминалы, ожидаемые ситуациями набора k (текущего и тех, где начаты терминалы)
+        self._scans = {0: scan}
+        self.viable = bool(scan) or self.complete
+
+    def feed(self, token):
+        """
+        Принимает следующее слово.
+
+        Параметры
+        ----------
+            token (str): Слово входной строки (без символа окончания). Текст
+                из нескольких слов, например многословный терминал целиком,
+                принимается по словам.
+
+        Возвращает
+        ----------
+            bool: True, если префикс с этим словом еще можно дополнить до предложения.
+        """
+        for unit in self._lexer.units(token):
+            if not self._feed_unit(unit):
+                return False
+        return self.viable
+
+    def _feed_unit(self, unit):
+        """
+        Принимает одно слово.
+        """
+        self.position += 1
+        if not self.viable:
+            return False
+        lexer = self._lexer
+        scans = self._scans
+        k = self.position - 1
+        starts = self._partial + [(Lexer.ROOT, k)] if scans[k] else self._partial
+
+        # Сканирование: терминалы, которые оканчиваются этим словом, и терминалы,
+        # которые им продолжаются
+        current = []
+        partial = []
+        for node, start in starts:
+            node = lexer.step(node, unit)
+            if node is None:
+                continue
+            scan = scans[start]
+            waiting = scan.get(lexer.accepted(node))
+            if waiting:
+                current.extend(waiting)
+            if any(sid in scan for sid in lexer.continuations(node)):
+                partial.append((node, start))
+        self._partial = partial
+
+        recognizer = self._recognizer
+        if self._single_terminal:
+            scan = {}
+            self.complete = bool(current)
+        elif current:
+            # Одна ситуация может прийти в набор по совпадениям разной длины
+            current = list(dict.fromkeys((pid, dot + 1, origin) for pid, dot, origin in current))
+            seen, scan = recognizer.close(self.position, current, self._waiting_sets)
+            self.items += len(seen)
+            self.complete = recognizer.is_complete(seen)
+        else:
+            # Слово внутри многословного терминала: набор пуст
+            self._waiting_sets.append({})
+            scan = {}
+            self.complete = False
+        self._scans = {start: scans[start] for _, start in partial}
+        self._scans[self.position] = scan
+        self.viable = bool(scan) or self.complete or bool(partial)
+        return self.viable
+
+    def feed_all(self, tokens):
+        """
+        Принимает последовательность слов.
+
+        Параметры
+        ----------
+            tokens (iterable): Слова входной строки.
+
+        Возвращает
+        ----------
+            bool: Значение viable после последнего слова.
+        """
+        for token in tokens:
+            if not self.feed(token):
+                break
+        return self.viable
+
+    def expected(self):
+        """
+        Возвращает слова, которые могут следовать за прочитанным префиксом.
+
+        Для грамматик без многословных терминалов это имена допустимых следующих
+        терминалов; иначе - и первые слова терминалов, и следующие слова уже
+        начатых многословных терминалов. Каждое из них можно передать в feed.
+
+        Возвращает
+        ----------
+            list: Допустимые следующие слова.
+        """
+        lexer = self._lexer
+        scans = self._scans
+        starts = self._partial
+        if scans[self.position]:
+            starts = starts + [(Lexer.ROOT, self.position)]
+        result = set()
+        for node, start in starts:
+            scan = scans[start]
+            for unit in lexer.next_units(node):
+                child = lexer.step(node, unit)
+                if lexer.accepted(child) in scan or any(sid in scan for sid in lexer.continuations(child)):
+                    result.add(unit)
+        return sorted(result)
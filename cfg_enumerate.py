@@ -0,0 +1,297 @@
+"""
+Перечисление всех предложений грамматики до заданной длины.
+
+Предложения длины ``m`` строятся обходом в глубину по префиксам в
+лексикографическом порядке терминалов. Префикс отслеживается наборами
+ситуаций Эрли, в которых каждая ситуация знает, где должна закончиться ее
+продукция: ``(pid, dot, origin, end)``. Ситуация добавляется, только если
+остаток правой части может вывести ровно столько токенов, сколько осталось
+до ``end``, поэтому каждый префикс в обходе дополняется хотя бы одним
+предложением длины ``m``: тупиков нет, а каждое предложение встречается
+ровно один раз, сколько бы выводов у него ни было.
+
+Память ограничена наборами ситуаций текущего пути (не более ``m + 1`` набора);
+сами предложения не накапливаются.
+
+Если у грамматики есть многословные терминалы, разные последовательности
+терминалов могут давать одну и ту же строку (``в ящик | лежит`` и
+``в | ящик | лежит``). Такая строка выдается один раз - для первого в порядке
+обхода разбиения (самого короткого, затем лексикографически первого); ее
+длина в токенах - длина этого разбиения.
+"""
+
+from cfg_earley import EarleyRecognizer
+from cfg_lexer import Lexer
+
+
+def _sumset(a, b, full):
+    """
+    Возвращает множество сумм двух множеств длин (битовые маски).
+    """
+    result = 0
+    while a:
+        low = a & -a
+        result |= b << (low.bit_length() - 1)
+        a ^= low
+    return result & full
+
+
+class SentenceEnumerator:
+    """
+    Перечислитель предложений грамматики по длине.
+
+    Для каждого символа хранится битовая маска выводимых длин (бит ``r`` -
+    выводится строка из ``r`` токенов), для каждой продукции - маски суффиксов
+    правой части. Маски вычисляются неподвижной точкой, поэтому циклы из
+    цепных и пустых продукций допустимы.
+
+    Атрибуты
+    ----------
+        grammar (CompiledGrammar): Скомпилированная грамматика.
+        max_tokens (int): Наибольшая длина, для которой построены маски.
+    """
+
+    def __init__(self, grammar):
+        """
+        Параметры
+        ----------
+            grammar (CompiledGrammar): Скомпилированная грамматика.
+        """
+        self.grammar = grammar
+        self.max_tokens = -1
+        self._lengths = None
+        self._suffix = None
+        # Порядок терминалов по имени - для лексикографического обхода
+        self._rank = {sym: rank for rank, sym in enumerate(
+            sorted((sym for sym, terminal in enumerate(grammar.is_terminal) if terminal),
+                   key=grammar.symbols.__getitem__))}
+        # Лексер и распознаватель для проверки других разбиений строки - только
+        # при многословных терминалах
+        self._lexer = None
+        self._recognizer = None
+        if any(terminal and len(name.split()) > 1 for name, terminal in zip(grammar.symbols, grammar.is_terminal)):
+            self._lexer = Lexer.from_grammar(grammar)
+            self._recognizer = EarleyRecognizer(grammar)
+
+    def _build(self, max_tokens):
+        """
+        Строит маски выводимых длин до max_tokens включительно.
+        """
+        if max_tokens <= self.max_tokens:
+            return
+        grammar = self.grammar
+        productions = grammar.productions
+        full = (1 << (max_tokens + 1)) - 1
+        lengths = [0b10 if terminal else 0 for terminal in grammar.is_terminal]
+        changed = True
+        while changed:
+            changed = False
+            for production in productions:
+                mask = 1
+                for sym in production.rhs:
+                    mask = _sumset(lengths[sym], mask, full)
+                    if not mask:
+                        break
+                if mask & ~lengths[production.lhs]:
+                    lengths[production.lhs] |= mask
+                    changed = True
+
+        suffix = []
+        for production in productions:
+            rhs = production.rhs
+            masks = [0] * len(rhs) + [1]
+            for i in range(len(rhs) - 1, -1, -1):
+                masks[i] = _sumset(lengths[rhs[i]], masks[i + 1], full)
+            suffix.append(tuple(masks))
+        self._lengths = lengths
+        self._suffix = suffix
+        self.max_tokens = max_tokens
+
+    def _close(self, k, agenda, waiting_sets):
+        """
+        Замыкает набор ``k``; возвращает словарь ``{терминал: [ситуации]}``.
+
+        Каждая ситуация ``(pid, dot, origin, end)`` в наборе ``k`` удовлетворяет
+        условию: ``rhs[dot:]`` выводит ровно ``end - k`` токенов.
+        """
+        grammar = self.grammar
+        productions = grammar.productions
+        by_lhs = grammar.by_lhs
+        is_terminal = grammar.is_terminal
+        lengths = self._lengths
+        suffix = self._suffix
+
+        # waiting[(symbol, end)] - ситуации, ожидающие symbol на отрезке [k, end)
+        waiting = {}
+        scan = {}
+        waiting_sets.append(waiting)
+        seen = set(agenda)
+        predicted = set()
+        i = 0
+        while i < len(agenda):
+            item = agenda[i]
+            i += 1
+            pid, dot, origin, end = item
+            production = productions[pid]
+            rhs = production.rhs
+
+            if dot == len(rhs):
+                # Завершение: здесь всегда k == end
+                for wpid, wdot, worigin, wend in waiting_sets[origin].get((production.lhs, k), ()):
+                    advanced = (wpid, wdot + 1, worigin, wend)
+                    if advanced not in seen:
+                        seen.add(advanced)
+                        agenda.append(advanced)
+                continue
+
+            symbol = rhs[dot]
+            if is_terminal[symbol]:
+                scan.setdefault(symbol, []).append(item)
+                continue
+
+            rest = end - k
+            after = suffix[pid][dot + 1]
+            symbol_lengths = lengths[symbol]
+            for length in range(1, rest + 1):
+                if not (symbol_lengths >> length) & 1 or not (after >> (rest - length)) & 1:
+                    continue
+                key = (symbol, k + length)
+                waiting.setdefault(key, []).append(item)
+                if key not in predicted:
+                    predicted.add(key)
+                    for qid in by_lhs[symbol]:
+                        if (suffix[qid][0] >> length) & 1:
+                            new_item = (qid, 0, k, k + length)
+                            if new_item not in seen:
+                                seen.add(new_item)
+                                agenda.append(new_item)
+            if symbol_lengths & 1 and (after >> rest) & 1:
+                # Символ выводит пустую строку - пропускаем его без предсказания
+                advanced = (pid, dot + 1, origin, end)
+                if advanced not in seen:
+                    seen.add(advanced)
+                    agenda.append(advanced)
+        return scan
+
+    def _first_split(self, tokens):
+        """
+        Проверяет, что ``tokens`` - первое в порядке обхода разбиение своей
+        строки среди разбиений, которые выводятся в грамматике.
+
+        Перебираются разбиения строки на терминалы не длиннее ``tokens``;
+        каждое, которое раньше в порядке обхода, проверяется распознавателем.
+        """
+        rank = self._rank
+        key = tuple(rank[sym] for sym in tokens)
+        symbols = self.grammar.symbols
+        lattice = self._lexer.lattice(' '.join(symbols[sym] for sym in tokens))
+        n = len(lattice)
+        m = len(tokens)
+        stack = [(0, ())]
+        while stack:
+            position, split = stack.pop()
+            if position == n:
+                if split != tokens and (len(split) < m or tuple(rank[sym] for sym in split) < key) \
+                        and self._recognizer.recognize(list(split)):
+                    return False
+                continue
+            if len(split) < m:
+                for sid, end in lattice[position]:
+                    stack.append((end, split + (sid,)))
+        return True
+
+    def sentences_of_length(self, length):
+        """
+        Лениво перечисляет различные предложения ровно из ``length`` токенов
+        в лексикографическом порядке (по именам терминалов).
+
+        При многословных терминалах строка, у которой есть более короткое
+        выводимое разбиение, пропускается: она выдается при своей длине.
+
+        Параметры
+        ----------
+            length (int): Длина в токенах.
+
+        Возвращает
+        ----------
+            iterator: Кортежи идентификаторов терминалов.
+        """
+        grammar = self.grammar
+        start = grammar.start
+        if length < 0 or start < 0:
+            return
+        self._build(length)
+        if grammar.is_terminal[start]:
+            if length == 1:
+                yield (start,)
+            return
+        if not (self._lengths[start] >> length) & 1:
+            return
+        if length == 0:
+            yield ()
+            return
+
+        rank = self._rank.__getitem__
+        waiting_sets = []
+        agenda = [(pid, 0, 0, length) for pid in grammar.by_lhs[start] if (self._suffix[pid][0] >> length) & 1]
+        scan = self._close(0, agenda, waiting_sets)
+        prefix = []
+        # Стек обхода: (словарь сканирования, итератор по терминалам)
+        stack = [(scan, iter(sorted(scan, key=rank)))]
+        while stack:
+            scan, terminals = stack[-1]
+            terminal = next(terminals, None)
+            if terminal is None:
+                stack.pop()
+                if prefix:
+                    prefix.pop()
+                del waiting_sets[len(stack) + 1:]
+                continue
+            k = len(prefix)
+            del waiting_sets[k + 1:]
+            prefix.append(terminal)
+            if k + 1 == length:
+                sentence = tuple(prefix)
+                if self._lexer is None or self._first_split(sentence):
+                    yield sentence
+                prefix.pop()
+                continue
+            agenda = [(pid, dot + 1, origin, end) for pid, dot, origin, end in scan[terminal]]
+            next_scan = self._close(k + 1, agenda, waiting_sets)
+            stack.append((next_scan, iter(sorted(next_scan, key=rank))))
+
+    def sentences(self, max_tokens):
+        """
+        Лениво перечисляет различные предложения длиной до ``max_tokens``
+        токенов включительно: по возрастанию длины, внутри длины - лексикографически.
+
+        Параметры
+        ----------
+            max_tokens (int): Наибольшая длина в токенах.
+
+        Возвращает
+        ----------
+            iterator: Кортежи идентификаторов терминалов.
+        """
+        self._build(max_tokens)
+        for length in range(max_tokens + 1):
+            yield from self.sentences_of_length(length)
+
+    def count_by_enumeration(self, max_tokens):
+        """
+        Считает различные предложения длиной до ``max_tokens`` токенов обходом
+        всего языка (sentences) без сохранения предложений.
+
+        Время пропорционально числу предложений: в отличие от числа выводов
+        (DerivationCounts), число различных строк неоднозначной грамматики по
+        таблице не вычисляется.
+
+        Параметры
+        ----------
+            max_tokens (int): Наибольшая длина в токенах.
+
+        Возвращает
+        ----------
+            int: Количество предложений.
+        """
+        return sum(1 for _ in self.sentences(max_tokens))
@@ -0,0 +1,436 @@
+"""
+Разделяемый упакованный лес разбора (SPPF).
+
+Лес строится по наборам ситуаций распознавателя Эрли сверху вниз, только из
+узлов, достижимых от корня. Узел символа ``(A, i, j)`` хранит все способы
+вывести единицы входа ``[i, j)`` из A; общие поддеревья разных разборов хранятся один
+раз, поэтому экспоненциальное число разборов занимает полиномиальную память.
+
+Продукции бинаризованы: семейство (family) узла - тройка ``(pid, left, right)``,
+где right - узел последнего символа правой части, а left - промежуточный
+узел с меткой ``(pid, dot)`` для префикса ``rhs[:dot]`` (или сам узел первого
+символа, если префикс из одного символа; None для пустого префикса).
+
+Дерево разбора представляется кортежем ``(нетерминал, поддерево, ...)``;
+листья - строки терминалов.
+"""
+
+import math
+import random
+
+
+class ForestNode:
+    """
+    Узел леса разбора.
+
+    Атрибуты
+    ----------
+        label: Идентификатор символа (int) или ``(pid, dot)`` для промежуточного узла.
+        start (int): Начало покрываемого отрезка входа (номер слова).
+        end (int): Конец отрезка (не включительно).
+        families (tuple): Альтернативы ``(pid, left, right)``; пусто для терминалов.
+    """
+
+    __slots__ = ('label', 'start', 'end', 'families')
+
+    def __init__(self, label, start, end):
+        self.label = label
+        self.start = start
+        self.end = end
+        self.families = ()
+
+    @property
+    def intermediate(self):
+        """
+        True для промежуточного узла (префикса правой части продукции).
+        """
+        return type(self.label) is tuple
+
+    def __repr__(self):
+        return f'ForestNode({self.label!r}, {self.start}, {self.end}, families={len(self.families)})'
+
+
+def build_forest(recognizer, lattice):
+    """
+    Строит лес разбора решетки токенов.
+
+    Позиции узлов - номера единиц входа (слов), поэтому разборы с разными
+    разбиениями строки на многословные терминалы попадают в один лес.
+
+    Параметры
+    ----------
+        recognizer (EarleyRecognizer): Распознаватель грамматики.
+        lattice (list): Решетка токенов (Lexer.lattice): для каждой позиции -
+            пары ``(id, конец)`` совпадающих терминалов.
+
+    Возвращает
+    ----------
+        ParseForest: Лес разбора или None, если вход не принадлежит языку.
+    """
+    grammar = recognizer.grammar
+    start = grammar.start
+    is_terminal = grammar.is_terminal
+    n = len(lattice)
+
+    if start >= 0 and is_terminal[start]:
+        # Язык из одного слова - стартового терминала
+        if n and (start, n) in lattice[0]:
+            return ParseForest(grammar, ForestNode(start, 0, n), 1)
+        return None
+
+    chart = recognizer.chart(lattice)
+    if chart is None:
+        return None
+    # starts[k][терминал] - начала совпадений терминала, оканчивающихся в позиции k
+    starts = [{} for _ in range(n + 1)]
+    for i, matches in enumerate(lattice):
+        for sid, end in matches:
+            starts[end].setdefault(sid, []).append(i)
+
+    productions = grammar.productions
+    by_lhs = grammar.by_lhs
+    # done[k][A] - начала завершенных в наборе k выводов нетерминала A
+    done = []
+    for seen in chart:
+        table = {}
+        for pid, dot, origin in seen:
+            production = productions[pid]
+            if dot == len(production.rhs):
+                table.setdefault(production.lhs, set()).add(origin)
+        done.append(table)
+
+    nodes = {}
+    agenda = []
+
+    def node(label, i, j):
+        key = (label, i, j)
+        found = nodes.get(key)
+        if found is None:
+            found = nodes[key] = ForestNode(label, i, j)
+            if type(label) is tuple or not is_terminal[label]:
+                agenda.append(found)
+        return found
+
+    def families(pid, dot, i, k):
+        # Способы вывести rhs[:dot] продукции pid из единиц [i, k)
+        if dot == 0:
+            return [(pid, None, None)] if i == k else []
+        symbol = productions[pid].rhs[dot - 1]
+        if is_terminal[symbol]:
+            splits = [m for m in starts[k].get(symbol, ()) if m >= i]
+        else:
+            splits = [m for m in done[k].get(symbol, ()) if m >= i]
+        result = []
+        for m in sorted(splits):
+            if dot == 1:
+                if m != i:
+                    continue
+                left = None
+            elif (pid, dot - 1, i) not in chart[m]:
+                continue
+            elif dot == 2:
+                left = node(productions[pid].rhs[0], i, m)
+            else:
+                left = node((pid, dot - 1), i, m)
+            result.append((pid, left, node(symbol, m, k)))
+        return result
+
+    root = node(start, 0, n)
+    while agenda:
+        current = agenda.pop()
+        label, i, j = current.label, current.start, current.end
+        if type(label) is tuple:
+            current.families = tuple(families(label[0], label[1], i, j))
+        else:
+            alternatives = []
+            for pid in by_lhs[label]:
+                if (pid, len(productions[pid].rhs), i) in chart[j]:
+                    alternatives.extend(families(pid, len(productions[pid].rhs), i, j))
+            current.families = tuple(alternatives)
+    return ParseForest(grammar, root, len(nodes))
+
+
+class ParseForest:
+    """
+    Лес разбора одной строки.
+
+    Атрибуты
+    ----------
+        grammar (CompiledGrammar): Скомпилированная грамматика.
+        root (ForestNode): Корневой узел (стартовый символ на всей строке).
+        size (int): Количество узлов леса.
+
+    Использование
+    ----------
+        forest = cfg.parse('John loves Mary.')
+        forest.count()          # число разборов
+        forest.first_tree()     # ('S', ('NP', ('PropN', 'John')), ...)
+        forest.random_tree()    # равновероятно среди всех разборов
+    """
+
+    def __init__(self, grammar, root, size):
+        """
+        Параметры
+        ----------
+            grammar (CompiledGrammar): Скомпилированная грамматика.
+            root (ForestNode): Корневой узел.
+            size (int): Количество узлов.
+        """
+        self.grammar = grammar
+        self.root = root
+        self.size = size
+        self._counts = None
+        self.cyclic = None
+
+    def _count_nodes(self):
+        """
+        Считает разборы для всех узлов (обход в глубину без рекурсии).
+
+        Узел, из которого достижим цикл (цепные или пустые продукции), имеет
+        бесконечно много разборов (``math.inf``).
+        """
+        if self._counts is not None:
+            return self._counts
+        counts = {}
+        on_stack = set()
+        cyclic = False
+        stack = [(self.root, False)]
+        while stack:
+            current, expanded = stack.pop()
+            key = id(current)
+            if expanded:
+                on_stack.discard(key)
+                if counts.get(key) == math.inf:
+                    continue
+                total = 0
+                for _, left, right in current.families:
+                    left_count = counts[id(left)] if left is not None else 1
+                    right_count = counts[id(right)] if right is not None else 1
+                    total += left_count * right_count
+                counts[key] = total if current.families else 1
+                continue
+            if key in counts:
+                continue
+            if key in on_stack:
+                continue
+            on_stack.add(key)
+            stack.append((current, True))
+            for _, left, right in current.families:
+                for child in (left, right):
+                    if child is None:
+                        continue
+                    child_key = id(child)
+                    if child_key in on_stack:
+                        # Обратное ребро: все узлы на пути до него лежат на цикле или ведут к нему
+                        cyclic = True
+                        for frame, frame_expanded in stack:
+                            if frame_expanded:
+                                counts[id(frame)] = math.inf
+                    elif child_key not in counts:
+                        stack.append((child, False))
+        self.cyclic = cyclic
+        self._counts = counts
+        return counts
+
+    def count(self):
+        """
+        Возвращает число деревьев разбора без их построения.
+
+        Возвращает
+        ----------
+            int: Число разборов (``math.inf`` при циклах из цепных или пустых продукций).
+        """
+        return self._count_nodes()[id(self.root)]
+
+    def _children(self, family, choose):
+        """
+        Разворачивает цепочку промежуточных узлов семейства в список детей.
+        """
+        _, left, right = family
+        children = [right] if right is not None else []
+        while left is not None:
+            if left.intermediate:
+                _, left, right = choose(left)
+                children.append(right)
+            else:
+                children.append(left)
+                left = None
+        children.reverse()
+        return children
+
+    def _build(self, choose):
+        """
+        Строит одно дерево, выбирая семейство каждого узла функцией choose.
+        """
+        symbols = self.grammar.symbols
+        root = self.root
+        if not root.families:
+            return symbols[root.label]
+        # Кадр: имя, узлы детей, уже построенные поддеревья
+        stack = [(symbols[root.label], self._children(choose(root), choose), [])]
+        while True:
+            name, children, built = stack[-1]
+            if len(built) == len(children):
+                stack.pop()
+                tree = (name,) + tuple(built)
+                if not stack:
+                    return tree
+                stack[-1][2].append(tree)
+                continue
+            child = children[len(built)]
+            if not child.families:
+                built.append(symbols[child.label])
+            else:
+                stack.append((symbols[child.label], self._children(choose(child), choose), []))
+
+    def first_tree(self):
+        """
+        Возвращает первое дерево разбора (первое в порядке trees()).
+
+        Возвращает
+        ----------
+            tuple: Дерево ``(нетерминал, поддерево, ...)``.
+        """
+        self._count_nodes()
+        if self.cyclic:
+            return next(self.trees())
+        return self._build(lambda node: node.families[0])
+
+    def random_tree(self, rng=random):
+        """
+        Выбирает дерево разбора равновероятно среди всех разборов.
+
+        Параметры
+        ----------
+            rng: Источник случайных чисел с методом ``randrange`` (по умолчанию модуль random).
+
+        Возвращает
+        ----------
+            tuple: Дерево ``(нетерминал, поддерево, ...)``.
+
+        Исключения
+        ----------
+            ValueError: Если разборов бесконечно много.
+        """
+        counts = self._count_nodes()
+        if counts[id(self.root)] == math.inf:
+            raise ValueError('Разборов бесконечно много: равновероятный выбор невозможен.')
+
+        def choose(node):
+            r = rng.randrange(counts[id(node)])
+            for family in node.families:
+                _, left, right = family
+                weight = (counts[id(left)] if left is not None else 1) * \
+                         (counts[id(right)] if right is not None else 1)
+                if r < weight:
+                    return family
+                r -= weight
+            return node.families[-1]
+
+        return self._build(choose)
+
+    def trees(self):
+        """
+        Лениво перечисляет деревья разбора.
+
+        Обход идет без рекурсии, по явному стеку выборов: каждый кадр хранит
+        узел, номер выбранного семейства и узлы, которые осталось развернуть
+        после него. Следующее дерево получается сменой семейства в последнем
+        кадре, где есть еще не перебранные семейства, поэтому глубина дерева
+        ограничена только памятью.
+
+        При циклах из цепных или пустых продукций перечисляются только деревья,
+        в которых узел леса не повторяется на пути от корня.
+
+        Возвращает
+        ----------
+            iterator: Деревья ``(нетерминал, поддерево, ...)``.
+        """
+        self._count_nodes()
+        # Ожидающие узлы - связный список (узел, предки, хвост), чтобы кадры делили общие хвосты
+        pending = (self.root, frozenset() if self.cyclic else None, None)
+        # Кадр: [узел, предки, хвост после узла, номер семейства]
+        frames = []
+        while True:
+            # Спуск: первое допустимое семейство для каждого ожидающего узла
+            while pending is not None:
+                node, ancestors, rest = pending
+                if not node.families:
+                    pending = rest
+                    continue
+                frame = [node, ancestors, rest, -1]
+                frames.append(frame)
+                pending = self._next_family(frame)
+                if pending is False:
+                    break
+            if pending is None:
+                indices = iter([frame[3] for frame in frames])
+                yield self._build(lambda node: node.families[next(indices)])
+            # Возврат: следующее семейство в последнем кадре, где оно есть
+            while frames:
+                pending = self._next_family(frames[-1])
+                if pending is not False:
+                    break
+                frames.pop()
+            else:
+                return
+
+    @staticmethod
+    def _next_family(frame):
+        """
+        Переводит кадр trees на следующее допустимое семейство узла.
+
+        Возвращает
+        ----------
+            Ожидающие узлы после выбора (None - больше нечего разворачивать)
+            или False, если семейства узла исчерпаны.
+        """
+        node, ancestors, rest, index = frame
+        families = node.families
+        if ancestors is not None and not node.intermediate:
+            ancestors = ancestors | {id(node)}
+        for index in range(index + 1, len(families)):
+            _, left, right = families[index]
+            if ancestors is not None and any(child is not None and id(child) in ancestors for child in (left, right)):
+                continue
+            frame[3] = index
+            # Порядок совпадает с порядком вызовов choose в _build: сначала
+            # промежуточный узел левой части, затем дети слева направо
+            pending = rest
+            if right is not None:
+                pending = (right, ancestors, pending)
+            if left is not None:
+                pending = (left, ancestors, pending)
+            return pending
+        return False
+
+
+def format_tree(tree):
+    """
+    Форматирует дерево разбора в скобочную запись ``(S (NP John) (VP sleeps))``.
+
+    Параметры
+    ----------
+        tree: Дерево из ParseForest.
+
+    Возвращает
+    ----------
+        str: Скобочная запись.
+    """
+    parts = []
+    # None в стеке - закрывающая скобка поддерева
+    stack = [tree]
+    while stack:
+        item = stack.pop()
+        if item is None:
+            parts.append(')')
+            continue
+        if parts:
+            parts.append(' ')
+        if isinstance(item, str):
+            parts.append(item)
+            continue
+        parts.append('(' + item[0])
+        stack.append(None)
+        stack.extend(reversed(item[1:]))
+    return ''.join(parts)
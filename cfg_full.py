@@ -1,13 +1,23 @@
 import random
 import logging
+import math
+import re
 import time
 
-# Настройка логирования
-logging.basicConfig(
-    filename='cfg_generations.log',
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
+import cfg_cache
+from cfg_counting import DerivationCounts
+from cfg_enumerate import SentenceEnumerator
+from cfg_earley import EarleyRecognizer, IncrementalRecognizer
+from cfg_forest import build_forest
+from cfg_grammar import alias_table, compile_grammar
+from cfg_lexer import Lexer
+from cfg_logging import events, logger
+from cfg_metrics import Metrics
+from cfg_parallel import generate_many
+from cfg_profile import profile_derive, profile_recognize
+
+# Необязательный вес альтернативы в конце продукции: "Предл Сообщение [0.25]"
+WEIGHT_PATTERN = re.compile(r'^(.*?)\s*\[\s*([-+]?[0-9]*\.?[0-9]+(?:[eE][-+]?[0-9]+)?)\s*\]$')
 
 class CFG:
     """
@@ -20,9 +30,13 @@ class CFG:
     ----------
         rules (dict) : Словарь правил продукции, где ключи - нетерминалы, 
                       а значения - списки возможных преобразований.
+        weights (dict): Веса альтернатив для нетерминалов, у которых они указаны
+                      в файле правил (``{нетерминал: [вес, ...]}``).
         terminals (set): Множество терминалов грамматики.
         variables (set): Множество нетерминалов грамматики.
         start_variable (str): Стартовый символ (нетерминал) для генерации строк.
+        grammar (CompiledGrammar): Скомпилированная грамматика, на которой работают
+                      генератор и распознаватель.
         max_depth (int): Максимальная глубина рекурсии при генерации строк.
         max_length (int): Максимальная длина генерируемой строки.
         end_symbol (str): Символ, добавляемый в конец генерируемой строки.
@@ -30,6 +44,9 @@ class CFG:
         generation_steps (int): Количество шагов, выполненных во время генерации.
         validation_steps (int): Количество шагов, выполненных при проверке строки.
         comment (str): Комментарий из файла правил.
+        metrics (Metrics): Счетчики и гистограммы задержек генерации и проверки.
+        normalization (NormalizationMap): Соответствие с исходной грамматикой, если
+                      объект построен функцией cfg_normalize.normalize, иначе None.
 
     Методы
     ----------
@@ -43,7 +60,7 @@ class CFG:
         cfg.generate()
     """
     
-    def __init__(self, rules_file, max_depth=10):
+    def __init__(self, rules_file, max_depth=10, cache=True, cache_dir=None):
         """
         Инициализирует объект CFG, загружая правила из указанного файла.
 
@@ -51,42 +68,228 @@ class CFG:
         ----------
             rules_file (str): Путь к файлу с правилами.
             max_depth (int): Максимальная глубина рекурсии (по умолчанию 10).
+            cache (bool): Использовать кэш скомпилированной грамматики (по умолчанию True).
+            cache_dir (str): Каталог кэша; None - ``__cfgcache__`` рядом с файлом правил (по умолчанию None).
+        """
+        self._init_state(max_depth)
+        self.load_rules(rules_file, cache=cache, cache_dir=cache_dir)
+        self.comment = ''
+        logger.info('CFG initialized with rules from %s', rules_file)
+
+    def _init_state(self, max_depth):
+        """
+        Задает начальные значения атрибутов объекта.
+
+        Параметры
+        ----------
+            max_depth (int): Максимальная глубина рекурсии.
         """
         self.rules = {}
+        self.weights = {}
         self.terminals = set()
         self.variables = set()
         self.start_variable = None
+        self.grammar = None
+        self._recognizer = None
+        self._plans = None
+        self._plans_key = None
+        self._plan_pids = None
+        self._counts = None
+        self._batch_sampler = None
+        self._enumerator = None
+        self._lexer = None
+        self.normalization = None
+        self.metrics = Metrics()
+        self.profiler = None
         self.max_depth = max_depth
         self.max_length = 50
         self.end_symbol = '.'
-        self.load_rules(rules_file)
         self.generate_counter = 0
         self.generation_steps = 0
         self.validation_steps = 0
         self.comment = ''
-        logging.info('CFG initialized with rules from %s', rules_file)
 
-    def load_rules(self, rules_file):
+    @classmethod
+    def from_grammar(cls, grammar, max_depth=10, max_length=50, end_symbol='.'):
+        """
+        Создает объект CFG из уже скомпилированной грамматики без чтения файла.
+
+        Словарь правил восстанавливается по грамматике; терминалами считаются
+        все терминальные символы, встречающиеся в продукциях.
+
+        Параметры
+        ----------
+            grammar (CompiledGrammar): Скомпилированная грамматика.
+            max_depth (int): Максимальная глубина рекурсии (по умолчанию 10).
+            max_length (int): Максимальная длина генерируемой строки (по умолчанию 50).
+            end_symbol (str): Символ окончания строки (по умолчанию '.').
+
+        Возвращает
+        ----------
+            CFG: Новый объект грамматики.
+        """
+        cfg = cls.__new__(cls)
+        cfg._init_state(max_depth)
+        cfg.max_length = max_length
+        cfg.end_symbol = end_symbol
+        symbols = grammar.symbols
+        cfg.rules = {symbols[nt]: [grammar.production_text(pid) for pid in grammar.by_lhs[nt]]
+                     for nt in grammar.nonterminals}
+        cfg.weights = {symbols[nt]: [grammar.productions[pid].weight for pid in grammar.by_lhs[nt]]
+                       for nt in grammar.nonterminals
+                       if any(grammar.productions[pid].weight != 1.0 for pid in grammar.by_lhs[nt])}
+        cfg.terminals = {name for name, terminal in zip(symbols, grammar.is_terminal) if terminal}
+        cfg.variables = set(cfg.rules)
+        cfg.start_variable = symbols[grammar.start] if grammar.start >= 0 else None
+        cfg._set_grammar(grammar)
+        return cfg
+
+    @classmethod
+    def from_data(cls, data, rules_file, max_depth=10, cache=True, cache_dir=None):
+        """
+        Создает объект CFG из уже прочитанного содержимого файла правил.
+
+        Нужен, когда хэш содержимого вычисляется снаружи (GrammarRegistry):
+        грамматика разбирается из тех же байтов, что были хэшированы, даже
+        если файл успели изменить.
+
+        Параметры
+        ----------
+            data (bytes): Содержимое файла правил.
+            rules_file (str): Путь к файлу (для кэша и сообщений).
+            max_depth (int): Максимальная глубина рекурсии (по умолчанию 10).
+            cache (bool): Использовать кэш скомпилированной грамматики (по умолчанию True).
+            cache_dir (str): Каталог кэша; None - ``__cfgcache__`` рядом с файлом правил (по умолчанию None).
+
+        Возвращает
+        ----------
+            CFG: Новый объект грамматики.
+        """
+        cfg = cls.__new__(cls)
+        cfg._init_state(max_depth)
+        cfg._load_data(data, rules_file, cache, cache_dir)
+        cfg.comment = ''
+        logger.info('CFG initialized with rules from %s', rules_file)
+        return cfg
+
+    def _add_alternatives(self, non_terminal, right):
+        """
+        Разбирает правую часть правила и сохраняет альтернативы и их веса.
+
+        Параметры
+        ----------
+            non_terminal (str): Левая часть правила.
+            right (str): Правая часть правила (альтернативы через ``|``).
+
+        Исключения
+        ----------
+            ValueError: Если вес альтернативы не положителен.
+        """
+        transformations = []
+        weights = []
+        for alternative in right.split('|'):
+            alternative = alternative.strip()
+            weight = 1.0
+            match = WEIGHT_PATTERN.match(alternative)
+            if match:
+                alternative, weight = match.group(1), float(match.group(2))
+                if weight <= 0:
+                    raise ValueError(f'Вес альтернативы {alternative!r} для {non_terminal} должен быть положительным.')
+            transformations.append(alternative)
+            weights.append(weight)
+        self.rules[non_terminal] = transformations
+        if any(weight != 1.0 for weight in weights):
+            self.weights[non_terminal] = weights
+        else:
+            self.weights.pop(non_terminal, None)
+
+    def _set_grammar(self, grammar):
+        """
+        Устанавливает скомпилированную грамматику и сбрасывает зависящие от нее кэши.
+
+        Параметры
+        ----------
+            grammar (CompiledGrammar): Скомпилированная грамматика.
+        """
+        self.grammar = grammar
+        # Распознаватель строится при первой проверке: процессам, которые только
+        # генерируют строки, он не нужен
+        self._recognizer = None
+        self._plans = None
+        self._plans_key = None
+        self._counts = None
+        self._enumerator = None
+        self._lexer = None
+
+    def load_rules(self, rules_file, cache=True, cache_dir=None):
         """
         Загружает правила из указанного файла.
 
+        Если для текущего содержимого файла есть кэш скомпилированной
+        грамматики (см. cfg_cache), файл не разбирается, а грамматика и
+        настройки восстанавливаются из кэша; иначе кэш создается после разбора.
+
         Параметры
         ----------
             rules_file (str): Путь к файлу с правилами.
+            cache (bool): Использовать кэш скомпилированной грамматики (по умолчанию True).
+            cache_dir (str): Каталог кэша; None - ``__cfgcache__`` рядом с файлом правил (по умолчанию None).
+
+        Альтернативы в секциях Pn и Pt могут иметь необязательный вес в
+        квадратных скобках: ``Сообщение -> Предл [0.7] | Ошибка [0.05]``.
+        Альтернативы без веса получают вес 1.
 
         Исключения
         ----------
-            ValueError: Если в файле отсутствуют правила продукции (Pn).
+            ValueError: Если в файле отсутствуют правила продукции (Pn)
+                        или вес альтернативы не положителен.
+        """
+        with open(rules_file, 'rb') as f:
+            data = f.read()
+        self._load_data(data, rules_file, cache, cache_dir)
+
+    def _load_data(self, data, rules_file, cache, cache_dir):
+        """
+        Загружает правила из содержимого файла (через кэш, если он включен).
+
+        Параметры
+        ----------
+            data (bytes): Содержимое файла правил.
+            rules_file (str): Путь к файлу (для кэша и сообщений).
+            cache (bool): Использовать кэш скомпилированной грамматики.
+            cache_dir (str): Каталог кэша или None.
+        """
+        if cache:
+            digest = cfg_cache.rules_digest(data)
+            path = cfg_cache.cache_path(rules_file, cache_dir)
+            state = cfg_cache.load(path, digest)
+            if state is not None:
+                self._restore_cache_state(state)
+                logger.info('Loaded compiled grammar for %s from cache %s', rules_file, path)
+                return
+
+        self._parse_rules(data.decode('utf-8').splitlines(), rules_file)
+
+        if cache:
+            try:
+                cfg_cache.store(path, digest, self._cache_state())
+            except OSError as exc:
+                logger.warning('Could not write grammar cache %s: %s', path, exc)
+
+    def _parse_rules(self, lines, rules_file):
         """
-        with open(rules_file, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
+        Разбирает строки файла правил и компилирует грамматику.
 
+        Параметры
+        ----------
+            lines (list): Строки файла правил.
+            rules_file (str): Путь к файлу (для сообщений).
+        """
         section = None
         for line in lines:
             line = line.strip()
             if not line or line.startswith('#'):
                 self.comment = line
-                print(self.comment)    
                 continue
             
             if line.startswith('env:'):
@@ -115,8 +318,7 @@ class CFG:
                 # Парсинг правил для нетерминалов
                 left, right = line.split('->')
                 non_terminal = left.strip()
-                transformations = [r.strip() for r in right.split('|')]
-                self.rules[non_terminal] = transformations
+                self._add_alternatives(non_terminal, right)
                 if self.start_variable is None:
                     self.start_variable = non_terminal  # Первый нетерминал становится стартовым
 
@@ -124,20 +326,20 @@ class CFG:
                 # Парсинг правил для терминалов
                 left, right = line.split('->')
                 terminal = left.strip()
-                self.rules[terminal] = [r.strip() for r in right.split('|')]
+                self._add_alternatives(terminal, right)
 
             elif section == 'env':
                 # Извлечение стартового символа, максимальной длины и символа окончания из секции env
                 parts = line[4:].strip().split('|')
                 if len(parts) > 0:
                     self.start_variable = parts[0].strip() if parts[0] else None
-                    print(f"Start symbol from env: {self.start_variable}")
+                    logger.debug('Start symbol from env: %s', self.start_variable)
                 if len(parts) > 1:
                     self.max_length = int(parts[1].strip()) if parts[1] else 50
-                    print(f"Max length from env: {self.max_length}")
+                    logger.debug('Max length from env: %s', self.max_length)
                 if len(parts) > 2:
                     self.end_symbol = parts[2].strip() if parts[2] else '.'
-                    print(f"End symbol from env: {self.end_symbol}")
+                    logger.debug('End symbol from env: %s', self.end_symbol)
                 continue
 
         # Проверка наличия правил Pn и Pt
@@ -145,85 +347,425 @@ class CFG:
             raise ValueError(f'В файле {rules_file} отсутствуют правила продукции (Pn).')
 
         if section == 'Pt' and not self.rules.get('Pt'):
-            logging.warning(f'В файле {rules_file} отсутствуют правила для терминалов (Pt).')
+            logger.warning(f'В файле {rules_file} отсутствуют правила для терминалов (Pt).')
+
+        self._set_grammar(compile_grammar(self.rules, self.start_variable, self.terminals, self.weights))
+
+        # Логирование загруженных правил (полный словарь - только на уровне DEBUG)
+        logger.info('Loaded %d productions, %d terminals, %d variables',
+                    len(self.grammar.productions), len(self.terminals), len(self.variables))
+        logger.debug('Loaded rules: %s', self.rules)
 
-        # Логирование загруженных правил
-        logging.info('Loaded rules: %s', self.rules)
-        logging.info('Terminals: %s', self.terminals)
-        logging.info('Variables: %s', self.variables)
+    def _cache_state(self):
+        """
+        Возвращает состояние, сохраняемое в кэше грамматики.
+        """
+        return {
+            'grammar': cfg_cache.dump_grammar(self.grammar),
+            'rules': self.rules,
+            'weights': self.weights,
+            'terminals': frozenset(self.terminals),
+            'variables': frozenset(self.variables),
+            'start_variable': self.start_variable,
+            'max_length': self.max_length,
+            'end_symbol': self.end_symbol,
+            'comment': self.comment,
+        }
+
+    def _restore_cache_state(self, state):
+        """
+        Восстанавливает объект из состояния, сохраненного _cache_state.
 
-    def generate(self, symbol=None, depth=0):
+        Параметры
+        ----------
+            state (dict): Состояние из кэша.
+        """
+        self.rules = state['rules']
+        self.weights = state['weights']
+        self.terminals = set(state['terminals'])
+        self.variables = set(state['variables'])
+        self.start_variable = state['start_variable']
+        self.max_length = state['max_length']
+        self.end_symbol = state['end_symbol']
+        self.comment = state['comment']
+        self._set_grammar(cfg_cache.load_grammar(state['grammar']))
+
+    def generate(self, symbol=None, depth=0, length=None):
         """
         Генерирует строку, начиная с указанного символа.
 
+        Продукции выбираются только среди тех, что еще могут завершиться в
+        пределах оставшейся глубины (max_depth) и длины (max_length), поэтому
+        строка получается с первой попытки и не обрезается.
+
+        Если задана длина ``length``, строка ровно из ``length`` токенов
+        выбирается равновероятно среди всех выводов этой длины (для однозначной
+        грамматики - среди всех строк языка этой длины); max_depth и max_length
+        в этом режиме не применяются. Таблица числа выводов строится лениво до
+        наибольшей запрошенной длины и хранится в объекте.
+
         Параметры
         ----------
             symbol (str): Символ, с которого начинать генерацию (по умолчанию None).
             depth (int): Текущая глубина рекурсии (по умолчанию 0).
+            length (int): Точная длина строки в токенах; строка выбирается
+                равновероятно (по умолчанию None).
 
         Возвращает
         ----------
             tuple: Сгенерированная строка, количество попыток генерации, общее время генерации и количество шагов генерации.
+
+        Исключения
+        ----------
+            ValueError: Если из символа нельзя вывести строку в пределах max_depth и max_length
+                        или строк длины length нет.
         """
         if symbol is None:
             symbol = self.start_variable
+        symbol = self.grammar.symbol_id(symbol)
 
-        start_time = time.time()
-        result = ''
+        start_time = time.perf_counter()
         self.generation_steps = 0
-        while True:  
-            single_gen_start_time = time.time()
-            self.generate_counter += 1
-            logging.info('Generate attempt: %d', self.generate_counter)
-            result = self._generate_recursive(symbol, depth)
-            single_gen_end_time = time.time()
-
-            logging.info('Time taken for counter %d: %.6f seconds, Steps: %d', 
-                         self.generate_counter, single_gen_end_time - single_gen_start_time, self.generation_steps)
-
-            if len(result) < self.max_length:
-                logging.info('Generated valid string: %s', result)
-                total_gen_time = time.time() - start_time
-                logging.info('Total time taken for all counters: %.6f seconds', total_gen_time)
-                return (result + self.end_symbol), self.generate_counter, total_gen_time, self.generation_steps
-            else:
-                logging.warning('Generated string is too long (%d characters): %s', len(result), result)
+        self.generate_counter += 1
+        result = self._produce(symbol, depth, length)
+        total_gen_time = time.perf_counter() - start_time
+
+        self.metrics.record_generation(total_gen_time, self.generation_steps)
+        if events.isEnabledFor(logging.INFO):
+            events.info('Generate attempt %d: %.6f seconds, Steps: %d, String: %s',
+                        self.generate_counter, total_gen_time, self.generation_steps, result)
+        return (result + self.end_symbol), self.generate_counter, total_gen_time, self.generation_steps
+
+    def generate_many(self, n, workers=1, seed=None, ordered=True, length=None, batch_size=256):
+        """
+        Генерирует ``n`` строк, распределяя работу между процессами.
 
-    def _generate_recursive(self, symbol, depth):
+        Каждый процесс получает скомпилированную грамматику один раз при
+        запуске и свой независимый генератор случайных чисел, выведенный из
+        ``seed``. Строка с номером ``i`` принадлежит потоку ``i % workers``,
+        поэтому при одинаковых ``seed`` и ``workers`` корпус всегда одинаков.
+        Строки учитываются в ``metrics`` и ``generate_counter``, как в generate;
+        при нескольких процессах - по мере того, как процессы заканчивают работу.
+
+        Параметры
+        ----------
+            n (int): Количество строк.
+            workers (int): Количество процессов; при 1 генерация идет в текущем процессе (по умолчанию 1).
+            seed (int): Начальное значение генераторов; None - случайное (по умолчанию None).
+            ordered (bool): Возвращать строки в порядке номеров; иначе по мере готовности (по умолчанию True).
+            length (int): Точная длина строк в токенах; строки выбираются
+                равновероятно, как в generate (по умолчанию None).
+            batch_size (int): Количество строк, передаваемых из процесса за раз (по умолчанию 256).
+
+        Возвращает
+        ----------
+            iterator: Итератор по сгенерированным строкам (с символом окончания).
+        """
+        return generate_many(self, n, workers=workers, seed=seed, ordered=ordered,
+                             length=length, batch_size=batch_size)
+
+    def generate_batch(self, n, seed=None, chunk_size=4096):
         """
-        Рекурсивно генерирует строку на основе указанного символа.
+        Генерирует ``n`` строк векторизованно (требуется NumPy).
+
+        Выводы разворачиваются синхронно пачками по ``chunk_size``: на каждом
+        шаге выбор продукций для всех выводов пачки делается одним вызовом
+        NumPy. Порядок развертывания и отсечение продукций по max_depth и
+        max_length те же, что в generate, поэтому строки имеют то же
+        распределение (но другую последовательность при том же seed).
 
         Параметры
         ----------
-            symbol (str): Символ, который необходимо развернуть.
-            depth (int): Текущая глубина рекурсии.
+            n (int): Количество строк.
+            seed (int): Начальное значение генератора; None - случайное (по умолчанию None).
+            chunk_size (int): Количество синхронно разворачиваемых выводов (по умолчанию 4096).
+
+        Возвращает
+        ----------
+            list: Сгенерированные строки (с символом окончания).
+
+        Исключения
+        ----------
+            ImportError: Если NumPy не установлен.
+        """
+        if self._batch_sampler is None:
+            # NumPy - необязательная зависимость: импортируется только здесь
+            from cfg_vectorized import BatchSampler
+            self._batch_sampler = BatchSampler(self)
+        start_time = time.perf_counter()
+        end_symbol = self.end_symbol
+        result = [string + end_symbol for string in self._batch_sampler.sample(n, seed, chunk_size)]
+        self.metrics.record_batch(n)
+        logger.info('Generated batch of %d strings in %.6f seconds', n, time.perf_counter() - start_time)
+        return result
+
+    def _produce(self, symbol, depth, length, rng=random):
+        """
+        Строит одну строку (без символа окончания) выбранным способом.
+
+        Параметры
+        ----------
+            symbol (int): Идентификатор стартового символа.
+            depth (int): Начальная глубина.
+            length (int): Точная длина в токенах или None.
+            rng: Источник случайных чисел с методом ``randrange`` (по умолчанию модуль random).
+
+        Возвращает
+        ----------
+            str: Сгенерированная строка.
+        """
+        if length is None:
+            if self.profiler is not None:
+                return profile_derive(self, symbol, depth, rng, self.profiler)
+            return self._derive(symbol, depth, rng)
+        return self._sample_uniform(symbol, length, rng)
+
+    def _derive(self, symbol, depth, rng=random, hooks=None):
+        """
+        Строит один вывод из указанного символа без рекурсии.
+
+        Обход идет в глубину по явному стеку, слева направо; токены собираются
+        в список и склеиваются один раз в конце. В ``reserve`` хранится
+        минимальная ширина, которую уже гарантированно займет строка (выведенные
+        токены плюс минимумы еще не развернутых символов при их оставшейся
+        глубине). Продукция допустима, если после ее выбора ``reserve`` не
+        превышает max_length; если допустимы все продукции, выбор совпадает с
+        равновероятным выбором без ограничений.
+
+        Параметры
+        ----------
+            symbol (int): Идентификатор символа, который необходимо развернуть.
+            depth (int): Начальная глубина.
+            rng: Источник случайных чисел с методом ``randrange`` (по умолчанию модуль random).
+            hooks: Обработчик событий вывода (профилировщик cfg_profile) или None.
+                ``hooks.enter(symbol, budget, index, slack, start)`` вызывается после выбора
+                продукции и возвращает кадр, который кладется в стек под ее правую часть;
+                ``hooks.leave(frame)`` - когда поддерево построено (по умолчанию None).
 
         Возвращает
         ----------
             str: Сгенерированная строка для данного символа.
+
+        Исключения
+        ----------
+            ValueError: Если из символа нельзя вывести строку в пределах max_depth и max_length.
+        """
+        budget = self.max_depth - depth
+        # Ширина строки на единицу больше ее длины, а длина должна быть < max_length
+        limit = self.max_length
+        table, choices = self._derivation_plans()
+        if budget < 0 or table[budget][symbol] > limit:
+            raise ValueError(f'Из символа {self.grammar.symbols[symbol]!r} нельзя вывести строку '
+                             f'глубиной до {self.max_depth} и длиной меньше {self.max_length}.')
+        if self.grammar.is_terminal[symbol]:
+            self.generation_steps += 1
+            return self.grammar.symbols[symbol]
+
+        randrange = rng.randrange
+        uniform = rng.random
+        reserve = table[budget][symbol]
+        out = []
+        steps = 0
+        # Элементы стека: str - терминал, tuple - нетерминал с оставшейся глубиной
+        stack = [(symbol, budget)]
+        pop = stack.pop
+        push = stack.append
+        while stack:
+            item = pop()
+            if type(item) is str:
+                steps += 1
+                out.append(item)
+                continue
+
+            if hooks is not None:
+                if type(item) is not tuple:
+                    # Кадр обработчика: поддерево нетерминала построено
+                    hooks.leave(item)
+                    continue
+                started = hooks.clock()
+
+            symbol, budget = item
+            steps += 1
+            plans, extras, max_extra, alias = choices[budget][symbol]
+            slack = limit - reserve
+            if max_extra <= slack:
+                index = randrange(len(plans))
+                if alias is not None and uniform() >= alias[0][index]:
+                    index = alias[1][index]
+            else:
+                feasible = [i for i, extra in enumerate(extras) if extra <= slack]
+                if alias is None:
+                    index = feasible[randrange(len(feasible))]
+                else:
+                    weights = alias[2]
+                    r = uniform() * sum(weights[i] for i in feasible)
+                    for index in feasible:
+                        r -= weights[index]
+                        if r < 0:
+                            break
+            if hooks is not None:
+                push(hooks.enter(symbol, budget, index, slack, started))
+            reserve += extras[index]
+            budget -= 1
+            for sym in reversed(plans[index]):
+                push(sym if type(sym) is str else (sym, budget))
+
+        self.generation_steps += steps
+        return ' '.join(out)
+
+    def _sample_uniform(self, symbol, length, rng=random):
+        """
+        Выбирает строку заданной длины по таблице числа выводов.
+
+        Параметры
+        ----------
+            symbol (int): Идентификатор символа.
+            length (int): Длина строки в токенах.
+            rng: Источник случайных чисел с методом ``randrange`` (по умолчанию модуль random).
+
+        Возвращает
+        ----------
+            str: Сгенерированная строка.
         """
-        self.generation_steps += 1
-        if depth > self.max_depth:
-            return ''
-        if symbol in self.terminals:
-            return symbol
+        if self._counts is None:
+            self._counts = DerivationCounts(self.grammar)
+        tokens, steps = self._counts.sample(symbol, length, rng)
+        self.generation_steps += steps
+        symbols = self.grammar.symbols
+        return ' '.join([symbols[sym] for sym in tokens])
+
+    def _derivation_plans(self):
+        """
+        Возвращает подготовленные для генератора таблицы.
+
+        Для каждой оставшейся глубины ``r`` от 0 до max_depth и каждого
+        нетерминала хранится четверка ``(plans, extras, max_extra, alias)``:
+        правые части продукций, способных завершиться за ``r`` уровней (терминалы
+        уже заменены своими строками, нетерминалы оставлены идентификаторами),
+        прирост минимальной ширины при выборе каждой из них, наибольший такой
+        прирост и таблица псевдонимов ``(prob, alias, weights)`` для выбора по
+        весам (None, если веса альтернатив равны).
 
-        if symbol in self.rules:
-            productions = self.rules[symbol]
-            chosen_index = random.randint(0, len(productions) - 1)
-            chosen_production = productions[chosen_index]
-            print(f"{symbol} -> {chosen_production} (choice index: {chosen_index})")
-            result = ''
-            for sym in chosen_production.split():
-                result += self._generate_recursive(sym, depth + 1) + ' '
-            return result.strip()  # Убираем лишний пробел в конце
+        Возвращает
+        ----------
+            tuple: Таблица минимальных ширин (CompiledGrammar.min_width_table)
+                и таблица вариантов по глубинам.
+        """
+        key = (self.grammar, self.max_depth)
+        if self._plans is None or self._plans_key != key:
+            grammar = self.grammar
+            symbols = grammar.symbols
+            is_terminal = grammar.is_terminal
+            table = grammar.min_width_table(self.max_depth)
+            choices = [{}]
+            # Номера продукций вариантов - для профилировщика (cfg_profile)
+            plan_pids = [{}]
+            for budget in range(1, self.max_depth + 1):
+                below = table[budget - 1]
+                level = {}
+                level_pids = {}
+                for nt in grammar.nonterminals:
+                    best = table[budget][nt]
+                    plans = []
+                    extras = []
+                    weights = []
+                    pids = []
+                    for pid in grammar.by_lhs[nt]:
+                        rhs = grammar.productions[pid].rhs
+                        cost = sum(below[sym] for sym in rhs)
+                        if cost == math.inf:
+                            continue
+                        plans.append(tuple(symbols[sym] if is_terminal[sym] else sym for sym in rhs))
+                        extras.append(cost - best)
+                        weights.append(grammar.productions[pid].weight)
+                        pids.append(pid)
+                    if plans:
+                        alias = None
+                        if len(set(weights)) > 1:
+                            alias = alias_table(weights) + (tuple(weights),)
+                        level[nt] = (tuple(plans), tuple(extras), max(extras), alias)
+                        level_pids[nt] = tuple(pids)
+                choices.append(level)
+                plan_pids.append(level_pids)
+            # На нулевой глубине допустимы только пустые продукции
+            for nt in grammar.nonterminals:
+                if table[0][nt] == 0:
+                    choices[0][nt] = (((),), (0,), 0, None)
+                    plan_pids[0][nt] = (next(pid for pid in grammar.by_lhs[nt] if not grammar.productions[pid].rhs),)
+            self._plan_pids = plan_pids
+            self._plans = (table, choices)
+            self._plans_key = key
+        return self._plans
+
+    def enumerate(self, max_tokens):
+        """
+        Лениво перечисляет все различные предложения языка длиной до
+        ``max_tokens`` токенов.
 
-        return ''
+        Предложения выдаются по возрастанию длины, внутри одной длины - в
+        лексикографическом порядке имен терминалов; каждое предложение ровно
+        один раз, даже если у него несколько выводов или несколько разбиений
+        на многословные терминалы (тогда его длина - длина самого короткого
+        разбиения). Память ограничена
+        наборами ситуаций одного префикса, поэтому перечисление подходит и для
+        рекурсивных грамматик с большим числом предложений.
+
+        Параметры
+        ----------
+            max_tokens (int): Наибольшая длина предложения в токенах.
+
+        Возвращает
+        ----------
+            iterator: Предложения (с символом окончания).
+        """
+        if self._enumerator is None:
+            self._enumerator = SentenceEnumerator(self.grammar)
+        symbols = self.grammar.symbols
+        end_symbol = self.end_symbol
+        for tokens in self._enumerator.sentences(max_tokens):
+            yield ' '.join(symbols[sym] for sym in tokens) + end_symbol
+
+    def count(self, max_tokens):
+        """
+        Считает выводы и различные предложения длиной до ``max_tokens`` токенов.
+
+        Число выводов берется из таблицы DerivationCounts без построения строк;
+        различные предложения таблицей не считаются: они перебираются обходом
+        всего языка до ``max_tokens`` (как в enumerate) без сохранения, и время
+        пропорционально числу предложений. Для однозначной грамматики оба числа
+        совпадают.
+
+        Параметры
+        ----------
+            max_tokens (int): Наибольшая длина предложения в токенах.
+
+        Возвращает
+        ----------
+            tuple: Количество выводов и количество различных предложений.
+
+        Исключения
+        ----------
+            ValueError: Если число выводов бесконечно (циклы из цепных или пустых продукций).
+        """
+        if self._counts is None:
+            self._counts = DerivationCounts(self.grammar)
+        start = self.grammar.start
+        derivations = sum(self._counts.count(start, length) for length in range(max_tokens + 1)) if start >= 0 else 0
+        if self._enumerator is None:
+            self._enumerator = SentenceEnumerator(self.grammar)
+        return derivations, self._enumerator.count_by_enumeration(max_tokens)
 
     def is_valid_string(self, string):
         """
         Проверяет, является ли указанная строка допустимой согласно грамматике.
 
+        Строка разбивается на токены по пробелам (символ окончания, если он есть,
+        отбрасывается) и проверяется табличным распознавателем Эрли. Если у
+        грамматики есть многословные терминалы, распознавателю передаются все
+        разбиения строки на терминалы (решетка токенов), и строка допустима,
+        если выводится хотя бы одно из них.
+        Количество построенных ситуаций сохраняется в validation_steps.
+
         Параметры
         ----------
             string (str): Строка, которую необходимо проверить.
@@ -233,69 +775,104 @@ class CFG:
             bool: True, если строка допустима, иначе False.
         """
         self.validation_steps = 0
-        start_time = time.time()
-        valid = self._match(self.start_variable, string, max_depth=len(string) + 10)
-        end_time = time.time()
-        logging.info('Checking validity of string: %s - %s', string, valid)
-        logging.info('Time taken for validation: %.6f seconds, Steps: %d', end_time - start_time, self.validation_steps)
+        start_time = time.perf_counter()
+        if self._recognizer is None:
+            self._recognizer = EarleyRecognizer(self.grammar)
+        if self.profiler is None:
+            valid = self._recognize(string)
+        else:
+            valid = profile_recognize(self._recognizer, lambda hooks: self._recognize(string, hooks), self.profiler)
+        self.validation_steps = self._recognizer.items
+        elapsed = time.perf_counter() - start_time
+        self.metrics.record_validation(elapsed, self.validation_steps, valid)
+        if events.isEnabledFor(logging.INFO):
+            events.info('Checking validity of string: %s - %s, %.6f seconds, Steps: %d',
+                        string, valid, elapsed, self.validation_steps)
         return valid
 
-    def _match(self, variable, string, max_depth):
+    def parse(self, string):
         """
-        Проверяет, соответствует ли строка указанной переменной грамматике.
+        Строит разделяемый упакованный лес всех разборов строки.
+
+        Лес хранит общие поддеревья один раз, поэтому даже экспоненциальное
+        число разборов неоднозначной грамматики занимает полиномиальную память.
+        Число разборов, первое и случайное дерево доступны без перебора всех
+        деревьев (см. ParseForest).
 
         Параметры
         ----------
-            variable (str): Нетерминал, который необходимо проверить.
-            string (str): Строка, которую необходимо проверить.
-            max_depth (int): Максимальная глубина рекурсии.
+            string (str): Строка для разбора; как и в is_valid_string, в лес
+                попадают разборы всех разбиений строки на терминалы.
 
         Возвращает
         ----------
-            bool: True, если строка соответствует переменной, иначе False.
+            ParseForest: Лес разбора или None, если строка не принадлежит языку.
         """
-        self.validation_steps += 1
-        if max_depth <= 0:
-            return False
-            
-        if variable not in self.rules:
-            return variable == string
+        if self._recognizer is None:
+            self._recognizer = EarleyRecognizer(self.grammar)
+        return build_forest(self._recognizer, self._get_lexer().lattice(self._strip_end(string)))
+
+    def recognizer(self):
+        """
+        Создает потоковый распознаватель для проверки строки по одному слову.
+
+        После каждого ``feed(word)`` распознаватель сообщает, можно ли еще
+        дополнить префикс до предложения (``viable``), является ли он уже
+        предложением (``complete``), и какие слова допустимы следующими
+        (``expected()``). Состояние переносится между словами, префикс заново
+        не разбирается. Многословные терминалы распознаются тем же лексером,
+        что и в is_valid_string, поэтому принимаются те же строки.
 
-        for production in self.rules[variable]:
-            if self._match_production(production, string, max_depth - 1):
-                return True
-        return False
+        Возвращает
+        ----------
+            IncrementalRecognizer: Новый распознаватель в начальном состоянии.
+        """
+        if self._recognizer is None:
+            self._recognizer = EarleyRecognizer(self.grammar)
+        return IncrementalRecognizer(self._recognizer, self._get_lexer())
 
-    def _match_production(self, production, string, max_depth):
+    def _recognize(self, string, hooks=None):
         """
-        Проверяет, соответствует ли часть строки указанному производству.
+        Проверяет строку распознавателем Эрли.
+
+        Для грамматик без многословных терминалов разбиение строки на токены
+        однозначно, и проверяется одна последовательность токенов; иначе -
+        решетка всех разбиений.
 
         Параметры
         ----------
-            production (str): Производство, которое необходимо проверить.
-            string (str): Строка, которую необходимо проверить.
-            max_depth (int): Максимальная глубина рекурсии.
+            string (str): Строка для проверки.
+            hooks: Обработчик событий распознавателя (cfg_profile) или None.
 
         Возвращает
         ----------
-            bool: True, если часть строки соответствует производству, иначе False.
+            bool: True, если строка допустима.
         """
-        self.validation_steps += 1
-        if not production and not string:
-            return True
-        if not production or not string:
-            return False
+        lexer = self._get_lexer()
+        text = self._strip_end(string)
+        if lexer.max_units <= 1:
+            return self._recognizer.recognize(lexer.tokenize(text), hooks)
+        return self._recognizer.recognize_lattice(lexer.lattice(text), hooks)
 
-        first_symbol = production.split()[0]
-        if first_symbol in self.variables:
-            for i in range(1, len(string) + 1):
-                if self._match(first_symbol, string[:i], max_depth - 1) and self._match_production(production[len(first_symbol):], string[i:], max_depth - 1):
-                    return True
-        else:
-            if string.startswith(first_symbol):
-                return self._match_production(production[len(first_symbol):], string[len(first_symbol):], max_depth - 1)
-        
-        return False
+    def _strip_end(self, string):
+        """
+        Отбрасывает пробелы по краям и символ окончания строки.
+        """
+        string = string.strip()
+        if self.end_symbol and string.endswith(self.end_symbol):
+            string = string[:-len(self.end_symbol)]
+        return string
+
+    def _get_lexer(self):
+        """
+        Возвращает лексер терминалов грамматики (строится при первом обращении).
+
+        Слова сопоставляются с терминалами по префиксному дереву; многословные
+        терминалы (``на стол``) становятся одним токеном.
+        """
+        if self._lexer is None:
+            self._lexer = Lexer.from_grammar(self.grammar)
+        return self._lexer
 
     def __str__(self):
         """
@@ -309,6 +886,9 @@ class CFG:
         print_lines.append("Start variable (S): {}".format(self.start_variable))
         print_lines.append("Rules (R):")
         for key, value in self.rules.items():
+            weights = self.weights.get(key)
+            if weights:
+                value = [f"{production} [{weight:g}]" for production, weight in zip(value, weights)]
             print_lines.append(f"{key} -> {' | '.join(value)}")
         return "\n".join(print_lines)
 
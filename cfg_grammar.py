@@ -0,0 +1,413 @@
+"""
+Скомпилированное представление контекстно-свободной грамматики.
+
+Символы грамматики интернируются в целочисленные идентификаторы, продукции
+хранятся как кортежи идентификаторов, а признаки терминал/нетерминал
+вычисляются один раз при компиляции. Генератор и распознаватель работают
+только с этим представлением и не разбирают строки продукций на каждом шаге.
+"""
+
+import math
+
+from cfg_lexer import Lexer
+
+
+class _Frozen:
+    """
+    Базовый класс для неизменяемых записей на ``__slots__``.
+    """
+
+    __slots__ = ()
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f'{type(self).__name__} неизменяем')
+
+    def __delattr__(self, name):
+        raise AttributeError(f'{type(self).__name__} неизменяем')
+
+
+class Production(_Frozen):
+    """
+    Продукция грамматики.
+
+    Атрибуты
+    ----------
+        pid (int): Номер продукции в грамматике.
+        lhs (int): Идентификатор нетерминала левой части.
+        rhs (tuple): Идентификаторы символов правой части.
+        weight (float): Относительный вес продукции среди альтернатив (по умолчанию 1).
+    """
+
+    __slots__ = ('pid', 'lhs', 'rhs', 'weight')
+
+    def __init__(self, pid, lhs, rhs, weight=1.0):
+        object.__setattr__(self, 'pid', pid)
+        object.__setattr__(self, 'lhs', lhs)
+        object.__setattr__(self, 'rhs', rhs)
+        object.__setattr__(self, 'weight', weight)
+
+    def __reduce__(self):
+        return (Production, (self.pid, self.lhs, self.rhs, self.weight))
+
+    def __repr__(self):
+        return f'Production(pid={self.pid}, lhs={self.lhs}, rhs={self.rhs}, weight={self.weight})'
+
+
+class CompiledGrammar(_Frozen):
+    """
+    Неизменяемая скомпилированная грамматика.
+
+    Нетерминалом считается символ, для которого есть правила продукции и который
+    не объявлен терминалом в секции ``G``. Все остальные символы, встречающиеся
+    в продукциях, - терминалы, выводящие сами себя.
+
+    Атрибуты
+    ----------
+        symbols (tuple): Имена символов; индекс в кортеже - идентификатор символа.
+        symbol_ids (dict): Отображение имени символа в его идентификатор.
+        is_terminal (tuple): Признак терминала для каждого идентификатора.
+        productions (tuple): Все продукции (объекты Production).
+        by_lhs (tuple): Номера продукций для каждого символа (пусто для терминалов).
+        nullable (tuple): Признак того, что символ выводит пустую строку.
+        start (int): Идентификатор стартового символа.
+        min_height (tuple): Минимальная глубина вывода символа до терминалов
+            (0 для терминалов, ``math.inf`` для непорождающих нетерминалов).
+        min_width (tuple): Минимальная ширина порождаемой строки.
+        max_width (tuple): Максимальная ширина порождаемой строки
+            (``math.inf`` для неограниченно рекурсивных символов).
+
+    Шириной называется сумма ``len(токен) + 1`` по всем токенам вывода, то есть
+    длина строки с разделяющими пробелами плюс один.
+    """
+
+    __slots__ = ('symbols', 'symbol_ids', 'is_terminal', 'productions', 'by_lhs', 'nullable', 'start',
+                 'min_height', 'min_width', 'max_width')
+
+    def __init__(self, symbols, is_terminal, productions, by_lhs, start):
+        object.__setattr__(self, 'symbols', tuple(symbols))
+        object.__setattr__(self, 'symbol_ids', {name: sid for sid, name in enumerate(self.symbols)})
+        object.__setattr__(self, 'is_terminal', tuple(is_terminal))
+        object.__setattr__(self, 'productions', tuple(productions))
+        object.__setattr__(self, 'by_lhs', tuple(tuple(pids) for pids in by_lhs))
+        object.__setattr__(self, 'start', start)
+        object.__setattr__(self, 'nullable', self._compute_nullable())
+        object.__setattr__(self, 'min_height', self._compute_min_height())
+        object.__setattr__(self, 'min_width', self._compute_min_width())
+        object.__setattr__(self, 'max_width', self._compute_max_width())
+
+    def __reduce__(self):
+        # Анализы передаются вместе с грамматикой, чтобы не пересчитывать их
+        # в каждом процессе, получившем грамматику
+        return (restore_grammar, (self.symbols, self.is_terminal, self.productions, self.by_lhs, self.start,
+                                  self.nullable, self.min_height, self.min_width, self.max_width))
+
+    def _compute_nullable(self):
+        """
+        Вычисляет признаки символов, из которых выводится пустая строка.
+
+        Возвращает
+        ----------
+            tuple: Признак обнуляемости для каждого идентификатора символа.
+        """
+        nullable = [False] * len(self.symbols)
+        changed = True
+        while changed:
+            changed = False
+            for production in self.productions:
+                if not nullable[production.lhs] and all(nullable[sym] for sym in production.rhs):
+                    nullable[production.lhs] = True
+                    changed = True
+        return tuple(nullable)
+
+    def _compute_min_height(self):
+        """
+        Вычисляет минимальную глубину вывода каждого символа.
+
+        Продукция с непустой правой частью требует на один уровень больше, чем
+        самый глубокий из ее символов; пустая продукция глубины не требует.
+
+        Возвращает
+        ----------
+            tuple: Минимальная глубина для каждого идентификатора символа.
+        """
+        height = [0 if terminal else math.inf for terminal in self.is_terminal]
+        changed = True
+        while changed:
+            changed = False
+            for production in self.productions:
+                rhs = production.rhs
+                candidate = 1 + max(height[sym] for sym in rhs) if rhs else 0
+                if candidate < height[production.lhs]:
+                    height[production.lhs] = candidate
+                    changed = True
+        return tuple(height)
+
+    def _terminal_widths(self):
+        """
+        Возвращает ширину терминалов (``math.inf`` для нетерминалов).
+        """
+        return [len(name) + 1 if terminal else math.inf
+                for name, terminal in zip(self.symbols, self.is_terminal)]
+
+    def _compute_min_width(self):
+        """
+        Вычисляет минимальную ширину порождаемой строки для каждого символа.
+
+        Возвращает
+        ----------
+            tuple: Минимальная ширина (``math.inf`` для непорождающих символов).
+        """
+        width = self._terminal_widths()
+        changed = True
+        while changed:
+            changed = False
+            for production in self.productions:
+                candidate = sum(width[sym] for sym in production.rhs)
+                if candidate < width[production.lhs]:
+                    width[production.lhs] = candidate
+                    changed = True
+        return tuple(width)
+
+    def _compute_max_width(self):
+        """
+        Вычисляет максимальную ширину порождаемой строки для каждого символа.
+
+        Учитываются только продукции из порождающих символов. Если ширина
+        продолжает расти после ``len(symbols)`` проходов релаксации, символ
+        лежит на рекурсивном цикле и его ширина не ограничена.
+
+        Возвращает
+        ----------
+            tuple: Максимальная ширина (``math.inf`` для неограниченных символов).
+        """
+        min_width = self.min_width
+        productive = [production for production in self.productions
+                      if all(min_width[sym] < math.inf for sym in production.rhs)]
+        width = [w if terminal else -1 for w, terminal in zip(self._terminal_widths(), self.is_terminal)]
+        for _ in range(len(self.symbols) + 1):
+            changed = False
+            for production in productive:
+                candidate = sum(width[sym] for sym in production.rhs)
+                if candidate > width[production.lhs]:
+                    width[production.lhs] = candidate
+                    changed = True
+            if not changed:
+                break
+        else:
+            # Растущие символы и все, кто от них зависит, не ограничены
+            # (без арифметики: промежуточные ширины могут быть огромными)
+            unbounded = {production.lhs for production in productive
+                         if sum(width[sym] for sym in production.rhs) > width[production.lhs]}
+            growing = True
+            while growing:
+                growing = False
+                for production in productive:
+                    if production.lhs not in unbounded and any(sym in unbounded for sym in production.rhs):
+                        unbounded.add(production.lhs)
+                        growing = True
+            for sym in unbounded:
+                width[sym] = math.inf
+        return tuple(w if w >= 0 else math.inf for w in width)
+
+    def min_width_table(self, max_height):
+        """
+        Строит таблицу минимальных ширин при ограниченной глубине вывода.
+
+        Параметры
+        ----------
+            max_height (int): Наибольшая допустимая глубина.
+
+        Возвращает
+        ----------
+            list: Для каждой глубины ``h`` от 0 до max_height - кортеж минимальных
+                ширин символов, выводимых не глубже ``h`` (``math.inf``, если
+                символ не может завершиться за ``h`` уровней).
+        """
+        terminal_widths = self._terminal_widths()
+        previous = None
+        table = []
+        for _ in range(max_height + 1):
+            width = [w if terminal else math.inf for w, terminal in zip(terminal_widths, self.is_terminal)]
+            for production in self.productions:
+                if production.rhs:
+                    if previous is None:
+                        continue
+                    candidate = sum(previous[sym] for sym in production.rhs)
+                else:
+                    candidate = 0
+                if candidate < width[production.lhs]:
+                    width[production.lhs] = candidate
+            previous = tuple(width)
+            table.append(previous)
+        return table
+
+    def symbol_id(self, name):
+        """
+        Возвращает идентификатор символа по имени.
+
+        Параметры
+        ----------
+            name (str): Имя символа.
+
+        Исключения
+        ----------
+            ValueError: Если символ не встречается в грамматике.
+        """
+        try:
+            return self.symbol_ids[name]
+        except KeyError:
+            raise ValueError(f'Символ {name!r} не встречается в грамматике.') from None
+
+    def production_text(self, pid):
+        """
+        Возвращает правую часть продукции в виде строки.
+
+        Параметры
+        ----------
+            pid (int): Номер продукции.
+        """
+        symbols = self.symbols
+        return ' '.join(symbols[sym] for sym in self.productions[pid].rhs)
+
+    @property
+    def weighted(self):
+        """
+        True, если хотя бы у одного нетерминала веса альтернатив различаются.
+        """
+        return any(len({self.productions[pid].weight for pid in pids}) > 1 for pids in self.by_lhs)
+
+    @property
+    def nonterminals(self):
+        """
+        Идентификаторы всех нетерминалов грамматики.
+        """
+        return [sid for sid, terminal in enumerate(self.is_terminal) if not terminal]
+
+
+def restore_grammar(symbols, is_terminal, productions, by_lhs, start, nullable, min_height, min_width, max_width):
+    """
+    Восстанавливает CompiledGrammar из готовых полей без пересчета анализов.
+
+    Используется при распаковке (pickle) и загрузке из кэша; поля должны быть
+    получены из уже построенной грамматики.
+
+    Возвращает
+    ----------
+        CompiledGrammar: Восстановленная грамматика.
+    """
+    grammar = object.__new__(CompiledGrammar)
+    fields = {
+        'symbols': tuple(symbols),
+        'is_terminal': tuple(is_terminal),
+        'productions': tuple(productions),
+        'by_lhs': tuple(by_lhs),
+        'start': start,
+        'nullable': tuple(nullable),
+        'min_height': tuple(min_height),
+        'min_width': tuple(min_width),
+        'max_width': tuple(max_width),
+    }
+    for name, value in fields.items():
+        object.__setattr__(grammar, name, value)
+    object.__setattr__(grammar, 'symbol_ids', {name: sid for sid, name in enumerate(grammar.symbols)})
+    return grammar
+
+
+def alias_table(weights):
+    """
+    Строит таблицу псевдонимов Уокера для выбора по весам за O(1).
+
+    Выбор: ``i = randrange(n)``; если ``random() < prob[i]``, результат ``i``,
+    иначе ``alias[i]``.
+
+    Параметры
+    ----------
+        weights (list): Положительные веса альтернатив.
+
+    Возвращает
+    ----------
+        tuple: Кортежи вероятностей ``prob`` и индексов ``alias``.
+    """
+    n = len(weights)
+    total = sum(weights)
+    scaled = [w * n / total for w in weights]
+    prob = [1.0] * n
+    alias = list(range(n))
+    small = [i for i, w in enumerate(scaled) if w < 1.0]
+    large = [i for i, w in enumerate(scaled) if w >= 1.0]
+    while small and large:
+        less = small.pop()
+        more = large.pop()
+        prob[less] = scaled[less]
+        alias[less] = more
+        scaled[more] -= 1.0 - scaled[less]
+        if scaled[more] < 1.0:
+            small.append(more)
+        else:
+            large.append(more)
+    # Остатки из-за погрешности округления равны единице
+    return tuple(prob), tuple(alias)
+
+
+def compile_grammar(rules, start_variable, terminals=(), weights=None):
+    """
+    Компилирует словарь правил в CompiledGrammar.
+
+    Параметры
+    ----------
+        rules (dict): Словарь правил продукции ``{нетерминал: [строка продукции, ...]}``.
+        start_variable (str): Стартовый символ.
+        terminals (set): Явно объявленные терминалы (секция ``G``); многословные
+            терминалы (``на стол``) в продукциях считаются одним символом.
+        weights (dict): Веса продукций ``{нетерминал: [вес, ...]}`` в порядке
+            правил; для отсутствующих нетерминалов все веса равны 1.
+
+    Возвращает
+    ----------
+        CompiledGrammar: Скомпилированная грамматика.
+    """
+    symbols = []
+    symbol_ids = {}
+
+    def intern(name):
+        sid = symbol_ids.get(name)
+        if sid is None:
+            sid = symbol_ids[name] = len(symbols)
+            symbols.append(name)
+        return sid
+
+    non_terminals = [nt for nt in rules if nt not in terminals]
+    for non_terminal in non_terminals:
+        intern(non_terminal)
+    if start_variable is not None:
+        intern(start_variable)
+
+    # Продукции разбиваются на слова, а подряд идущие слова многословного
+    # терминала склеиваются в один символ (самое длинное совпадение)
+    multiword = [name for name in terminals if len(name.split()) > 1]
+    if multiword:
+        lexer = Lexer(multiword, {name: name for name in multiword})
+
+        def split(production):
+            tokens, words = lexer.scan(production)
+            return [words[start] if name == -1 else name for name, start, _ in tokens]
+    else:
+        split = str.split
+
+    weights = weights or {}
+    productions = []
+    lhs_pids = {}
+    for non_terminal in non_terminals:
+        lhs = symbol_ids[non_terminal]
+        pids = lhs_pids.setdefault(lhs, [])
+        production_weights = weights.get(non_terminal)
+        for i, production in enumerate(rules[non_terminal]):
+            rhs = tuple(intern(sym) for sym in split(production))
+            weight = production_weights[i] if production_weights else 1.0
+            pids.append(len(productions))
+            productions.append(Production(len(productions), lhs, rhs, weight))
+
+    is_terminal = [sid not in lhs_pids for sid in range(len(symbols))]
+    by_lhs = [lhs_pids.get(sid, ()) for sid in range(len(symbols))]
+    start = symbol_ids.get(start_variable, -1)
+    return CompiledGrammar(symbols, is_terminal, productions, by_lhs, start)
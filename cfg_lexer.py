@@ -0,0 +1,276 @@
+"""
+Лексический анализатор по множеству терминалов грамматики.
+
+Терминалы укладываются в префиксное дерево (trie) по единицам: словам для
+грамматик уровня слов (cfg_full) или символам для грамматик уровня символов
+(cfg_without_Pt). Вход разбирается за один проход слева направо по правилу
+самого длинного совпадения, поэтому многословные терминалы вроде ``на стол``
+распознаются как один токен, а границы слов соблюдаются. Единица, с которой
+не начинается ни один терминал, становится токеном -1 (или самой собой в split).
+
+Самое длинное совпадение может выбрать не то разбиение: при терминалах
+``в``, ``в ящик``, ``ящик`` и ``лежит`` строка ``в ящик лежит`` разбивается
+как ``в ящик | лежит``, хотя грамматика выводит ``в | ящик | лежит``. Поэтому
+для проверки строк lattice возвращает все совпадения (решетку токенов), а
+разбиение выбирает распознаватель Эрли. Потоковый распознаватель
+(IncrementalRecognizer) получает слова по одному и сам идет по дереву через
+step, accepted и continuations.
+"""
+
+WORD = 'word'
+CHAR = 'char'
+
+
+class Lexer:
+    """
+    Лексер на префиксном дереве терминалов.
+
+    Дерево хранится плоско: ``_next[node]`` - словарь переходов по единице,
+    ``_accept[node]`` - идентификатор терминала, оканчивающегося в узле, или None.
+
+    Атрибуты
+    ----------
+        unit (str): Единица разбиения: 'word' или 'char'.
+        max_units (int): Наибольшая длина терминала в единицах.
+        ROOT (int): Корень дерева (пустой префикс).
+    """
+
+    ROOT = 0
+
+    def __init__(self, terminals, symbol_ids=None, unit=WORD):
+        """
+        Параметры
+        ----------
+            terminals (iterable): Имена терминалов.
+            symbol_ids (dict): Отображение имени терминала в идентификатор; None -
+                нумерация терминалов в порядке сортировки (по умолчанию None).
+            unit (str): 'word' - слова, разделенные пробелами; 'char' - символы
+                без учета пробелов (по умолчанию 'word').
+
+        Исключения
+        ----------
+            ValueError: Если единица разбиения неизвестна.
+        """
+        if unit not in (WORD, CHAR):
+            raise ValueError(f'Неизвестная единица разбиения {unit!r}: ожидается {WORD!r} или {CHAR!r}.')
+        self.unit = unit
+        terminals = sorted(set(terminals))
+        if symbol_ids is None:
+            symbol_ids = {name: sid for sid, name in enumerate(terminals)}
+        self._next = [{}]
+        self._accept = [None]
+        self.max_units = 0
+        for name in terminals:
+            units = self.units(name)
+            if not units:
+                continue
+            node = 0
+            for part in units:
+                child = self._next[node].get(part)
+                if child is None:
+                    child = self._next[node][part] = len(self._next)
+                    self._next.append({})
+                    self._accept.append(None)
+                node = child
+            self._accept[node] = symbol_ids[name]
+            self.max_units = max(self.max_units, len(units))
+        # Все терминалы из одной единицы: разбор сводится к поиску в словаре
+        root = self._next[0]
+        self._single = {part: self._accept[node] for part, node in root.items() if self._accept[node] is not None}
+        self._below = None
+
+    @classmethod
+    def from_grammar(cls, grammar, unit=WORD):
+        """
+        Создает лексер по терминалам скомпилированной грамматики.
+
+        Параметры
+        ----------
+            grammar (CompiledGrammar): Скомпилированная грамматика.
+            unit (str): Единица разбиения (по умолчанию 'word').
+
+        Возвращает
+        ----------
+            Lexer: Лексер, выдающий идентификаторы символов грамматики.
+        """
+        terminals = [name for name, terminal in zip(grammar.symbols, grammar.is_terminal) if terminal]
+        return cls(terminals, grammar.symbol_ids, unit)
+
+    def units(self, text):
+        """
+        Разбивает текст на единицы (слова или символы).
+
+        Параметры
+        ----------
+            text (str): Входной текст.
+
+        Возвращает
+        ----------
+            list: Единицы текста.
+        """
+        if self.unit == WORD:
+            return text.split()
+        return [char for char in text if not char.isspace()]
+
+    def scan(self, text):
+        """
+        Разбирает текст на токены за один проход.
+
+        Параметры
+        ----------
+            text (str): Входной текст.
+
+        Возвращает
+        ----------
+            list: Тройки ``(id, начало, конец)`` - идентификатор терминала (-1,
+                если совпадения нет) и границы токена в списке единиц.
+            list: Список единиц текста.
+        """
+        units = self.units(text)
+        if self.max_units <= 1:
+            single = self._single
+            return [(single.get(part, -1), i, i + 1) for i, part in enumerate(units)], units
+
+        transitions = self._next
+        accept = self._accept
+        tokens = []
+        n = len(units)
+        i = 0
+        while i < n:
+            node = 0
+            best = -1
+            best_end = i + 1
+            j = i
+            while j < n:
+                node = transitions[node].get(units[j])
+                if node is None:
+                    break
+                j += 1
+                if accept[node] is not None:
+                    best, best_end = accept[node], j
+            tokens.append((best, i, best_end))
+            i = best_end
+        return tokens, units
+
+    def lattice(self, text):
+        """
+        Находит все совпадения терминалов в тексте (решетку токенов).
+
+        Параметры
+        ----------
+            text (str): Входной текст.
+
+        Возвращает
+        ----------
+            list: Для каждой позиции ``i`` в списке единиц - список пар ``(id, конец)``
+                терминалов, совпадающих с единицами ``[i, конец)``; пустой, если
+                с позиции не начинается ни один терминал.
+        """
+        units = self.units(text)
+        if self.max_units <= 1:
+            single = self._single
+            return [[(single[part], i + 1)] if part in single else [] for i, part in enumerate(units)]
+
+        transitions = self._next
+        accept = self._accept
+        lattice = []
+        n = len(units)
+        for i in range(n):
+            matches = []
+            node = 0
+            j = i
+            while j < n:
+                node = transitions[node].get(units[j])
+                if node is None:
+                    break
+                j += 1
+                if accept[node] is not None:
+                    matches.append((accept[node], j))
+            lattice.append(matches)
+        return lattice
+
+    def step(self, node, unit):
+        """
+        Переходит из узла дерева по следующей единице.
+
+        Параметры
+        ----------
+            node (int): Узел дерева (ROOT - пустой префикс).
+            unit (str): Следующая единица.
+
+        Возвращает
+        ----------
+            int: Узел префикса, продолженного единицей, или None, если ни один
+                терминал так не начинается.
+        """
+        return self._next[node].get(unit)
+
+    def accepted(self, node):
+        """
+        Возвращает идентификатор терминала, который оканчивается в узле, или None.
+        """
+        return self._accept[node]
+
+    def next_units(self, node):
+        """
+        Возвращает единицы, которыми можно продолжить префикс узла.
+        """
+        return self._next[node].keys()
+
+    def continuations(self, node):
+        """
+        Возвращает терминалы, которые продолжают префикс узла хотя бы на одну единицу.
+
+        Параметры
+        ----------
+            node (int): Узел дерева.
+
+        Возвращает
+        ----------
+            frozenset: Идентификаторы терминалов.
+        """
+        if self._below is None:
+            # Потомок всегда создается позже родителя: обход с конца видит детей раньше
+            below = [frozenset()] * len(self._next)
+            for parent in range(len(self._next) - 1, -1, -1):
+                found = set()
+                for child in self._next[parent].values():
+                    found |= below[child]
+                    if self._accept[child] is not None:
+                        found.add(self._accept[child])
+                below[parent] = frozenset(found)
+            self._below = below
+        return self._below[node]
+
+    def tokenize(self, text):
+        """
+        Преобразует текст в последовательность идентификаторов терминалов.
+
+        Параметры
+        ----------
+            text (str): Входной текст.
+
+        Возвращает
+        ----------
+            list: Идентификаторы терминалов (-1 для нераспознанных единиц).
+        """
+        if self.max_units <= 1:
+            single = self._single
+            return [single.get(part, -1) for part in self.units(text)]
+        return [sid for sid, _, _ in self.scan(text)[0]]
+
+    def split(self, text):
+        """
+        Разбивает текст на строки токенов (терминалы и нераспознанные единицы).
+
+        Параметры
+        ----------
+            text (str): Входной текст.
+
+        Возвращает
+        ----------
+            list: Токены в виде строк.
+        """
+        tokens, units = self.scan(text)
+        separator = ' ' if self.unit == WORD else ''
+        return [separator.join(units[start:end]) for _, start, end in tokens]
@@ -0,0 +1,122 @@
+"""
+Журналирование CFG в фоновом потоке.
+
+Импорт модулей пакета не создает файлов журнала: логгер ``cfg`` по умолчанию
+имеет только NullHandler. configure_logging подключает QueueHandler, а запись
+в файл (или другой обработчик) выполняет QueueListener в отдельном потоке,
+так что вызывающий код не ждет дискового ввода-вывода.
+
+События отдельных вызовов (генерация, проверка строки) пишутся в дочерний
+логгер ``cfg.events`` и могут прореживаться: при ``sample_rate=0.01`` в журнал
+попадает примерно одно событие из ста. Предупреждения и ошибки не прореживаются.
+
+Использование
+----------
+    from cfg_logging import configure_logging
+    configure_logging('cfg_generations.log', sample_rate=0.1)
+"""
+
+import atexit
+import logging
+import logging.handlers
+import queue
+import random
+
+logger = logging.getLogger('cfg')
+logger.addHandler(logging.NullHandler())
+events = logging.getLogger('cfg.events')
+
+DEFAULT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+_listener = None
+_handler = None
+_sampler = None
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Пропускает записи уровня ниже WARNING с заданной вероятностью.
+
+    Использует собственный генератор случайных чисел, чтобы не сдвигать
+    последовательность модуля random, от которой зависит генерация строк.
+
+    Атрибуты
+    ----------
+        rate (float): Доля пропускаемых записей (от 0 до 1).
+    """
+
+    def __init__(self, rate=1.0, seed=None):
+        """
+        Параметры
+        ----------
+            rate (float): Доля пропускаемых записей (по умолчанию 1.0).
+            seed (int): Начальное значение генератора (по умолчанию None).
+        """
+        super().__init__()
+        if not 0.0 <= rate <= 1.0:
+            raise ValueError('Доля прореживания должна быть в диапазоне [0, 1].')
+        self.rate = rate
+        self._random = random.Random(seed).random
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or self.rate >= 1.0:
+            return True
+        return self._random() < self.rate
+
+
+def configure_logging(filename='cfg_generations.log', level=logging.INFO, sample_rate=1.0,
+                      handler=None, fmt=DEFAULT_FORMAT):
+    """
+    Включает фоновое журналирование логгера ``cfg``.
+
+    Повторный вызов заменяет предыдущую конфигурацию.
+
+    Параметры
+    ----------
+        filename (str): Файл журнала, если handler не задан (по умолчанию 'cfg_generations.log').
+        level (int): Уровень журналирования (по умолчанию logging.INFO).
+        sample_rate (float): Доля записываемых событий отдельных вызовов (по умолчанию 1.0).
+        handler (logging.Handler): Обработчик, выполняемый в фоновом потоке, вместо файла (по умолчанию None).
+        fmt (str): Формат записей для файла (по умолчанию DEFAULT_FORMAT).
+
+    Возвращает
+    ----------
+        logging.handlers.QueueListener: Запущенный фоновый обработчик.
+    """
+    global _listener, _handler, _sampler
+    stop_logging()
+
+    if handler is None:
+        handler = logging.FileHandler(filename, encoding='utf-8')
+        handler.setFormatter(logging.Formatter(fmt))
+    records = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(records, handler, respect_handler_level=True)
+    _listener.start()
+
+    _handler = logging.handlers.QueueHandler(records)
+    logger.addHandler(_handler)
+    logger.setLevel(level)
+    logger.propagate = False
+    _sampler = SamplingFilter(sample_rate)
+    events.addFilter(_sampler)
+    return _listener
+
+
+def stop_logging():
+    """
+    Останавливает фоновое журналирование, дописав накопленные записи.
+    """
+    global _listener, _handler, _sampler
+    if _listener is None:
+        return
+    logger.removeHandler(_handler)
+    events.removeFilter(_sampler)
+    logger.setLevel(logging.NOTSET)
+    logger.propagate = True
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = _handler = _sampler = None
+
+
+atexit.register(stop_logging)
@@ -0,0 +1,239 @@
+"""
+Метрики генерации и проверки строк в памяти процесса.
+
+Счетчики и гистограммы обновляются под блокировкой одним вызовом на операцию;
+снимок можно получить в виде словаря или JSON.
+"""
+
+import bisect
+import json
+import math
+import threading
+
+# Границы корзин времени (секунды): от 1 мкс до ~67 с, с шагом x2
+TIME_BOUNDS = tuple(1e-6 * 2 ** i for i in range(27))
+# Границы корзин количества шагов: 1, 2, 4, ..., 2^24
+STEP_BOUNDS = tuple(2 ** i for i in range(25))
+
+
+class Histogram:
+    """
+    Гистограмма с фиксированными границами корзин.
+
+    Значение попадает в первую корзину, верхняя граница которой не меньше
+    значения; значения больше последней границы - в дополнительную корзину.
+
+    Атрибуты
+    ----------
+        bounds (tuple): Верхние границы корзин.
+        buckets (list): Количество значений в каждой корзине (на одну больше, чем границ).
+        count (int): Общее количество значений.
+        total (float): Сумма значений.
+        min (float): Наименьшее значение.
+        max (float): Наибольшее значение.
+    """
+
+    __slots__ = ('bounds', 'buckets', 'count', 'total', 'min', 'max')
+
+    def __init__(self, bounds):
+        """
+        Параметры
+        ----------
+            bounds (tuple): Возрастающие верхние границы корзин.
+        """
+        self.bounds = tuple(bounds)
+        self.buckets = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def observe(self, value):
+        """
+        Добавляет значение.
+        """
+        self.buckets[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        """
+        Оценивает квантиль верхней границей содержащей его корзины.
+
+        Параметры
+        ----------
+            q (float): Уровень квантиля от 0 до 1.
+
+        Возвращает
+        ----------
+            float: Оценка квантиля или None, если значений нет.
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, bucket in enumerate(self.buckets):
+            seen += bucket
+            if seen >= rank and bucket:
+                return min(self.bounds[i], self.max) if i < len(self.bounds) else self.max
+        return self.max
+
+    def merge(self, other):
+        """
+        Добавляет значения другой гистограммы с теми же границами.
+        """
+        self.buckets = [a + b for a, b in zip(self.buckets, other.buckets)]
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def snapshot(self):
+        """
+        Возвращает состояние гистограммы в виде словаря.
+        """
+        empty = not self.count
+        return {
+            'count': self.count,
+            'sum': self.total,
+            'min': None if empty else self.min,
+            'max': None if empty else self.max,
+            'mean': None if empty else self.total / self.count,
+            'p50': self.quantile(0.5),
+            'p90': self.quantile(0.9),
+            'p99': self.quantile(0.99),
+            'buckets': [[bound, n] for bound, n in zip(self.bounds + ('inf',), self.buckets) if n],
+        }
+
+
+class Metrics:
+    """
+    Счетчики и гистограммы задержек объекта CFG.
+
+    Счетчики: generations, generation_steps, validations, valid, invalid,
+    validation_steps, batch_strings. Гистограммы:
+    generation_time, generation_steps, validation_time, validation_steps.
+
+    Использование
+    ----------
+        cfg.metrics.snapshot()['histograms']['generation_time']['p99']
+        cfg.metrics.to_json()
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        Обнуляет все счетчики и гистограммы.
+        """
+        with self._lock:
+            self.counters = dict.fromkeys(('generations', 'generation_steps', 'validations', 'valid', 'invalid',
+                                           'validation_steps', 'batch_strings'), 0)
+            self.histograms = {
+                'generation_time': Histogram(TIME_BOUNDS),
+                'generation_steps': Histogram(STEP_BOUNDS),
+                'validation_time': Histogram(TIME_BOUNDS),
+                'validation_steps': Histogram(STEP_BOUNDS),
+            }
+
+    def record_generation(self, elapsed, steps):
+        """
+        Учитывает одну сгенерированную строку.
+
+        Параметры
+        ----------
+            elapsed (float): Время генерации в секундах.
+            steps (int): Количество шагов генерации.
+        """
+        with self._lock:
+            counters = self.counters
+            counters['generations'] += 1
+            counters['generation_steps'] += steps
+            self.histograms['generation_time'].observe(elapsed)
+            self.histograms['generation_steps'].observe(steps)
+
+    def record_validation(self, elapsed, steps, valid):
+        """
+        Учитывает одну проверку строки.
+
+        Параметры
+        ----------
+            elapsed (float): Время проверки в секундах.
+            steps (int): Количество построенных ситуаций.
+            valid (bool): Результат проверки.
+        """
+        with self._lock:
+            counters = self.counters
+            counters['validations'] += 1
+            counters['valid' if valid else 'invalid'] += 1
+            counters['validation_steps'] += steps
+            self.histograms['validation_time'].observe(elapsed)
+            self.histograms['validation_steps'].observe(steps)
+
+    def record_batch(self, count):
+        """
+        Учитывает пакет строк, построенный generate_batch.
+
+        Параметры
+        ----------
+            count (int): Количество строк.
+        """
+        with self._lock:
+            self.counters['batch_strings'] += count
+
+    def merge(self, other):
+        """
+        Добавляет счетчики и гистограммы других метрик (например, собранных
+        в процессе generate_many).
+
+        Параметры
+        ----------
+            other (Metrics): Метрики, которые нужно добавить.
+        """
+        with other._lock:
+            counters = dict(other.counters)
+            histograms = dict(other.histograms)
+        with self._lock:
+            for name, value in counters.items():
+                self.counters[name] += value
+            for name, histogram in histograms.items():
+                self.histograms[name].merge(histogram)
+
+    def snapshot(self):
+        """
+        Возвращает согласованный снимок метрик.
+
+        Возвращает
+        ----------
+            dict: ``{'counters': {...}, 'histograms': {имя: {...}}}``.
+        """
+        with self._lock:
+            return {
+                'counters': dict(self.counters),
+                'histograms': {name: histogram.snapshot() for name, histogram in self.histograms.items()},
+            }
+
+    def to_json(self, **kwargs):
+        """
+        Возвращает снимок метрик в формате JSON.
+
+        Параметры
+        ----------
+            **kwargs: Аргументы json.dumps (например, indent).
+        """
+        return json.dumps(self.snapshot(), **kwargs)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
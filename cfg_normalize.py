@@ -0,0 +1,354 @@
+"""
+Нормализация контекстно-свободных грамматик.
+
+Преобразования (в порядке применения):
+
+1. удаление бесполезных символов (непорождающих и недостижимых);
+2. удаление пустых (эпсилон) продукций; если язык содержит пустую строку,
+   вводится новый стартовый символ с единственной пустой продукцией;
+3. удаление цепных продукций ``A -> B``;
+4. по запросу - удаление левой рекурсии (алгоритм Пола);
+5. по запросу - приведение к нормальной форме Хомского.
+
+Результат - новый объект CFG с тем же языком. Для каждой его продукции
+сохраняется, из каких продукций исходной грамматики она получена и какому
+символу исходной продукции соответствует каждый ее символ, поэтому результаты
+разбора можно перевести обратно в термины грамматики пользователя. Веса
+продукций при нормализации не переносятся.
+
+Использование
+----------
+    from cfg_normalize import normalize
+    normal = normalize(cfg, cnf=True)
+    normal.normalization.describe(pid)
+"""
+
+import itertools
+
+from cfg_grammar import compile_grammar
+
+
+class ProductionOrigin:
+    """
+    Происхождение продукции нормализованной грамматики.
+
+    Атрибуты
+    ----------
+        productions (tuple): Номера продукций исходной грамматики, из которых
+            составлена эта продукция (цепные продукции, затем основные).
+        positions (tuple): Для каждого символа правой части - пара
+            ``(pid, индекс)`` исходной продукции и позиции в ее правой части,
+            или None для вспомогательных символов, введенных нормализацией.
+    """
+
+    __slots__ = ('productions', 'positions')
+
+    def __init__(self, productions, positions):
+        self.productions = productions
+        self.positions = positions
+
+    def __repr__(self):
+        return f'ProductionOrigin(productions={self.productions}, positions={self.positions})'
+
+
+class NormalizationMap:
+    """
+    Соответствие между нормализованной и исходной грамматиками.
+
+    Атрибуты
+    ----------
+        source (CFG): Исходная грамматика.
+        origins (tuple): ProductionOrigin для каждого номера продукции
+            нормализованной грамматики.
+        symbol_origins (dict): Для каждого нетерминала нормализованной грамматики -
+            нетерминал исходной грамматики, ради которого он существует.
+    """
+
+    __slots__ = ('source', 'origins', 'symbol_origins')
+
+    def __init__(self, source, origins, symbol_origins):
+        self.source = source
+        self.origins = origins
+        self.symbol_origins = symbol_origins
+
+    def original_productions(self, pid):
+        """
+        Возвращает исходные продукции, из которых получена продукция ``pid``.
+
+        Параметры
+        ----------
+            pid (int): Номер продукции нормализованной грамматики.
+
+        Возвращает
+        ----------
+            list: Пары ``(левая часть, правая часть)`` исходной грамматики.
+        """
+        grammar = self.source.grammar
+        return [(grammar.symbols[grammar.productions[source].lhs], grammar.production_text(source))
+                for source in self.origins[pid].productions]
+
+    def describe(self, pid):
+        """
+        Возвращает строку вида ``исходные продукции`` для продукции ``pid``.
+
+        Параметры
+        ----------
+            pid (int): Номер продукции нормализованной грамматики.
+        """
+        parts = [f'{lhs} -> {rhs}' for lhs, rhs in self.original_productions(pid)]
+        return ' ; '.join(parts) if parts else '(вспомогательная продукция)'
+
+
+def normalize(cfg, remove_left_recursion=False, cnf=False):
+    """
+    Строит грамматику, эквивалентную данной, без бесполезных символов,
+    пустых и цепных продукций.
+
+    Параметры
+    ----------
+        cfg (CFG): Исходная грамматика.
+        remove_left_recursion (bool): Удалить левую рекурсию (по умолчанию False).
+        cnf (bool): Привести к нормальной форме Хомского (по умолчанию False).
+
+    Возвращает
+    ----------
+        CFG: Новая грамматика; соответствие с исходной - в атрибуте ``normalization``.
+
+    Исключения
+    ----------
+        ValueError: Если язык грамматики пуст.
+    """
+    grammar = cfg.grammar
+    symbols = grammar.symbols
+    start = symbols[grammar.start]
+    terminals = {name for name, terminal in zip(symbols, grammar.is_terminal) if terminal}
+    names = set(symbols)
+
+    # Рабочее представление: {нетерминал: [(правая часть, ProductionOrigin), ...]}
+    rules = {}
+    for nt in grammar.nonterminals:
+        alternatives = rules.setdefault(symbols[nt], [])
+        for pid in grammar.by_lhs[nt]:
+            rhs = grammar.productions[pid].rhs
+            alternatives.append((tuple(symbols[sym] for sym in rhs),
+                                 ProductionOrigin((pid,), tuple((pid, i) for i in range(len(rhs))))))
+    symbol_origins = {nt: nt for nt in rules}
+
+    def fresh(base):
+        name = base
+        while name in names:
+            name += "'"
+        names.add(name)
+        return name
+
+    rules = _prune(rules, start)
+    rules, start = _remove_epsilon(rules, start, fresh, symbol_origins)
+    rules = _prune(_remove_units(rules), start)
+    if remove_left_recursion:
+        rules = _remove_left_recursion(rules, start, fresh, symbol_origins)
+        rules = _prune(_remove_units(rules), start)
+    if cnf:
+        rules = _to_cnf(rules, terminals, fresh, symbol_origins)
+
+    # Сборка новой грамматики; порядок номеров продукций совпадает с порядком в rules
+    text_rules = {nt: [' '.join(rhs) for rhs, _ in alternatives] for nt, alternatives in rules.items()}
+    origins = tuple(origin for alternatives in rules.values() for _, origin in alternatives)
+    compiled = compile_grammar(text_rules, start, terminals)
+    normal = type(cfg).from_grammar(compiled, max_depth=cfg.max_depth, max_length=cfg.max_length,
+                                    end_symbol=cfg.end_symbol)
+    normal.normalization = NormalizationMap(cfg, origins, {nt: symbol_origins[nt] for nt in rules})
+    return normal
+
+
+def _prune(rules, start):
+    """
+    Удаляет непорождающие и недостижимые нетерминалы и их продукции.
+    """
+    productive = set()
+    changed = True
+    while changed:
+        changed = False
+        for nt, alternatives in rules.items():
+            if nt in productive:
+                continue
+            for rhs, _ in alternatives:
+                if all(sym in productive or sym not in rules for sym in rhs):
+                    productive.add(nt)
+                    changed = True
+                    break
+    if start not in productive:
+        raise ValueError(f'Язык грамматики пуст: из {start!r} не выводится ни одной строки.')
+
+    def usable(rhs):
+        return all(sym in productive or sym not in rules for sym in rhs)
+
+    reachable = {start}
+    queue = [start]
+    while queue:
+        nt = queue.pop()
+        for rhs, _ in rules[nt]:
+            if not usable(rhs):
+                continue
+            for sym in rhs:
+                if sym in rules and sym not in reachable:
+                    reachable.add(sym)
+                    queue.append(sym)
+
+    return {nt: [(rhs, origin) for rhs, origin in alternatives if usable(rhs)]
+            for nt, alternatives in rules.items() if nt in reachable}
+
+
+def _add(alternatives, seen, rhs, origin):
+    """
+    Добавляет альтернативу, если такой правой части еще нет.
+    """
+    if rhs not in seen:
+        seen.add(rhs)
+        alternatives.append((rhs, origin))
+
+
+def _remove_epsilon(rules, start, fresh, symbol_origins):
+    """
+    Удаляет пустые продукции, добавляя варианты без обнуляемых символов.
+    """
+    nullable = set()
+    changed = True
+    while changed:
+        changed = False
+        for nt, alternatives in rules.items():
+            if nt not in nullable and any(all(sym in nullable for sym in rhs) for rhs, _ in alternatives):
+                nullable.add(nt)
+                changed = True
+
+    result = {}
+    for nt, alternatives in rules.items():
+        new_alternatives = result.setdefault(nt, [])
+        seen = set()
+        for rhs, origin in alternatives:
+            optional = [i for i, sym in enumerate(rhs) if sym in nullable]
+            for dropped in itertools.product((False, True), repeat=len(optional)):
+                removed = {i for i, drop in zip(optional, dropped) if drop}
+                kept = [i for i in range(len(rhs)) if i not in removed]
+                if not kept:
+                    continue
+                _add(new_alternatives, seen, tuple(rhs[i] for i in kept),
+                     ProductionOrigin(origin.productions, tuple(origin.positions[i] for i in kept)))
+
+    if start in nullable:
+        new_start = fresh(start + '0')
+        symbol_origins[new_start] = start
+        result = {new_start: [((start,), ProductionOrigin((), (None,))),
+                              ((), ProductionOrigin((), ()))], **result}
+        start = new_start
+    return result, start
+
+
+def _remove_units(rules):
+    """
+    Заменяет цепные продукции ``A -> B`` неценными продукциями B.
+    """
+    def is_unit(rhs):
+        return len(rhs) == 1 and rhs[0] in rules
+
+    result = {}
+    for nt in rules:
+        alternatives = result.setdefault(nt, [])
+        seen = set()
+        # Обход в ширину по цепным продукциям с накоплением их происхождения
+        chains = [(nt, ())]
+        visited = {nt}
+        while chains:
+            current, chain = chains.pop(0)
+            for rhs, origin in rules[current]:
+                if is_unit(rhs):
+                    if rhs[0] not in visited:
+                        visited.add(rhs[0])
+                        chains.append((rhs[0], chain + origin.productions))
+                    continue
+                _add(alternatives, seen, rhs, ProductionOrigin(chain + origin.productions, origin.positions))
+    return result
+
+
+def _remove_left_recursion(rules, start, fresh, symbol_origins):
+    """
+    Удаляет прямую и косвенную левую рекурсию (алгоритм Пола).
+
+    Требует грамматику без пустых (кроме стартовой) и цепных продукций.
+    """
+    order = list(rules)
+    result = {nt: list(alternatives) for nt, alternatives in rules.items()}
+    for i, a_i in enumerate(order):
+        # Подстановка продукций A_j в A_i -> A_j γ для j < i
+        for a_j in order[:i]:
+            substituted = []
+            seen = set()
+            for rhs, origin in result[a_i]:
+                if rhs and rhs[0] == a_j:
+                    for delta, delta_origin in result[a_j]:
+                        _add(substituted, seen, delta + rhs[1:],
+                             ProductionOrigin(delta_origin.productions + origin.productions,
+                                              delta_origin.positions + origin.positions[1:]))
+                else:
+                    _add(substituted, seen, rhs, origin)
+            result[a_i] = substituted
+
+        # Прямая левая рекурсия: A -> A α | β  =>  A -> β | β A', A' -> α | α A'
+        recursive = [(rhs[1:], origin) for rhs, origin in result[a_i] if rhs and rhs[0] == a_i]
+        if not recursive:
+            continue
+        tail = fresh(a_i + "'")
+        symbol_origins[tail] = symbol_origins.get(a_i, a_i)
+        base = []
+        seen = set()
+        for rhs, origin in result[a_i]:
+            if rhs and rhs[0] == a_i:
+                continue
+            _add(base, seen, rhs, origin)
+            if rhs:
+                _add(base, seen, rhs + (tail,), ProductionOrigin(origin.productions, origin.positions + (None,)))
+        tails = []
+        seen = set()
+        for alpha, origin in recursive:
+            if not alpha:
+                continue
+            positions = origin.positions[1:]
+            _add(tails, seen, alpha, ProductionOrigin(origin.productions, positions))
+            _add(tails, seen, alpha + (tail,), ProductionOrigin(origin.productions, positions + (None,)))
+        result[a_i] = base
+        result[tail] = tails
+    return result
+
+
+def _to_cnf(rules, terminals, fresh, symbol_origins):
+    """
+    Приводит грамматику без пустых и цепных продукций к нормальной форме Хомского.
+    """
+    result = {nt: [] for nt in rules}
+    wrappers = {}
+
+    def wrap(terminal):
+        # Нетерминал, выводящий ровно один терминал
+        if terminal not in wrappers:
+            name = fresh('T[{}]'.format('_'.join(terminal.split())))
+            wrappers[terminal] = name
+            symbol_origins[name] = None
+            result[name] = [((terminal,), ProductionOrigin((), (None,)))]
+        return wrappers[terminal]
+
+    for nt, alternatives in rules.items():
+        for rhs, origin in alternatives:
+            if len(rhs) <= 1:
+                result[nt].append((rhs, origin))
+                continue
+            rhs = tuple(wrap(sym) if sym in terminals or sym not in rules else sym for sym in rhs)
+            positions = origin.positions
+            lhs = nt
+            # Бинаризация: A -> X1 H1, H1 -> X2 H2, ..., H(k-2) -> X(k-1) Xk
+            while len(rhs) > 2:
+                helper = fresh(f'{nt}#{len(result)}')
+                symbol_origins[helper] = symbol_origins.get(nt, nt)
+                result.setdefault(helper, [])
+                result[lhs].append(((rhs[0], helper), ProductionOrigin(origin.productions, (positions[0], None))))
+                lhs, rhs, positions = helper, rhs[1:], positions[1:]
+            result[lhs].append((rhs, ProductionOrigin(origin.productions, positions)))
+    return result
@@ -0,0 +1,188 @@
+"""
+Пакетная генерация строк в нескольких процессах.
+
+Работа делится на ``workers`` потоков: строка с номером ``i`` принадлежит
+потоку ``i % workers``. У каждого потока свой генератор случайных чисел,
+выведенный из общего ``seed``, поэтому корпус зависит только от пары
+(``seed``, ``workers``) и не зависит от того, какой процесс закончил раньше.
+
+Каждая строка учитывается в ``cfg.metrics`` и ``cfg.generate_counter`` так же,
+как в CFG.generate; процессы ведут метрики своей копии грамматики и передают
+их по окончании потока, а родитель добавляет их к метрикам исходного объекта.
+"""
+
+import multiprocessing
+import os
+import queue as queue_module
+import random
+import time
+
+
+def stream_rng(seed, stream):
+    """
+    Создает независимый генератор случайных чисел для потока.
+
+    Строковое начальное значение хэшируется (SHA-512) внутри random.Random,
+    так что соседние номера потоков дают несвязанные последовательности.
+
+    Параметры
+    ----------
+        seed (int): Общее начальное значение.
+        stream (int): Номер потока.
+
+    Возвращает
+    ----------
+        random.Random: Генератор случайных чисел потока.
+    """
+    return random.Random(f'{seed}/{stream}')
+
+
+def _shard_size(n, workers, stream):
+    """
+    Возвращает количество строк, приходящихся на поток.
+    """
+    return n // workers + (1 if stream < n % workers else 0)
+
+
+def _generate_shard(cfg, symbol, count, rng, length):
+    """
+    Лениво генерирует строки одного потока и учитывает их в метриках ``cfg``.
+    """
+    end_symbol = cfg.end_symbol
+    metrics = cfg.metrics
+    for _ in range(count):
+        start_time = time.perf_counter()
+        cfg.generation_steps = 0
+        cfg.generate_counter += 1
+        string = cfg._produce(symbol, 0, length, rng)
+        metrics.record_generation(time.perf_counter() - start_time, cfg.generation_steps)
+        yield string + end_symbol
+
+
+def _worker(cls, grammar, settings, symbol, count, seed, stream, length, batch_size, results):
+    """
+    Точка входа процесса: генерирует свой поток и отправляет строки пачками.
+
+    В очередь кладутся пары ``(stream, batch)`` со списком строк; по окончании -
+    ``(stream, metrics)`` с метриками процесса, при ошибке - ``(stream, исключение)``.
+    """
+    try:
+        cfg = cls.from_grammar(grammar, **settings)
+        batch = []
+        for string in _generate_shard(cfg, symbol, count, stream_rng(seed, stream), length):
+            batch.append(string)
+            if len(batch) >= batch_size:
+                results.put((stream, batch))
+                batch = []
+        if batch:
+            results.put((stream, batch))
+        results.put((stream, cfg.metrics))
+    except BaseException as exc:
+        results.put((stream, exc))
+
+
+def generate_many(cfg, n, workers=1, seed=None, ordered=True, length=None, batch_size=256):
+    """
+    Генерирует ``n`` строк грамматики в ``workers`` процессах.
+
+    Параметры
+    ----------
+        cfg (CFG): Объект грамматики.
+        n (int): Количество строк.
+        workers (int): Количество потоков (и процессов).
+        seed (int): Начальное значение; None - случайное.
+        ordered (bool): Возвращать строки в порядке номеров.
+        length (int): Точная длина строк в токенах или None.
+        batch_size (int): Размер пачки, передаваемой из процесса.
+
+    Возвращает
+    ----------
+        iterator: Итератор по строкам с символом окончания.
+
+    Строки учитываются в ``cfg.metrics`` и ``cfg.generate_counter``; при
+    нескольких процессах - когда процесс закончит свой поток.
+    """
+    if workers < 1:
+        raise ValueError('Количество процессов должно быть положительным.')
+    if seed is None:
+        seed = int.from_bytes(os.urandom(8), 'big')
+    symbol = cfg.grammar.start
+
+    if workers == 1:
+        return _generate_shard(cfg, symbol, n, stream_rng(seed, 0), length)
+    return _generate_pool(cfg, symbol, n, workers, seed, ordered, length, batch_size)
+
+
+def _generate_pool(cfg, symbol, n, workers, seed, ordered, length, batch_size):
+    """
+    Запускает процессы и собирает их результаты.
+
+    В порядке номеров строки читаются из отдельной ограниченной очереди
+    каждого потока, причем только из очереди потока, чья строка следующая:
+    отстающий процесс не заставляет копить в родителе строки остальных, они
+    ждут на заполненных очередях. Без порядка все процессы пишут в одну общую
+    очередь, которая читается по мере поступления.
+    """
+    context = multiprocessing.get_context()
+    if ordered:
+        queues = [context.Queue(maxsize=4) for _ in range(workers)]
+    else:
+        queues = [context.Queue(maxsize=4 * workers)] * workers
+    settings = {'max_depth': cfg.max_depth, 'max_length': cfg.max_length, 'end_symbol': cfg.end_symbol}
+    processes = []
+    for stream in range(workers):
+        count = _shard_size(n, workers, stream)
+        if not count:
+            continue
+        process = context.Process(
+            target=_worker,
+            args=(type(cfg), cfg.grammar, settings, symbol, count, seed, stream, length, batch_size, queues[stream]),
+            daemon=True,
+        )
+        process.start()
+        processes.append(process)
+
+    def receive(results, owners):
+        while True:
+            try:
+                stream, batch = results.get(timeout=1.0)
+            except queue_module.Empty:
+                if not any(process.is_alive() for process in owners):
+                    raise RuntimeError('Процесс генерации завершился без результата.')
+                continue
+            if isinstance(batch, BaseException):
+                raise batch
+            if isinstance(batch, list):
+                return stream, batch
+            # Поток закончен: его метрики добавляются к метрикам исходного объекта
+            cfg.metrics.merge(batch)
+            cfg.generate_counter += batch.counters['generations']
+            return stream, None
+
+    try:
+        if ordered:
+            buffers = [[] for _ in range(workers)]
+            positions = [0] * workers
+            for index in range(n):
+                stream = index % workers
+                if positions[stream] == len(buffers[stream]):
+                    _, buffers[stream] = receive(queues[stream], processes[stream:stream + 1])
+                    positions[stream] = 0
+                yield buffers[stream][positions[stream]]
+                positions[stream] += 1
+            # После последней строки каждый поток присылает свои метрики
+            for stream in range(min(n, workers)):
+                receive(queues[stream], processes[stream:stream + 1])
+        else:
+            remaining = len(processes)
+            while remaining:
+                stream, batch = receive(queues[0], processes)
+                if batch is None:
+                    remaining -= 1
+                else:
+                    yield from batch
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
@@ -0,0 +1,447 @@
+"""
+Профилирование генератора и распознавателя по нетерминалам и продукциям.
+
+Профилировщик включается явно: ``cfg.profiler = Profiler()``. Генератор
+(CFG._derive) и замыкание набора Эрли (EarleyRecognizer.close) принимают
+необязательный обработчик событий (hooks); с профилировщиком generate и
+is_valid_string передают им обработчики этого модуля, которые замеряют время
+каждого шага. Пока атрибут равен None, обработчика нет, и профилирование стоит
+одной проверки на шаг.
+
+Время учитывается по стекам нетерминалов, как в профилировщиках функций:
+
+- в генераторе стек - путь от корня дерева вывода до разворачиваемого
+  нетерминала; собственное (exclusive) время узла - выбор продукции и вывод
+  ее терминалов, полное (inclusive) - время всего поддерева; полное время
+  рекурсивной продукции (``E -> E + T``) учитывается только у внешнего ее
+  вхождения, поэтому не превышает времени фазы;
+- в распознавателе стек нетерминала ``B``, предсказанного в наборе ``k``, -
+  стек ситуации, которая первой его предсказала, плюс ``B``; собственное время
+  - обработка ситуаций продукций ``B`` с началом ``k`` (предсказание,
+  сканирование, завершение), полное - вместе со всем, что предсказано от его имени.
+
+Неудачи (failed):
+
+- генератор не откатывается, поэтому неудача продукции - это случай, когда
+  она была отброшена при выборе: не укладывается в оставшуюся глубину
+  (max_depth) или длину (max_length); неудача нетерминала - выбор, при котором
+  ограничение длины исключило часть альтернатив;
+- в распознавателе неудача продукции - ситуация, которая так и не продвинулась
+  дальше; неудача нетерминала - предсказание, которое не завершилось ни разу.
+
+Равновероятная выборка (generate с length) и generate_batch не профилируются.
+
+Использование
+----------
+    from cfg_profile import Profiler
+
+    cfg.profiler = Profiler()
+    for _ in range(1000):
+        cfg.is_valid_string(cfg.generate()[0])
+    print(cfg.profiler.report(top=10))
+    open('cfg.folded', 'w').write(cfg.profiler.collapsed())   # flamegraph.pl cfg.folded
+    cfg.profiler = None
+"""
+
+import json
+import threading
+import time
+
+GENERATE = 'generate'
+VALIDATE = 'validate'
+PHASES = (GENERATE, VALIDATE)
+
+
+class Profiler:
+    """
+    Накопитель статистики по нетерминалам и продукциям.
+
+    Вызовы накапливают статистику локально и сливают ее в профилировщик
+    под блокировкой, поэтому один профилировщик можно разделять между потоками.
+
+    Использование
+    ----------
+        cfg.profiler = Profiler()
+        cfg.generate()
+        cfg.profiler.to_dict()['generate']['nonterminals']
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._texts = None
+        self.reset()
+
+    def reset(self):
+        """
+        Обнуляет накопленную статистику.
+        """
+        with self._lock:
+            # (фаза, нетерминал, ...) -> [вызовы, собственное время]
+            self._stacks = {}
+            # (фаза, продукция) -> [вызовы, полное время, собственное время, неудачи]
+            self._productions = {}
+            # (фаза, нетерминал) -> [вызовы, неудачи]
+            self._nonterminals = {}
+            # фаза -> [вызовы, время]
+            self._totals = {phase: [0, 0.0] for phase in PHASES}
+
+    def production_names(self, grammar):
+        """
+        Возвращает подписи продукций грамматики вида ``A -> x y``.
+
+        Параметры
+        ----------
+            grammar (CompiledGrammar): Скомпилированная грамматика.
+        """
+        texts = self._texts
+        if texts is None or texts[0] is not grammar:
+            symbols = grammar.symbols
+            names = tuple(f'{symbols[p.lhs]} -> {grammar.production_text(p.pid) or "ε"}' for p in grammar.productions)
+            texts = self._texts = (grammar, names)
+        return texts[1]
+
+    def merge(self, phase, elapsed, stacks, productions, nonterminals):
+        """
+        Добавляет статистику одного вызова.
+
+        Параметры
+        ----------
+            phase (str): 'generate' или 'validate'.
+            elapsed (float): Время вызова в секундах.
+            stacks (dict): ``{стек: [вызовы, собственное время]}``.
+            productions (dict): ``{продукция: [вызовы, полное время, собственное время, неудачи]}``.
+            nonterminals (dict): ``{нетерминал: [вызовы, неудачи]}``.
+        """
+        with self._lock:
+            total = self._totals[phase]
+            total[0] += 1
+            total[1] += elapsed
+            for table, local in ((self._stacks, stacks), (self._productions, productions),
+                                 (self._nonterminals, nonterminals)):
+                for key, values in local.items():
+                    key = (phase,) + key if type(key) is tuple else (phase, key)
+                    current = table.get(key)
+                    if current is None:
+                        table[key] = list(values)
+                    else:
+                        for i, value in enumerate(values):
+                            current[i] += value
+
+    def to_dict(self):
+        """
+        Возвращает статистику в виде словаря.
+
+        Возвращает
+        ----------
+            dict: ``{фаза: {'calls', 'seconds', 'nonterminals': {имя: {...}},
+                'productions': {продукция: {...}}}}``; у нетерминалов и продукций
+                поля calls, inclusive, exclusive (секунды) и failed.
+        """
+        with self._lock:
+            result = {}
+            for phase in PHASES:
+                calls, seconds = self._totals[phase]
+                nonterminals = {}
+                for (key_phase, name), (count, failed) in self._nonterminals.items():
+                    if key_phase == phase:
+                        nonterminals[name] = {'calls': count, 'inclusive': 0.0, 'exclusive': 0.0, 'failed': failed}
+                for key, (_, exclusive) in self._stacks.items():
+                    if key[0] != phase:
+                        continue
+                    path = key[1:]
+                    # Рекурсивный нетерминал учитывается в полном времени стека один раз
+                    for name in set(path):
+                        nonterminals.setdefault(name, {'calls': 0, 'inclusive': 0.0, 'exclusive': 0.0, 'failed': 0})
+                        nonterminals[name]['inclusive'] += exclusive
+                    nonterminals[path[-1]]['exclusive'] += exclusive
+                productions = {}
+                for (key_phase, name), (count, inclusive, exclusive, failed) in self._productions.items():
+                    if key_phase == phase:
+                        productions[name] = {'calls': count, 'inclusive': inclusive,
+                                             'exclusive': exclusive, 'failed': failed}
+                result[phase] = {'calls': calls, 'seconds': seconds,
+                                 'nonterminals': nonterminals, 'productions': productions}
+            return result
+
+    def to_json(self, **kwargs):
+        """
+        Возвращает статистику в формате JSON.
+
+        Параметры
+        ----------
+            **kwargs: Аргументы json.dumps (например, indent).
+        """
+        return json.dumps(self.to_dict(), ensure_ascii=False, **kwargs)
+
+    def collapsed(self):
+        """
+        Возвращает стеки в свернутом формате (collapsed stacks) для flamegraph.pl,
+        speedscope и подобных инструментов: строка ``фаза;A;B;C микросекунды``.
+
+        Возвращает
+        ----------
+            str: Строки свернутых стеков с собственным временем в микросекундах.
+        """
+        with self._lock:
+            lines = []
+            for key, (_, exclusive) in sorted(self._stacks.items()):
+                microseconds = round(exclusive * 1e6)
+                if microseconds > 0:
+                    lines.append(f"{';'.join(key)} {microseconds}")
+        return '\n'.join(lines) + '\n' if lines else ''
+
+    def report(self, top=20):
+        """
+        Возвращает текстовый отчет о самых дорогих нетерминалах и продукциях.
+
+        Параметры
+        ----------
+            top (int): Количество строк в каждой таблице (по умолчанию 20).
+
+        Возвращает
+        ----------
+            str: Таблицы, отсортированные по полному времени.
+        """
+        data = self.to_dict()
+        lines = []
+        for phase in PHASES:
+            section = data[phase]
+            if not section['calls']:
+                continue
+            lines.append(f"{phase}: {section['calls']} calls, {section['seconds']:.6f} s")
+            for title, rows in (('nonterminal', section['nonterminals']), ('production', section['productions'])):
+                lines.append(f"  {'inclusive, s':>12} {'exclusive, s':>12} {'calls':>10} {'failed':>10}  {title}")
+                ranked = sorted(rows.items(), key=lambda item: item[1]['inclusive'], reverse=True)[:top]
+                for name, row in ranked:
+                    lines.append(f"  {row['inclusive']:12.6f} {row['exclusive']:12.6f} "
+                                 f"{row['calls']:10d} {row['failed']:10d}  {name}")
+        return '\n'.join(lines)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        state['_texts'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+
+class _DeriveHooks:
+    """
+    Обработчик событий CFG._derive: собирает статистику одного вывода.
+    """
+
+    def __init__(self, cfg, profiler):
+        grammar = cfg.grammar
+        self.clock = time.perf_counter
+        self._choices = cfg._derivation_plans()[1]
+        self._plan_pids = cfg._plan_pids
+        self._by_lhs = grammar.by_lhs
+        self._symbols = grammar.symbols
+        self._names = profiler.production_names(grammar)
+        # Открытые кадры [стек нетерминалов, pid, начало, время детей] и число открытых кадров продукций
+        self._active = []
+        self._open = {}
+        self.stacks = {}
+        self.productions = {}
+        self.nonterminals = {}
+
+    def enter(self, symbol, budget, index, slack, start):
+        """
+        Учитывает выбор продукции ``index`` нетерминала и возвращает кадр его поддерева.
+        """
+        productions = self.productions
+        names = self._names
+        _, extras, max_extra, _ = self._choices[budget][symbol]
+        pids = self._plan_pids[budget][symbol]
+        name = self._symbols[symbol]
+        counts = self.nonterminals.get(name)
+        if counts is None:
+            counts = self.nonterminals[name] = [0, 0]
+        counts[0] += 1
+        by_lhs = self._by_lhs[symbol]
+        if len(pids) < len(by_lhs):
+            # Продукции, не укладывающиеся в оставшуюся глубину
+            for pid in set(by_lhs).difference(pids):
+                _production(productions, names[pid])[3] += 1
+        if max_extra > slack:
+            # Продукции, не укладывающиеся в оставшуюся длину
+            counts[1] += 1
+            for i, extra in enumerate(extras):
+                if extra > slack:
+                    _production(productions, names[pids[i]])[3] += 1
+        pid = pids[index]
+        _production(productions, names[pid])[0] += 1
+        active = self._active
+        frame = [(active[-1][0] if active else ()) + (name,), pid, start, 0.0]
+        active.append(frame)
+        self._open[pid] = self._open.get(pid, 0) + 1
+        return frame
+
+    def leave(self, frame):
+        """
+        Закрывает кадр построенного поддерева.
+        """
+        path, pid, start, children = frame
+        inclusive = self.clock() - start
+        active = self._active
+        active.pop()
+        if active:
+            active[-1][3] += inclusive
+        entry = self.stacks.get(path)
+        if entry is None:
+            entry = self.stacks[path] = [0, 0.0]
+        entry[0] += 1
+        entry[1] += inclusive - children
+        entry = self.productions[self._names[pid]]
+        entry[2] += inclusive - children
+        self._open[pid] -= 1
+        if not self._open[pid]:
+            # Вложенные вхождения той же продукции уже входят во время внешнего
+            entry[1] += inclusive
+
+
+def profile_derive(cfg, symbol, depth, rng, profiler):
+    """
+    Строит вывод CFG._derive с обработчиком профилировщика.
+
+    Выбор продукций и их порядок не меняются, поэтому при одном и том же
+    состоянии генератора случайных чисел строится та же строка.
+
+    Параметры
+    ----------
+        cfg (CFG): Объект грамматики.
+        symbol (int): Идентификатор символа.
+        depth (int): Начальная глубина.
+        rng: Источник случайных чисел.
+        profiler (Profiler): Профилировщик.
+
+    Возвращает
+    ----------
+        str: Сгенерированная строка.
+    """
+    started = time.perf_counter()
+    hooks = _DeriveHooks(cfg, profiler)
+    result = cfg._derive(symbol, depth, rng, hooks)
+    if hooks.nonterminals:
+        profiler.merge(GENERATE, time.perf_counter() - started, hooks.stacks, hooks.productions, hooks.nonterminals)
+    return result
+
+
+def _production(productions, name):
+    """
+    Возвращает (создавая при необходимости) запись статистики продукции.
+    """
+    entry = productions.get(name)
+    if entry is None:
+        entry = productions[name] = [0, 0.0, 0.0, 0]
+    return entry
+
+
+class _RecognizeHooks:
+    """
+    Обработчик событий EarleyRecognizer.close: собирает статистику одной проверки.
+
+    Время ситуации - от вызова item для нее до следующего вызова item.
+    """
+
+    def __init__(self, recognizer, profiler):
+        grammar = recognizer.grammar
+        self.clock = time.perf_counter
+        self._productions = grammar.productions
+        self._symbols = grammar.symbols
+        self._names = profiler.production_names(grammar)
+        start_name = self._symbols[grammar.start]
+        # (нетерминал, набор) -> стек нетерминалов
+        self.paths = {(grammar.start, 0): (start_name,)}
+        self.items = set()
+        self.stacks = {}
+        self.productions = {}
+        self.nonterminals = {start_name: [1, 0]}
+        self._current = None
+        self._started = 0.0
+
+    def item(self, item):
+        """
+        Закрывает замер предыдущей ситуации и начинает замер ``item``.
+        """
+        elapsed = self.clock() - self._started
+        current = self._current
+        if current is not None:
+            pid, path = current
+            entry = self.stacks.get(path)
+            if entry is None:
+                entry = self.stacks[path] = [0, 0.0]
+            entry[0] += 1
+            entry[1] += elapsed
+            entry = _production(self.productions, self._names[pid])
+            entry[0] += 1
+            entry[1] += elapsed
+            entry[2] += elapsed
+        if item is None:
+            self._current = None
+            return
+        self.items.add(item)
+        pid, _, origin = item
+        self._current = (pid, self.paths[(self._productions[pid].lhs, origin)])
+        self._started = self.clock()
+
+    def predict(self, symbol, k, item):
+        """
+        Запоминает стек нетерминала, впервые предсказанного в наборе ``k``.
+        """
+        if (symbol, k) in self.paths:
+            return
+        # Стек предсказанного нетерминала - стек ситуации, которая предсказала его первой
+        name = self._symbols[symbol]
+        self.paths[(symbol, k)] = self._current[1] + (name,)
+        counts = self.nonterminals.get(name)
+        if counts is None:
+            counts = self.nonterminals[name] = [0, 0]
+        counts[0] += 1
+
+    def finish(self):
+        """
+        Считает неудачи: ситуации, которые не продвинулись, и предсказания, которые не завершились.
+        """
+        items = self.items
+        names = self._names
+        completed = set()
+        for pid, dot, origin in items:
+            production = self._productions[pid]
+            if dot == len(production.rhs):
+                completed.add((production.lhs, origin))
+            elif (pid, dot + 1, origin) not in items:
+                self.productions[names[pid]][3] += 1
+        for symbol, origin in self.paths:
+            if (symbol, origin) not in completed:
+                self.nonterminals[self._symbols[symbol]][1] += 1
+
+
+def profile_recognize(recognizer, recognize, profiler):
+    """
+    Выполняет проверку строки с обработчиком профилировщика.
+
+    Параметры
+    ----------
+        recognizer (EarleyRecognizer): Распознаватель грамматики.
+        recognize (callable): Проверка ``recognize(hooks) -> bool``, передающая
+            обработчик в EarleyRecognizer.recognize или recognize_lattice.
+        profiler (Profiler): Профилировщик.
+
+    Возвращает
+    ----------
+        bool: Результат проверки.
+    """
+    grammar = recognizer.grammar
+    if grammar.start < 0 or grammar.is_terminal[grammar.start]:
+        return recognize(None)
+
+    started = time.perf_counter()
+    hooks = _RecognizeHooks(recognizer, profiler)
+    valid = recognize(hooks)
+    hooks.finish()
+    profiler.merge(VALIDATE, time.perf_counter() - started, hooks.stacks, hooks.productions, hooks.nonterminals)
+    return valid
@@ -0,0 +1,354 @@
+"""
+Реестр грамматик каталога правил.
+
+Реестр находит файлы правил (по умолчанию ``rules/*.txt``) и загружает
+грамматику при первом обращении к ней; warm загружает все грамматики заранее
+в пуле потоков или процессов. Загрузка идет через кэш скомпилированных
+грамматик (cfg_cache), а файлы с одинаковым содержимым используют один и тот
+же объект CompiledGrammar.
+
+reload перечитывает каталог: новые файлы добавляются, удаленные исключаются,
+а заново разбираются только файлы, у которых изменились время модификации
+или размер и при этом изменился хэш содержимого. Объекты CFG, уже выданные
+вызывающему коду, не меняются: обновленная грамматика - это новый объект.
+
+Использование
+----------
+    registry = GrammarRegistry('rules')
+    registry.warm()
+    cfg = registry['with_G_Pt']
+"""
+
+import concurrent.futures
+import glob
+import os
+import threading
+
+import cfg_cache
+from cfg_full import CFG
+from cfg_logging import logger
+
+
+class _Entry:
+    """
+    Состояние одного файла правил в реестре.
+    """
+
+    __slots__ = ('path', 'stat', 'digest', 'cfg', 'error', 'lock')
+
+    def __init__(self, path):
+        self.path = path
+        self.stat = None
+        self.digest = None
+        self.cfg = None
+        self.error = None
+        self.lock = threading.Lock()
+
+
+def _file_stat(path):
+    """
+    Возвращает пару (время модификации в нс, размер) файла.
+    """
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _read_rules(path):
+    """
+    Читает файл правил один раз: возвращает его (время модификации в нс, размер)
+    и содержимое. Время и размер берутся до чтения, поэтому изменение файла во
+    время чтения будет замечено при следующем reload.
+    """
+    with open(path, 'rb') as f:
+        stat = os.fstat(f.fileno())
+        return (stat.st_mtime_ns, stat.st_size), f.read()
+
+
+def _load_in_process(path, data, max_depth, cache, cache_dir):
+    """
+    Точка входа процесса пула: разбирает содержимое файла и возвращает
+    грамматику вместе с настройками (CompiledGrammar передается вместе с
+    готовыми анализами).
+    """
+    cfg = CFG.from_data(data, path, max_depth=max_depth, cache=cache, cache_dir=cache_dir)
+    return cfg.grammar, cfg.max_length, cfg.end_symbol
+
+
+class GrammarRegistry:
+    """
+    Реестр грамматик каталога с ленивой загрузкой и горячей перезагрузкой.
+
+    Имя грамматики - имя файла без расширения. Все методы потокобезопасны;
+    каждая грамматика разбирается не более одного раза, даже если к ней
+    одновременно обращаются несколько потоков.
+
+    Атрибуты
+    ----------
+        directory (str): Каталог с файлами правил.
+        pattern (str): Шаблон имен файлов.
+        max_depth (int): Максимальная глубина рекурсии для создаваемых CFG.
+        cache (bool): Использовать кэш скомпилированных грамматик.
+        cache_dir (str): Каталог кэша или None.
+    """
+
+    def __init__(self, directory='rules', pattern='*.txt', max_depth=10, cache=True, cache_dir=None):
+        """
+        Параметры
+        ----------
+            directory (str): Каталог с файлами правил (по умолчанию 'rules').
+            pattern (str): Шаблон имен файлов (по умолчанию '*.txt').
+            max_depth (int): Максимальная глубина рекурсии (по умолчанию 10).
+            cache (bool): Использовать кэш скомпилированных грамматик (по умолчанию True).
+            cache_dir (str): Каталог кэша; None - рядом с файлами правил (по умолчанию None).
+        """
+        self.directory = directory
+        self.pattern = pattern
+        self.max_depth = max_depth
+        self.cache = cache
+        self.cache_dir = cache_dir
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._grammars = {}
+        self._discover()
+
+    def _discover(self):
+        """
+        Находит файлы правил и возвращает множество имен.
+        """
+        found = {}
+        for path in glob.glob(os.path.join(self.directory, self.pattern)):
+            if os.path.isfile(path):
+                found[os.path.splitext(os.path.basename(path))[0]] = path
+        with self._lock:
+            for name, path in found.items():
+                if name not in self._entries:
+                    self._entries[name] = _Entry(path)
+        return set(found)
+
+    def names(self):
+        """
+        Возвращает отсортированный список имен грамматик.
+        """
+        with self._lock:
+            return sorted(self._entries)
+
+    def __contains__(self, name):
+        with self._lock:
+            return name in self._entries
+
+    def __iter__(self):
+        return iter(self.names())
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def __getitem__(self, name):
+        return self.get(name)
+
+    def _entry(self, name):
+        with self._lock:
+            entry = self._entries.get(name)
+        if entry is None:
+            raise KeyError(f'Грамматика {name!r} не найдена в каталоге {self.directory!r}.')
+        return entry
+
+    def get(self, name):
+        """
+        Возвращает грамматику, загружая ее при первом обращении.
+
+        Параметры
+        ----------
+            name (str): Имя грамматики (имя файла без расширения).
+
+        Возвращает
+        ----------
+            CFG: Объект грамматики.
+
+        Исключения
+        ----------
+            KeyError: Если грамматики с таким именем нет (в том числе если файл
+                      правил удален после обнаружения).
+            ValueError: Если файл правил не удалось разобрать.
+        """
+        entry = self._entry(name)
+        cfg = entry.cfg
+        if cfg is not None:
+            return cfg
+        with entry.lock:
+            if entry.cfg is None:
+                try:
+                    if entry.error is not None and _file_stat(entry.path) == entry.stat:
+                        # Файл не менялся с неудачной попытки - не разбираем заново
+                        raise entry.error
+                    self._load(entry)
+                except OSError as exc:
+                    raise KeyError(f'Файл грамматики {name!r} недоступен: {entry.path!r}.') from exc
+            return entry.cfg
+
+    def grammar(self, name):
+        """
+        Возвращает скомпилированную грамматику (общую для всех пользователей).
+
+        Параметры
+        ----------
+            name (str): Имя грамматики.
+
+        Возвращает
+        ----------
+            CompiledGrammar: Скомпилированная грамматика.
+        """
+        return self.get(name).grammar
+
+    def _load(self, entry, source=None, loaded=None):
+        """
+        Загружает грамматику записи; вызывается под блокировкой записи.
+
+        Хэш и грамматика вычисляются по одному и тому же прочитанному
+        содержимому файла.
+
+        Параметры
+        ----------
+            entry (_Entry): Запись реестра.
+            source (tuple): Результат _read_rules, если файл уже прочитан, или None.
+            loaded (tuple): Результат разбора source в процессе пула
+                ``(grammar, max_length, end_symbol)`` или None.
+        """
+        stat, data = source if source is not None else _read_rules(entry.path)
+        digest = cfg_cache.rules_digest(data)
+        try:
+            if loaded is None:
+                cfg = CFG.from_data(data, entry.path, max_depth=self.max_depth,
+                                    cache=self.cache, cache_dir=self.cache_dir)
+            else:
+                grammar, max_length, end_symbol = loaded
+                cfg = CFG.from_grammar(grammar, max_depth=self.max_depth, max_length=max_length,
+                                       end_symbol=end_symbol)
+        except ValueError as exc:
+            entry.error = exc
+            entry.stat, entry.digest = stat, digest
+            raise
+        with self._lock:
+            # Файлы с одинаковым содержимым используют одну скомпилированную грамматику
+            shared = self._grammars.setdefault(digest, cfg.grammar)
+        if shared is not cfg.grammar:
+            cfg = CFG.from_grammar(shared, max_depth=self.max_depth, max_length=cfg.max_length,
+                                   end_symbol=cfg.end_symbol)
+        entry.stat, entry.digest, entry.cfg, entry.error = stat, digest, cfg, None
+        logger.info('Registry loaded grammar %s', entry.path)
+
+    def warm(self, workers=None, processes=False):
+        """
+        Загружает все еще не загруженные грамматики в пуле.
+
+        Параметры
+        ----------
+            workers (int): Размер пула; None - по умолчанию concurrent.futures.
+            processes (bool): Разбирать файлы в пуле процессов, а не потоков (по умолчанию False).
+
+        Возвращает
+        ----------
+            dict: ``{имя: исключение}`` для файлов, которые не удалось загрузить.
+        """
+        with self._lock:
+            pending = {name: entry for name, entry in self._entries.items() if entry.cfg is None}
+        errors = {}
+        if not pending:
+            return errors
+
+        if processes:
+            executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+
+            def submit(entry):
+                # Файл читается здесь, чтобы хэш и разбор в процессе пула шли по одним байтам
+                source = sources[entry.path] = _read_rules(entry.path)
+                return executor.submit(_load_in_process, entry.path, source[1], self.max_depth,
+                                       self.cache, self.cache_dir)
+        else:
+            executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+
+            def submit(entry):
+                return executor.submit(self._warm_entry, entry)
+
+        sources = {}
+        with executor:
+            futures = {}
+            for name, entry in pending.items():
+                try:
+                    futures[submit(entry)] = name
+                except OSError as exc:
+                    errors[name] = exc
+                    logger.warning('Registry could not load grammar %s: %s', entry.path, exc)
+            for future in concurrent.futures.as_completed(futures):
+                name = futures[future]
+                try:
+                    result = future.result()
+                    if processes:
+                        self._warm_entry(pending[name], sources[pending[name].path], result)
+                except Exception as exc:
+                    errors[name] = exc
+                    logger.warning('Registry could not load grammar %s: %s', pending[name].path, exc)
+        return errors
+
+    def _warm_entry(self, entry, source=None, loaded=None):
+        """
+        Загружает запись, если ее еще никто не загрузил.
+        """
+        with entry.lock:
+            if entry.cfg is None:
+                self._load(entry, source, loaded)
+
+    def reload(self):
+        """
+        Перечитывает каталог и перезагружает измененные грамматики.
+
+        Загруженные грамматики с измененным содержимым разбираются сразу,
+        незагруженные - при следующем обращении.
+
+        Возвращает
+        ----------
+            dict: Списки имен ``{'added': [...], 'removed': [...], 'changed': [...]}``.
+        """
+        with self._lock:
+            before = set(self._entries)
+        present = self._discover()
+
+        removed = sorted(before - present)
+        with self._lock:
+            for name in removed:
+                del self._entries[name]
+            entries = dict(self._entries)
+
+        changed = []
+        for name, entry in sorted(entries.items()):
+            if entry.stat is None:
+                continue
+            with entry.lock:
+                try:
+                    if _file_stat(entry.path) == entry.stat:
+                        continue
+                    source = _read_rules(entry.path)
+                except OSError:
+                    continue
+                if cfg_cache.rules_digest(source[1]) == entry.digest:
+                    entry.stat = source[0]
+                    continue
+                changed.append(name)
+                was_loaded = entry.cfg is not None
+                entry.cfg = entry.error = None
+                entry.stat = entry.digest = None
+                if was_loaded:
+                    try:
+                        self._load(entry, source)
+                    except ValueError as exc:
+                        logger.warning('Registry could not reload grammar %s: %s', entry.path, exc)
+
+        with self._lock:
+            # Грамматики, на которые больше не ссылается ни одна запись, не держим в памяти
+            used = {entry.digest for entry in self._entries.values() if entry.cfg is not None}
+            self._grammars = {digest: grammar for digest, grammar in self._grammars.items() if digest in used}
+
+        added = sorted(present - before)
+        if added or removed or changed:
+            logger.info('Registry reload: added %s, removed %s, changed %s', added, removed, changed)
+        return {'added': added, 'removed': removed, 'changed': changed}
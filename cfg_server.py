@@ -0,0 +1,529 @@
+"""
+Локальный сервер генерации и проверки строк на asyncio.
+
+Сервер один раз загружает грамматики каталога правил (GrammarRegistry) в
+процессах пула и принимает запросы по Unix-сокету или TCP на localhost.
+Протокол - JSON по строкам (NDJSON): клиент пишет по одному запросу в строке,
+сервер отвечает строками результатов по мере готовности.
+
+Запросы::
+
+    {"id": 1, "grammar": "with_G_Pt", "op": "generate", "n": 1000, "seed": 42}
+    {"id": 2, "grammar": "with_G_Pt", "op": "validate", "strings": ["Mary hates John."]}
+
+Ответы::
+
+    {"id": 1, "index": 0, "string": "John loves Mary."}
+    {"id": 2, "index": 0, "string": "Mary hates John.", "valid": true}
+    {"id": 1, "done": true, "count": 1000, "seconds": 0.012}
+    {"id": 3, "error": "..."}
+
+Одновременные запросы к одной грамматике с одной операцией собираются в пачку
+(не больше ``max_batch`` частей или по истечении ``batch_window`` секунд) и
+выполняются одной задачей пула процессов: цикл событий не занят вычислениями,
+а накладные расходы на передачу между процессами делятся на всю пачку.
+Большие запросы режутся на части по ``chunk_size`` строк, поэтому результаты
+начинают приходить до окончания всей работы. Генерация идет пакетным
+генератором (generate_batch, NumPy), без NumPy - обычным в том же процессе;
+начальное значение части выводится из ``seed`` запроса, так что ответ зависит
+только от запроса, а не от того, с чем он попал в пачку.
+
+Использование
+----------
+    python cfg_server.py --socket cfg_server.sock
+    python cfg_server.py --port 8765
+    python cfg_server.py --replay requests.jsonl --output results.jsonl
+"""
+
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import json
+import os
+import sys
+import time
+
+from cfg_logging import logger
+from cfg_parallel import stream_rng
+from cfg_registry import GrammarRegistry
+
+GENERATE = 'generate'
+VALIDATE = 'validate'
+OPERATIONS = (GENERATE, VALIDATE)
+
+DEFAULT_SOCKET = 'cfg_server.sock'
+
+# Реестр грамматик процесса пула (создается инициализатором процесса)
+_registry = None
+
+
+def _init_worker(directory, max_depth, cache, cache_dir):
+    """
+    Инициализатор процесса пула: создает реестр грамматик процесса.
+    """
+    global _registry
+    _registry = GrammarRegistry(directory, max_depth=max_depth, cache=cache, cache_dir=cache_dir)
+
+
+def _generate(cfg, n, seed):
+    """
+    Генерирует ``n`` строк пакетным генератором или, без NumPy, обычным.
+    """
+    try:
+        return cfg.generate_batch(n, seed=seed)
+    except ImportError:
+        return list(cfg.generate_many(n, seed=seed))
+
+
+def _run_batch(name, op, jobs):
+    """
+    Точка входа процесса пула: выполняет пачку частей запросов одной грамматики.
+
+    Параметры
+    ----------
+        name (str): Имя грамматики.
+        op (str): Операция: 'generate' или 'validate'.
+        jobs (list): Части запросов: ``(n, seed)`` для генерации,
+            список строк для проверки.
+
+    Возвращает
+    ----------
+        list: Для каждой части ``(True, результаты)`` или ``(False, сообщение об ошибке)``.
+    """
+    try:
+        cfg = _registry.get(name)
+    except KeyError as exc:
+        return [(False, exc.args[0])] * len(jobs)
+    except (OSError, ValueError) as exc:
+        return [(False, str(exc))] * len(jobs)
+
+    results = []
+    for job in jobs:
+        try:
+            if op == GENERATE:
+                n, seed = job
+                results.append((True, _generate(cfg, n, seed)))
+            else:
+                results.append((True, [cfg.is_valid_string(string) for string in job]))
+        except Exception as exc:
+            results.append((False, str(exc)))
+    return results
+
+
+class RequestError(ValueError):
+    """
+    Некорректный запрос клиента.
+    """
+
+
+class _Batcher:
+    """
+    Собирает части запросов с одинаковыми (грамматика, операция) в пачки.
+    """
+
+    def __init__(self, executor, max_batch, batch_window):
+        self.executor = executor
+        self.max_batch = max_batch
+        self.batch_window = batch_window
+        self._pending = {}
+        self._timers = {}
+        self.batches = 0
+        self.jobs = 0
+
+    def submit(self, name, op, job):
+        """
+        Добавляет часть запроса в пачку; возвращает future с ее результатом.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        key = (name, op)
+        pending = self._pending.setdefault(key, [])
+        pending.append((job, future))
+        if len(pending) >= self.max_batch:
+            self._flush(key)
+        elif key not in self._timers:
+            self._timers[key] = loop.call_later(self.batch_window, self._flush, key)
+        return future
+
+    def _flush(self, key):
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        pending = self._pending.pop(key, None)
+        if not pending:
+            return
+        self.batches += 1
+        self.jobs += len(pending)
+        loop = asyncio.get_running_loop()
+        name, op = key
+        task = loop.run_in_executor(self.executor, _run_batch, name, op, [job for job, _ in pending])
+        task.add_done_callback(lambda done: self._deliver(done, pending))
+
+    @staticmethod
+    def _deliver(done, pending):
+        if done.cancelled():
+            for _, future in pending:
+                future.cancel()
+            return
+        exc = done.exception()
+        for index, (_, future) in enumerate(pending):
+            if future.done():
+                continue
+            if exc is not None:
+                future.set_result((False, f'Ошибка процесса пула: {exc}'))
+            else:
+                future.set_result(done.result()[index])
+
+
+class CFGServer:
+    """
+    Сервер генерации и проверки строк с пакетной обработкой запросов.
+
+    Атрибуты
+    ----------
+        directory (str): Каталог с файлами правил.
+        workers (int): Количество процессов пула (None - по числу процессоров).
+        max_batch (int): Наибольшее число частей запросов в пачке.
+        batch_window (float): Время ожидания пачки в секундах.
+        chunk_size (int): Количество строк в части запроса.
+        prefetch (int): Количество частей одного запроса, выполняемых одновременно.
+
+    Использование
+    ----------
+        server = CFGServer('rules')
+        asyncio.run(server.serve(path='cfg_server.sock'))
+    """
+
+    def __init__(self, directory='rules', workers=None, max_batch=64, batch_window=0.005,
+                 chunk_size=1024, prefetch=4, max_depth=10, cache=True, cache_dir=None):
+        """
+        Параметры
+        ----------
+            directory (str): Каталог с файлами правил (по умолчанию 'rules').
+            workers (int): Количество процессов пула; None - по числу процессоров (по умолчанию None).
+            max_batch (int): Наибольшее число частей запросов в пачке (по умолчанию 64).
+            batch_window (float): Сколько секунд ждать пополнения пачки (по умолчанию 0.005).
+            chunk_size (int): Количество строк в части запроса (по умолчанию 1024).
+            prefetch (int): Сколько частей одного запроса выполняется одновременно (по умолчанию 4).
+            max_depth (int): Максимальная глубина рекурсии грамматик (по умолчанию 10).
+            cache (bool): Использовать кэш скомпилированных грамматик (по умолчанию True).
+            cache_dir (str): Каталог кэша или None (по умолчанию None).
+        """
+        if max_batch < 1 or chunk_size < 1 or prefetch < 1:
+            raise ValueError('Размеры пачки, части и упреждения должны быть положительными.')
+        self.directory = directory
+        self.workers = workers
+        self.max_batch = max_batch
+        self.batch_window = batch_window
+        self.chunk_size = chunk_size
+        self.prefetch = prefetch
+        self._worker_args = (directory, max_depth, cache, cache_dir)
+        self._executor = None
+        self._batcher = None
+
+    def start(self):
+        """
+        Запускает пул процессов (вызывается автоматически при первом запросе).
+        """
+        if self._executor is None:
+            self._executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.workers, initializer=_init_worker, initargs=self._worker_args)
+            # Процессы запускаются при первой задаче; запускаем их сразу, до приема
+            # соединений, иначе дочерние процессы унаследуют сокеты клиентов
+            self._executor.submit(int).result()
+            self._batcher = _Batcher(self._executor, self.max_batch, self.batch_window)
+            logger.info('CFG server pool started for rules in %s', self.directory)
+
+    def close(self):
+        """
+        Останавливает пул процессов.
+        """
+        if self._executor is not None:
+            logger.info('CFG server processed %d request parts in %d batches',
+                        self._batcher.jobs, self._batcher.batches)
+            self._executor.shutdown()
+            self._executor = self._batcher = None
+
+    @staticmethod
+    def _parse(request):
+        """
+        Проверяет запрос и возвращает (грамматика, операция, работа).
+        """
+        if not isinstance(request, dict):
+            raise RequestError('Запрос должен быть JSON-объектом.')
+        op = request.get('op')
+        if op not in OPERATIONS:
+            raise RequestError(f'Неизвестная операция {op!r}: ожидается {GENERATE!r} или {VALIDATE!r}.')
+        name = request.get('grammar')
+        if not isinstance(name, str) or not name:
+            raise RequestError('Не указано имя грамматики (grammar).')
+        if op == GENERATE:
+            n = request.get('n', 1)
+            seed = request.get('seed')
+            if not isinstance(n, int) or isinstance(n, bool) or n < 0:
+                raise RequestError('Количество строк (n) должно быть неотрицательным целым числом.')
+            if seed is not None and (not isinstance(seed, int) or isinstance(seed, bool)):
+                raise RequestError('Начальное значение (seed) должно быть целым числом.')
+            return name, op, (n, seed)
+        strings = request.get('strings')
+        if strings is None and 'string' in request:
+            strings = [request['string']]
+        if not isinstance(strings, list) or not all(isinstance(s, str) for s in strings):
+            raise RequestError('Для проверки нужен список строк (strings) или строка (string).')
+        return name, op, strings
+
+    def _parts(self, op, work):
+        """
+        Режет работу запроса на части по chunk_size строк.
+        """
+        size = self.chunk_size
+        if op == VALIDATE:
+            for offset in range(0, len(work), size):
+                yield work[offset:offset + size]
+            return
+        n, seed = work
+        for part, offset in enumerate(range(0, n, size)):
+            # Начальное значение части зависит только от seed запроса и номера части
+            part_seed = None if seed is None else stream_rng(seed, part).getrandbits(63)
+            yield min(size, n - offset), part_seed
+
+    async def handle(self, request):
+        """
+        Выполняет запрос и лениво выдает словари ответа.
+
+        Параметры
+        ----------
+            request (dict): Запрос клиента.
+
+        Возвращает
+        ----------
+            async iterator: Строки результатов, затем строка ``done`` или ``error``.
+        """
+        request_id = request.get('id', request.get('request_id')) if isinstance(request, dict) else None
+        try:
+            name, op, work = self._parse(request)
+        except RequestError as exc:
+            yield {'id': request_id, 'error': str(exc)}
+            return
+
+        self.start()
+        start_time = time.perf_counter()
+        parts = self._parts(op, work)
+        in_flight = collections.deque()
+        index = 0
+        while True:
+            while len(in_flight) < self.prefetch:
+                job = next(parts, None)
+                if job is None:
+                    break
+                in_flight.append((job, self._batcher.submit(name, op, job)))
+            if not in_flight:
+                break
+            job, future = in_flight.popleft()
+            ok, result = await future
+            if not ok:
+                for _, pending in in_flight:
+                    pending.cancel()
+                yield {'id': request_id, 'error': result}
+                return
+            if op == GENERATE:
+                for string in result:
+                    yield {'id': request_id, 'index': index, 'string': string}
+                    index += 1
+            else:
+                for string, valid in zip(job, result):
+                    yield {'id': request_id, 'index': index, 'string': string, 'valid': valid}
+                    index += 1
+        yield {'id': request_id, 'done': True, 'count': index,
+               'seconds': round(time.perf_counter() - start_time, 6)}
+
+    async def _respond(self, line, writer, lock):
+        """
+        Выполняет запрос из строки и пишет ответ в поток по частям.
+        """
+        try:
+            request = json.loads(line)
+        except ValueError as exc:
+            responses = _single({'id': None, 'error': f'Некорректный JSON: {exc}'})
+        else:
+            responses = self.handle(request)
+        lines = []
+        async for response in responses:
+            lines.append(_dump(response))
+            if len(lines) >= self.chunk_size:
+                async with lock:
+                    writer.write(''.join(lines).encode('utf-8'))
+                    await writer.drain()
+                lines = []
+        if lines:
+            async with lock:
+                writer.write(''.join(lines).encode('utf-8'))
+                await writer.drain()
+
+    async def _serve_connection(self, reader, writer):
+        """
+        Обслуживает одно соединение: запросы из одного соединения выполняются параллельно.
+        """
+        lock = asyncio.Lock()
+        # Только выполняющиеся запросы: завершенные удаляются, чтобы долгоживущее
+        # соединение не накапливало задачи
+        tasks = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                line = line.strip()
+                if line:
+                    task = asyncio.ensure_future(self._respond(line, writer, lock))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+            await asyncio.gather(*tasks)
+        except (ConnectionError, asyncio.IncompleteReadError) as exc:
+            logger.warning('CFG server connection closed: %s', exc)
+            for task in list(tasks):
+                task.cancel()
+        finally:
+            writer.close()
+
+    async def serve(self, path=None, host='127.0.0.1', port=None):
+        """
+        Принимает соединения до отмены задачи.
+
+        Параметры
+        ----------
+            path (str): Путь Unix-сокета; если не указан, используется TCP (по умолчанию None).
+            host (str): Адрес TCP (по умолчанию '127.0.0.1').
+            port (int): Порт TCP (по умолчанию None).
+
+        Исключения
+        ----------
+            ValueError: Если не указан ни путь сокета, ни порт.
+        """
+        if path is None and port is None:
+            raise ValueError('Укажите путь Unix-сокета или порт TCP.')
+        self.start()
+        try:
+            if path is not None:
+                server = await asyncio.start_unix_server(self._serve_connection, path=path)
+                logger.info('CFG server listening on %s', path)
+            else:
+                server = await asyncio.start_server(self._serve_connection, host=host, port=port)
+                logger.info('CFG server listening on %s:%d', host, port)
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.close()
+            if path is not None and os.path.exists(path):
+                os.unlink(path)
+
+    async def replay(self, lines, output, concurrency=256):
+        """
+        Выполняет запросы из строк NDJSON без сети и пишет ответы в порядке запросов.
+
+        Запросы выполняются одновременно (не больше ``concurrency``), поэтому
+        попадают в общие пачки так же, как запросы разных клиентов. Строки
+        нумеруются с единицы, пустые строки тоже учитываются, так что номер
+        совпадает с номером строки в файле. Запрос без id получает этот номер
+        в качестве id; ответ на строку, которая не разбирается как JSON, -
+        ``{"id": null, "line": n, "error": ...}`` с тем же номером ``n``.
+
+        Параметры
+        ----------
+            lines (iterable): Строки запросов.
+            output: Текстовый поток для ответов.
+            concurrency (int): Наибольшее число одновременно выполняемых запросов (по умолчанию 256).
+
+        Возвращает
+        ----------
+            int: Количество выполненных запросов.
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def collect(number, line):
+            async with semaphore:
+                try:
+                    request = json.loads(line)
+                except ValueError as exc:
+                    # Номер строки - в отдельном поле: id мог бы совпасть с id клиента
+                    return [{'id': None, 'line': number, 'error': f'Некорректный JSON: {exc}'}]
+                if isinstance(request, dict) and 'id' not in request and 'request_id' not in request:
+                    request['id'] = number
+                return [response async for response in self.handle(request)]
+
+        self.start()
+        count = 0
+        try:
+            tasks = collections.deque()
+            for number, line in enumerate(lines, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                tasks.append(asyncio.ensure_future(collect(number, line)))
+                # Ответы пишутся по порядку, не дожидаясь конца файла
+                while tasks and (tasks[0].done() or len(tasks) >= concurrency):
+                    output.write(''.join(map(_dump, await tasks.popleft())))
+                    count += 1
+                await asyncio.sleep(0)
+            while tasks:
+                output.write(''.join(map(_dump, await tasks.popleft())))
+                count += 1
+        finally:
+            self.close()
+        return count
+
+
+async def _single(response):
+    """
+    Асинхронный итератор из одного ответа.
+    """
+    yield response
+
+
+def _dump(response):
+    """
+    Сериализует ответ в строку NDJSON.
+    """
+    return json.dumps(response, ensure_ascii=False) + '\n'
+
+
+def main(argv=None):
+    """
+    Точка входа командной строки.
+    """
+    parser = argparse.ArgumentParser(description='Local CFG generation and validation server.')
+    parser.add_argument('--rules', default='rules', help='directory with rules files')
+    parser.add_argument('--socket', help='Unix socket path')
+    parser.add_argument('--host', default='127.0.0.1', help='TCP host (with --port)')
+    parser.add_argument('--port', type=int, help='TCP port')
+    parser.add_argument('--replay', help='run requests from an NDJSON file and exit')
+    parser.add_argument('--output', help='output file for --replay (default: stdout)')
+    parser.add_argument('--workers', type=int, help='process pool size')
+    parser.add_argument('--max-batch', type=int, default=64, help='request parts per batch')
+    parser.add_argument('--batch-window', type=float, default=0.005, help='batch wait in seconds')
+    parser.add_argument('--chunk-size', type=int, default=1024, help='strings per request part')
+    parser.add_argument('--max-depth', type=int, default=10, help='maximum recursion depth')
+    args = parser.parse_args(argv)
+
+    server = CFGServer(args.rules, workers=args.workers, max_batch=args.max_batch,
+                       batch_window=args.batch_window, chunk_size=args.chunk_size, max_depth=args.max_depth)
+    if args.replay:
+        output = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+        try:
+            with open(args.replay, encoding='utf-8') as f:
+                asyncio.run(server.replay(f, output))
+        finally:
+            if output is not sys.stdout:
+                output.close()
+        return
+    if args.socket is None and args.port is None:
+        args.socket = DEFAULT_SOCKET
+    try:
+        asyncio.run(server.serve(path=args.socket, host=args.host, port=args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,235 @@
+"""
+Векторизованная пакетная генерация строк на NumPy.
+
+Тысячи выводов разворачиваются синхронно: у каждого вывода свой стек символов
+(строка двумерного массива), и на каждом шаге все выводы пакета снимают с
+вершины по одному символу. Терминалы дописываются в выходной массив, а выбор
+продукций для всех снятых нетерминалов делается одним вызовом генератора
+случайных чисел NumPy. Строки собираются только в конце.
+
+Порядок развертывания и отсечение продукций те же, что у скалярного
+генератора (CFG._derive), поэтому распределение строк совпадает с generate.
+
+NumPy - необязательная зависимость: без него BatchSampler выбрасывает ImportError.
+"""
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - зависит от окружения
+    np = None
+
+from cfg_grammar import alias_table
+
+
+class BatchSampler:
+    """
+    Пакетный генератор строк для объекта CFG.
+
+    Каждый вывод разворачивается в глубину слева направо, как в CFG._derive:
+    продукция нетерминала выбирается среди тех, что могут завершиться за
+    оставшуюся глубину и после выбора оставляют минимально возможную ширину
+    строки в пределах max_length. Если допустимы все продукции, выбор делается
+    по таблицам псевдонимов Уокера (равновероятно или по весам); иначе -
+    пропорционально весам среди допустимых. Варианты берутся из тех же таблиц
+    CFG._derivation_plans, что и у скалярного генератора.
+
+    Атрибуты
+    ----------
+        cfg (CFG): Объект грамматики.
+    """
+
+    def __init__(self, cfg):
+        """
+        Параметры
+        ----------
+            cfg (CFG): Объект грамматики.
+
+        Исключения
+        ----------
+            ImportError: Если NumPy не установлен.
+        """
+        if np is None:
+            raise ImportError('Для пакетной генерации требуется NumPy (pip install numpy).')
+        self.cfg = cfg
+        self._key = None
+
+    def _compile(self):
+        """
+        Строит массивы для текущих грамматики и max_depth.
+        """
+        cfg = self.cfg
+        key = (cfg.grammar, cfg.max_depth)
+        if self._key == key:
+            return
+        table, choices = cfg._derivation_plans()
+        plan_pids = cfg._plan_pids
+        grammar = cfg.grammar
+        max_depth = cfg.max_depth
+        n_symbols = len(grammar.symbols)
+        productions = grammar.productions
+
+        self._table = table
+        self._is_terminal = np.array(grammar.is_terminal, dtype=bool)
+        rhs_len = np.array([len(p.rhs) for p in productions], dtype=np.int64)
+        self._rhs_len = rhs_len
+        self._rhs_start = np.concatenate(([0], np.cumsum(rhs_len)[:-1])).astype(np.int64)
+        self._rhs_flat = np.array([sym for p in productions for sym in p.rhs], dtype=np.int32)
+        # Наибольшая глубина стека: по одному незавершенному хвосту правой части на уровень
+        self._stack_size = 1 + max_depth * max(int(rhs_len.max()) - 1, 0) if len(rhs_len) else 1
+
+        # Для каждой оставшейся глубины - варианты нетерминалов (CSR по слотам)
+        offsets = np.zeros((max_depth + 1, n_symbols), dtype=np.int64)
+        counts = np.zeros((max_depth + 1, n_symbols), dtype=np.int64)
+        max_extra = np.zeros((max_depth + 1, n_symbols), dtype=np.int64)
+        slot_pid = []
+        slot_extra = []
+        slot_weight = []
+        prob = []
+        alias = []
+        for budget in range(max_depth + 1):
+            for nt, (plans, extras, level_max, _) in choices[budget].items():
+                pids = plan_pids[budget][nt]
+                offset = len(slot_pid)
+                offsets[budget, nt] = offset
+                counts[budget, nt] = len(pids)
+                max_extra[budget, nt] = level_max
+                weights = [productions[pid].weight for pid in pids]
+                level_prob, level_alias = alias_table(weights)
+                prob.extend(level_prob)
+                alias.extend(offset + i for i in level_alias)
+                slot_pid.extend(pids)
+                slot_extra.extend(extras)
+                slot_weight.extend(weights)
+        self._offsets = offsets
+        self._counts = counts
+        self._max_extra = max_extra
+        self._slot_pid = np.array(slot_pid, dtype=np.int64)
+        self._slot_extra = np.array(slot_extra, dtype=np.int64)
+        self._slot_weight = np.array(slot_weight, dtype=np.float64)
+        self._alias_prob = np.array(prob, dtype=np.float64)
+        self._alias_slot = np.array(alias, dtype=np.int64)
+        self._weighted = grammar.weighted
+        self._key = key
+
+    def sample(self, n, seed=None, chunk_size=4096):
+        """
+        Генерирует ``n`` строк.
+
+        Параметры
+        ----------
+            n (int): Количество строк.
+            seed (int): Начальное значение генератора; None - случайное (по умолчанию None).
+            chunk_size (int): Количество выводов, разворачиваемых синхронно (по умолчанию 4096).
+
+        Возвращает
+        ----------
+            list: Строки без символа окончания.
+
+        Исключения
+        ----------
+            ValueError: Если из стартового символа нельзя вывести строку в пределах max_depth и max_length.
+        """
+        self._compile()
+        cfg = self.cfg
+        start = cfg.grammar.start
+        if self._table[cfg.max_depth][start] > cfg.max_length:
+            raise ValueError(f'Из символа {cfg.start_variable!r} нельзя вывести строку '
+                             f'глубиной до {cfg.max_depth} и длиной меньше {cfg.max_length}.')
+        rng = np.random.default_rng(seed)
+        result = []
+        while len(result) < n:
+            size = min(chunk_size, n - len(result))
+            result.extend(self._sample_chunk(size, rng))
+        return result
+
+    def _sample_chunk(self, size, rng):
+        """
+        Разворачивает ``size`` выводов синхронно.
+        """
+        cfg = self.cfg
+        max_depth = cfg.max_depth
+        limit = cfg.max_length
+        start = cfg.grammar.start
+        is_terminal = self._is_terminal
+        offsets = self._offsets
+        counts = self._counts
+        max_extra = self._max_extra
+        slot_pid = self._slot_pid
+        slot_extra = self._slot_extra
+        slot_weight = self._slot_weight
+        rhs_len = self._rhs_len
+        rhs_start = self._rhs_start
+        rhs_flat = self._rhs_flat
+
+        stack_sym = np.empty((size, self._stack_size), dtype=np.int32)
+        stack_budget = np.empty((size, self._stack_size), dtype=np.int64)
+        stack_sym[:, 0] = start
+        stack_budget[:, 0] = max_depth
+        top = np.ones(size, dtype=np.int64)
+        # Каждый терминал занимает не меньше единицы ширины, поэтому токенов не больше limit
+        out = np.empty((size, max(int(limit), 1)), dtype=np.int32)
+        out_len = np.zeros(size, dtype=np.int64)
+        # reserve - как в CFG._derive: гарантированная минимальная ширина строки
+        reserve = np.full(size, self._table[max_depth][start], dtype=np.int64)
+
+        rows = np.arange(size)
+        while len(rows):
+            top[rows] -= 1
+            positions = top[rows]
+            syms = stack_sym[rows, positions]
+            terminal = is_terminal[syms]
+
+            done = rows[terminal]
+            if len(done):
+                out[done, out_len[done]] = syms[terminal]
+                out_len[done] += 1
+
+            nonterminal = ~terminal
+            expand = rows[nonterminal]
+            if len(expand):
+                syms = syms[nonterminal]
+                budgets = stack_budget[expand, positions[nonterminal]]
+                offset = offsets[budgets, syms]
+                count = counts[budgets, syms]
+                slack = limit - reserve[expand]
+
+                # Все продукции допустимы: выбор по таблице псевдонимов
+                slots = offset + (rng.random(len(expand)) * count).astype(np.int64)
+                if self._weighted:
+                    keep = rng.random(len(expand)) < self._alias_prob[slots]
+                    slots = np.where(keep, slots, self._alias_slot[slots])
+
+                # Часть продукций не укладывается в max_length: выбор среди допустимых
+                tight = np.flatnonzero(max_extra[budgets, syms] > slack)
+                if len(tight):
+                    width = int(count[tight].max())
+                    columns = np.arange(width)
+                    valid = columns < count[tight, None]
+                    candidates = np.where(valid, offset[tight, None] + columns, 0)
+                    feasible = valid & (slot_extra[candidates] <= slack[tight, None])
+                    cumulative = np.cumsum(np.where(feasible, slot_weight[candidates], 0.0), axis=1)
+                    r = rng.random(len(tight)) * cumulative[:, -1]
+                    index = np.minimum((cumulative <= r[:, None]).sum(axis=1), width - 1)
+                    slots[tight] = offset[tight] + index
+
+                reserve[expand] += slot_extra[slots]
+                pids = slot_pid[slots]
+
+                # Правая часть кладется на стек в обратном порядке
+                child_len = rhs_len[pids]
+                total = int(child_len.sum())
+                if total:
+                    child_offsets = np.cumsum(child_len) - child_len
+                    within = np.arange(total, dtype=np.int64) - np.repeat(child_offsets, child_len)
+                    targets = np.repeat(expand, child_len)
+                    columns = np.repeat(top[expand], child_len) + within
+                    stack_sym[targets, columns] = rhs_flat[np.repeat(rhs_start[pids] + child_len - 1, child_len) - within]
+                    stack_budget[targets, columns] = np.repeat(budgets - 1, child_len)
+                    top[expand] += child_len
+
+            rows = rows[top[rows] > 0]
+
+        symbols = cfg.grammar.symbols
+        lengths = out_len.tolist()
+        return [' '.join([symbols[sym] for sym in row[:length]])
+                for row, length in zip(out.tolist(), lengths)]
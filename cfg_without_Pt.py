@@ -2,12 +2,8 @@ import random
 import logging
 import time
 
-# Настройка логирования
-logging.basicConfig(
-    filename='cfg_generations.log',  # Файл для логов
-    level=logging.INFO,              # Уровень логирования
-    format='%(asctime)s - %(levelname)s - %(message)s'  # Формат сообщений
-)
+from cfg_lexer import CHAR, Lexer
+from cfg_logging import logger
 
 class CFG:
     def __init__(self, rules_file, max_depth=10):
@@ -18,10 +14,11 @@ class CFG:
         self.terminals = {'a', 'b'}
         self.brackets = {'(', ')'}
         self.variables = set(self.rules.keys())
+        self.lexer = Lexer(self.terminals | self.operators | self.brackets, unit=CHAR)  # Токенизатор по символам
         self.generate_counter = 0
         self.generation_steps = 0  # Подсчет шагов для генерации
         self.validation_steps = 0  # Подсчет шагов для валидации
-        logging.info('CFG initialized with rules from %s', rules_file)
+        logger.info('CFG initialized with rules from %s', rules_file)
 
     def load_rules(self, rules_file):
         rules = {}
@@ -32,7 +29,7 @@ class CFG:
                     non_terminal = left.strip()
                     transformations = [r.strip() for r in right.split('|')]
                     rules[non_terminal] = transformations
-        logging.info('Loaded rules: %s', rules)
+        logger.info('Loaded rules: %s', rules)
         return rules
 
     def generate(self, symbol=None, depth=0):
@@ -45,21 +42,21 @@ class CFG:
         while True:  
             single_gen_start_time = time.time()  # Время начала генерации одной строки
             self.generate_counter += 1
-            logging.info('Generate attempt: %d', self.generate_counter)
+            logger.info('Generate attempt: %d', self.generate_counter)
             result = self._generate_recursive(symbol, depth)
             single_gen_end_time = time.time()  # Время окончания генерации одной строки
 
             # Логирование времени генерации одной строки и шагов
-            logging.info('Time taken for counter %d: %.6f seconds, Steps: %d', 
+            logger.info('Time taken for counter %d: %.6f seconds, Steps: %d', 
                          self.generate_counter, single_gen_end_time - single_gen_start_time, self.generation_steps)
 
             if len(result) < 10:
-                logging.info('Generated valid string: %s', result)
+                logger.info('Generated valid string: %s', result)
                 total_gen_time = time.time() - start_time  # Время окончания генерации всех строк
-                logging.info('Total time taken for all counters: %.6f seconds', total_gen_time)
+                logger.info('Total time taken for all counters: %.6f seconds', total_gen_time)
                 return result, self.generate_counter, total_gen_time, self.generation_steps  # Если строка меньше 10 символов, возвращаем её
             else:
-                logging.warning('Generated string is too long (%d characters): %s', len(result), result)
+                logger.warning('Generated string is too long (%d characters): %s', len(result), result)
 
     def _generate_recursive(self, symbol, depth):
         self.generation_steps += 1  # Увеличение счетчика шагов генерации
@@ -85,42 +82,57 @@ class CFG:
     def is_valid_string(self, string):
         self.validation_steps = 0  # Обнуление счетчика шагов для валидации
         start_time = time.time()  # Время начала проверки строки
-        valid = self._match(self.start_variable, string, max_depth=len(string) + 10)
+        tokens = self.lexer.split(string)  # Проверка идет по массиву токенов, а не по подстрокам
+        self._memo = {}  # Результаты по (символ/продукция, позиция, границы, глубина)
+        valid = self._match(self.start_variable, tokens, 0, len(tokens), max_depth=len(tokens) + 10)
         end_time = time.time()  # Время окончания проверки строки
-        logging.info('Checking validity of string: %s - %s', string, valid)
-        logging.info('Time taken for validation: %.6f seconds, Steps: %d', end_time - start_time, self.validation_steps)
+        logger.info('Checking validity of string: %s - %s', string, valid)
+        logger.info('Time taken for validation: %.6f seconds, Steps: %d', end_time - start_time, self.validation_steps)
         return valid
 
-    def _match(self, variable, string, max_depth):
+    def _match(self, variable, tokens, start, end, max_depth):
+        # Проверяет, выводится ли tokens[start:end] из variable (без копирования среза)
+        key = (variable, start, end, max_depth)
+        if key in self._memo:
+            return self._memo[key]
         self.validation_steps += 1  # Увеличение счетчика шагов валидации
         if max_depth <= 0:
             return False
             
         if variable not in self.rules:
-            return variable == string
+            return end - start == 1 and tokens[start] == variable
 
+        result = False
         for production in self.rules[variable]:
-            if self._match_production(production, string, max_depth - 1):
-                return True
-        return False
-
-    def _match_production(self, production, string, max_depth):
+            if self._match_production(production, 0, tokens, start, end, max_depth - 1):
+                result = True
+                break
+        self._memo[key] = result
+        return result
+
+    def _match_production(self, production, position, tokens, start, end, max_depth):
+        # Проверяет, выводится ли tokens[start:end] из production[position:]
+        key = (production, position, start, end, max_depth)
+        if key in self._memo:
+            return self._memo[key]
         self.validation_steps += 1  # Увеличение счетчика шагов валидации
-        if not production and not string:
+        if position == len(production) and start == end:
             return True
-        if not production or not string:
+        if position == len(production) or start == end:
             return False
 
-        first_symbol = production[0]
+        result = False
+        first_symbol = production[position]
         if first_symbol in self.variables:
-            for i in range(1, len(string) + 1):
-                if self._match(first_symbol, string[:i], max_depth - 1) and self._match_production(production[1:], string[i:], max_depth - 1):
-                    return True
+            for i in range(start + 1, end + 1):
+                if self._match(first_symbol, tokens, start, i, max_depth - 1) and self._match_production(production, position + 1, tokens, i, end, max_depth - 1):
+                    result = True
+                    break
         else:
-            if string.startswith(first_symbol):
-                return self._match_production(production[1:], string[len(first_symbol):], max_depth - 1)
-        
-        return False
+            if tokens[start] == first_symbol:
+                result = self._match_production(production, position + 1, tokens, start + 1, end, max_depth - 1)
+        self._memo[key] = result
+        return result
 
     def __str__(self):
         print_lines = []
@@ -131,16 +143,24 @@ class CFG:
         return "\n".join(print_lines)
 
 
-cfg = CFG('rules/without_G_Pt.txt', max_depth=10)
-generated_string, counter, total_time, generation_steps = cfg.generate()
-print(f"Generated string: {generated_string}\nCounter: {counter}\nTotal generation time: {total_time:.6f} seconds\nSteps for generation: {generation_steps}")
+if __name__ == '__main__':
+    # Настройка логирования
+    logging.basicConfig(
+        filename='cfg_generations.log',  # Файл для логов
+        level=logging.INFO,              # Уровень логирования
+        format='%(asctime)s - %(levelname)s - %(message)s'  # Формат сообщений
+    )
+
+    cfg = CFG('rules/without_G_Pt.txt', max_depth=10)
+    generated_string, counter, total_time, generation_steps = cfg.generate()
+    print(f"Generated string: {generated_string}\nCounter: {counter}\nTotal generation time: {total_time:.6f} seconds\nSteps for generation: {generation_steps}")
 
-start_valid_time = time.time()
-valid = cfg.is_valid_string(generated_string)
-end_valid_time = time.time()
-print(f"Validation time: {end_valid_time - start_valid_time:.6f} seconds\nValidation steps: {cfg.validation_steps}")
+    start_valid_time = time.time()
+    valid = cfg.is_valid_string(generated_string)
+    end_valid_time = time.time()
+    print(f"Validation time: {end_valid_time - start_valid_time:.6f} seconds\nValidation steps: {cfg.validation_steps}")
 
-if valid:
-    print("The generated string is valid according to the grammar.")
-else:
-    print("The generated string is not valid.")
+    if valid:
+        print("The generated string is valid according to the grammar.")
+    else:
+        print("The generated string is not valid.")
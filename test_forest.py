@@ -0,0 +1,72 @@
+"""
+Регрессионные тесты леса разбора (cfg_forest) на длинных входах.
+
+Запуск: ``python -m unittest test_forest`` или ``python -m pytest test_forest.py``.
+"""
+
+import os
+import unittest
+
+from cfg_forest import format_tree
+from cfg_full import CFG
+from cfg_grammar import compile_grammar
+
+RULES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rules')
+
+
+class LongChainTest(unittest.TestCase):
+    """
+    Деревья глубже предела рекурсии Python строятся и перечисляются без RecursionError.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.math = CFG(os.path.join(RULES, 'math_cfg.txt'), cache=False)
+
+    def assert_single_tree(self, forest):
+        self.assertIsNotNone(forest)
+        self.assertEqual(forest.count(), 1)
+        trees = list(forest.trees())
+        self.assertEqual(len(trees), 1)
+        self.assertEqual(trees[0], forest.first_tree())
+        return trees[0]
+
+    def test_long_sum(self):
+        string = ' + '.join(['1'] * 400) + '.'
+        tree = self.assert_single_tree(self.math.parse(string))
+        self.assertEqual(format_tree(tree).count('(E '), 400)
+
+    def test_deep_parentheses(self):
+        string = '( ' * 300 + '1' + ' )' * 300 + '.'
+        tree = self.assert_single_tree(self.math.parse(string))
+        self.assertEqual(format_tree(tree).count('(F ( '), 300)
+
+    def test_long_chain_in_cyclic_forest(self):
+        # Цепная продукция S -> S делает лес циклическим: перебор идет с проверкой предков
+        grammar = compile_grammar({'S': ['S', 'A'], 'A': ['a A', 'a']}, 'S', {'a'})
+        cfg = CFG.from_grammar(grammar)
+        forest = cfg.parse(' '.join(['a'] * 2000) + '.')
+        trees = list(forest.trees())
+        self.assertTrue(forest.cyclic)
+        self.assertEqual(len(trees), 1)
+        # Сравнение вложенных кортежей такой глубины само рекурсивно - сравниваем записи
+        self.assertEqual(format_tree(trees[0]), format_tree(forest.first_tree()))
+        self.assertEqual(format_tree(trees[0]).count('(A a'), 2000)
+
+
+class EnumerationTest(unittest.TestCase):
+    """
+    Перебор деревьев неоднозначной грамматики.
+    """
+
+    def test_catalan(self):
+        grammar = compile_grammar({'E': ['E + E', 'a']}, 'E', {'a', '+'})
+        forest = CFG.from_grammar(grammar).parse(' + '.join(['a'] * 6) + '.')
+        trees = list(forest.trees())
+        self.assertEqual(forest.count(), 42)
+        self.assertEqual(len(set(trees)), 42)
+        self.assertEqual(trees[0], forest.first_tree())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+"""
+Тесты потокового распознавателя (IncrementalRecognizer) с многословными терминалами.
+
+Запуск: ``python -m unittest test_recognizer`` или ``python -m pytest test_recognizer.py``.
+"""
+
+import os
+import unittest
+
+from cfg_full import CFG
+from cfg_grammar import compile_grammar
+
+RULES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rules')
+
+
+class MultiwordStreamTest(unittest.TestCase):
+    """
+    Слова, подаваемые по одному, принимаются так же, как в is_valid_string.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.instructions = CFG(os.path.join(RULES, 'gen_instructions.txt'), cache=False)
+
+    def test_word_by_word(self):
+        cfg = self.instructions
+        self.assertTrue(cfg.is_valid_string('возьми книгу на стол.'))
+        recognizer = cfg.recognizer()
+        for word in ['возьми', 'книгу', 'на']:
+            self.assertIn(word, recognizer.expected())
+            self.assertTrue(recognizer.feed(word))
+        self.assertFalse(recognizer.complete)
+        self.assertEqual(recognizer.expected(), ['стол'])
+        self.assertTrue(recognizer.feed('стол'))
+        self.assertTrue(recognizer.complete)
+        self.assertEqual(recognizer.position, 4)
+
+    def test_whole_terminal(self):
+        recognizer = self.instructions.recognizer()
+        self.assertTrue(recognizer.feed_all(['возьми', 'книгу', 'на стол']))
+        self.assertTrue(recognizer.complete)
+
+    def test_overlapping_terminals(self):
+        # "в ящик" - терминал, но предложение выводится только как "в | ящик | лежит"
+        grammar = compile_grammar({'S': ['P Q лежит', 'P Q', 'в ящик'], 'P': ['в'], 'Q': ['ящик']},
+                                  'S', {'в', 'ящик', 'лежит', 'в ящик'})
+        cfg = CFG.from_grammar(grammar)
+        recognizer = cfg.recognizer()
+        self.assertTrue(recognizer.feed_all(['в', 'ящик']))
+        self.assertTrue(recognizer.complete)
+        self.assertEqual(recognizer.expected(), ['лежит'])
+        self.assertTrue(recognizer.feed('лежит'))
+        self.assertTrue(recognizer.complete)
+        self.assertTrue(cfg.is_valid_string('в ящик лежит.'))
+
+    def test_rejects_unknown_word(self):
+        recognizer = self.instructions.recognizer()
+        self.assertFalse(recognizer.feed('стол'))
+        self.assertFalse(recognizer.viable)
+        self.assertEqual(recognizer.expected(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
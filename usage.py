@@ -1,19 +1,26 @@
-from cfg_full import CFG	
+from cfg_registry import GrammarRegistry
+from cfg_logging import configure_logging
 import time
 
-#TODO: Переделать под использование всех правил из папки rules
+configure_logging('cfg_generations.log')
 
-cfg = CFG('rules/with_G_Pt.txt', max_depth=10) #! ALERT: я устал
-generated_string, counter, total_time, generation_steps = cfg.generate() #* hehe
-print(f"Generated string: {generated_string}\nCounter: {counter}\nTotal generation time: {total_time:.6f} seconds\nSteps for generation: {generation_steps}")
+registry = GrammarRegistry('rules', max_depth=10) #! ALERT: я устал
+errors = registry.warm()
 
-start_valid_time = time.time() # ? как-будто лучше использовать timeit вместо time
-valid = cfg.is_valid_string(generated_string)
-end_valid_time = time.time()
-print(f"Validation time: {end_valid_time - start_valid_time:.6f} seconds\nValidation steps: {cfg.validation_steps}")
+for name in registry.names():
+    if name in errors:
+        print(f"\n[{name}] skipped: {errors[name]}")
+        continue
+    cfg = registry[name]
+    generated_string, counter, total_time, generation_steps = cfg.generate() #* hehe
+    print(f"\n[{name}]\nGenerated string: {generated_string}\nCounter: {counter}\nTotal generation time: {total_time:.6f} seconds\nSteps for generation: {generation_steps}")
 
-if valid:
-    print("The generated string is valid according to the grammar.")
-else:
-    print("The generated string is not valid.")
-    
\ No newline at end of file
+    start_valid_time = time.time() # ? как-будто лучше использовать timeit вместо time
+    valid = cfg.is_valid_string(generated_string)
+    end_valid_time = time.time()
+    print(f"Validation time: {end_valid_time - start_valid_time:.6f} seconds\nValidation steps: {cfg.validation_steps}")
+
+    if valid:
+        print("The generated string is valid according to the grammar.")
+    else:
+        print("The generated string is not valid.")